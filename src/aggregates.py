@@ -0,0 +1,157 @@
+import pandas as pd
+from storage import iter_events
+from rollups import MAX_PENDING_PARTS, RollupCube
+
+# Các cột cần cho ba aggregate cơ bản và rollup theo giờ
+AGGREGATE_COLUMNS = ['session_id', 'page_url', 'timestamp', 'event_type', 'event_duration']
+COUNT_SERIES = ('daily_counts', 'page_counts', 'session_sums', 'session_counts')
+
+
+def count_values(values):
+    """
+    Count occurrences in order of first appearance, without sorting.
+    Works the same for object, string and categorical columns.
+    """
+    counts = values.value_counts(sort=False)
+    if isinstance(counts.index, pd.CategoricalIndex):
+        counts = counts[counts > 0]
+        counts.index = counts.index.astype(str)
+        counts = counts.reindex(values.unique().astype(str))
+    return counts
+
+
+def top_n(counts, n):
+    """Sort counts the way Series.value_counts does and keep the first n"""
+    return counts.sort_values(ascending=False, kind='stable').head(n)
+
+
+def _sum_counts(series):
+    """Add count Series in one concat + groupby, keeping first-appearance order of the keys"""
+    series = [s for s in series if not s.empty]
+    if not series:
+        return pd.Series(dtype='int64')
+    if len(series) == 1:
+        return series[0]
+    return pd.concat(series).groupby(level=0, sort=False).sum()
+
+
+def _counts_property(name):
+    def get(self):
+        self.compact()
+        return self._counts[name]
+
+    def set(self, value):
+        self.compact()
+        self._counts[name] = value
+
+    return property(get, set)
+
+
+class PartialAggregates:
+    """
+    Mergeable partial results for daily visits, top pages and session duration.
+
+    Each chunk only contributes per-day counts, per-page counts,
+    per-session (sum, count) of event_duration and hourly rollup buckets,
+    so memory is bounded by the number of days/pages/sessions/buckets
+    instead of the number of events. Chunk results are kept as pending
+    parts and summed in batches of MAX_PENDING_PARTS, so each chunk does
+    not re-index everything accumulated so far.
+    """
+
+    daily_counts = _counts_property('daily_counts')
+    page_counts = _counts_property('page_counts')
+    session_sums = _counts_property('session_sums')
+    session_counts = _counts_property('session_counts')
+
+    def __init__(self):
+        self._counts = {name: pd.Series(dtype='int64') for name in COUNT_SERIES}
+        self._pending = []
+        self.rollups = RollupCube()
+        self.rows = 0
+
+    def _add_part(self, counts):
+        self._pending.append(counts)
+        if len(self._pending) > MAX_PENDING_PARTS:
+            self.compact()
+
+    def update(self, chunk):
+        """Fold one chunk of events into the partial aggregates"""
+        if chunk.empty:
+            return self
+        daily = chunk.groupby(chunk['timestamp'].dt.date).size()
+        daily.index = daily.index.map(str)
+
+        # int64 để tổng duration không bị tràn khi cột đã được downcast
+        durations = chunk['event_duration'].astype('int64')
+        sessions = durations.groupby(chunk['session_id'], observed=True).agg(['sum', 'count'])
+        if isinstance(sessions.index, pd.CategoricalIndex):
+            sessions.index = sessions.index.astype(str)
+
+        self._add_part({
+            'daily_counts': daily,
+            'page_counts': count_values(chunk['page_url']),
+            'session_sums': sessions['sum'],
+            'session_counts': sessions['count'],
+        })
+        self.rollups.update(chunk)
+        self.rows += len(chunk)
+        return self
+
+    def merge(self, other):
+        """Merge another PartialAggregates (e.g. from a later chunk or file) into this one"""
+        other.compact()
+        self._add_part(dict(other._counts))
+        self.rollups.merge(other.rollups)
+        self.rows += other.rows
+        return self
+
+    def compact(self):
+        """Sum the pending chunk parts into the accumulated counts"""
+        if self._pending:
+            parts = [self._counts] + self._pending
+            self._pending = []
+            self._counts = {name: _sum_counts(part[name] for part in parts) for name in COUNT_SERIES}
+        return self
+
+    @classmethod
+    def combine(cls, parts):
+        """
+        Merge many partial results in one pass (concat + groupby), keeping
+        first-appearance order of pages across the parts
+        """
+        parts = [part.compact() for part in parts]
+        combined = cls()
+        if not parts:
+            return combined
+        combined._counts = {name: _sum_counts(p._counts[name] for p in parts) for name in COUNT_SERIES}
+        combined.rollups = RollupCube.combine(p.rollups for p in parts)
+        combined.rows = sum(p.rows for p in parts)
+        return combined
+
+    def daily_visits(self):
+        daily_visits = self.daily_counts.sort_index().astype('int64')
+        daily_visits.index.name = 'timestamp'
+        return daily_visits
+
+    def top_pages(self, n=5):
+        top_pages = top_n(self.page_counts.astype('int64'), n)
+        top_pages.index.name = 'page_url'
+        top_pages.name = 'count'
+        return top_pages
+
+    def avg_session_duration(self):
+        sums = self.session_sums.sort_index()
+        counts = self.session_counts.reindex(sums.index)
+        session_durations = sums.astype('float64') / counts
+        session_durations.index.name = 'session_id'
+        session_durations.name = 'event_duration'
+        return session_durations
+
+
+def aggregate_file(path, chunksize):
+    """Stream a single event file in chunks of `chunksize` rows"""
+    partials = PartialAggregates()
+    for chunk in iter_events(path, columns=AGGREGATE_COLUMNS, chunksize=chunksize):
+        partials.update(chunk)
+    return partials.compact()
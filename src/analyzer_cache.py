@@ -0,0 +1,127 @@
+import os
+import threading
+from concurrent.futures import Future
+from data_analysis import DataAnalyzer
+from storage import dataset_version
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.analyzer = None
+        # key -> Future: kết quả đã tính hoặc đang được một thread khác tính
+        self.results = {}
+
+
+class AnalyzerRegistry:
+    """
+    Process-wide cache of DataAnalyzer instances.
+
+    Each dataset is loaded once and reloaded only when its file changes.
+    Aggregates are cached per dataset version, so cached results must be
+    treated as read-only by callers. They are computed outside the dataset
+    lock: a slow aggregate only blocks callers waiting for the same key.
+    """
+
+    def __init__(self, analyzer_factory=DataAnalyzer, **analyzer_options):
+        self._factory = analyzer_factory
+        self._options = analyzer_options
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._counters = {'hits': 0, 'misses': 0, 'loads': 0, 'reloads': 0}
+
+    def _entry(self, path):
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            return entry
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _refresh(self, entry, path):
+        """Reload the analyzer if the file changed. Caller holds entry.lock."""
+        version = dataset_version(path)
+        if entry.analyzer is not None and entry.version == version:
+            return
+        self._count('loads' if entry.analyzer is None else 'reloads')
+        # Stat trước khi đọc: nếu file đổi trong lúc đọc, lần sau sẽ reload
+        entry.analyzer = self._factory(path, **self._options)
+        entry.version = version
+        entry.results = {}
+
+    def get(self, path):
+        """Return an up-to-date analyzer for the dataset"""
+        entry = self._entry(path)
+        with entry.lock:
+            self._refresh(entry, path)
+            return entry.analyzer
+
+    def snapshot(self, path):
+        """Return (analyzer, version) read atomically"""
+        entry = self._entry(path)
+        with entry.lock:
+            self._refresh(entry, path)
+            return entry.analyzer, entry.version
+
+    def version(self, path):
+        """Return the version of the dataset currently held in the cache"""
+        entry = self._entry(path)
+        with entry.lock:
+            self._refresh(entry, path)
+            return entry.version
+
+    def aggregate(self, path, name, *args, **kwargs):
+        """
+        Return analyzer.<name>(*args, **kwargs), computed at most once
+        per dataset version. Concurrent callers for the same key wait for
+        the first one; a failed computation is not cached.
+        """
+        entry = self._entry(path)
+        key = (name, args, tuple(sorted(kwargs.items())))
+        with entry.lock:
+            self._refresh(entry, path)
+            analyzer = entry.analyzer
+            future = entry.results.get(key)
+            owner = future is None
+            if owner:
+                future = entry.results[key] = Future()
+        self._count('misses' if owner else 'hits')
+        if not owner:
+            return future.result()
+
+        try:
+            result = getattr(analyzer, name)(*args, **kwargs)
+        except BaseException as e:
+            with entry.lock:
+                if entry.results.get(key) is future:
+                    del entry.results[key]
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        """Return hit/miss/load/reload counters and the cached datasets"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['datasets'] = sorted(self._entries)
+        return stats
+
+    def configure(self, **analyzer_options):
+        """Set the options passed to every new analyzer and drop cached datasets"""
+        with self._lock:
+            self._options = analyzer_options
+            self._entries = {}
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+# Registry dùng chung cho cả process
+registry = AnalyzerRegistry()
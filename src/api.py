@@ -1,60 +1,623 @@
-from flask import Flask, jsonify, send_file, make_response
+from flask import Flask, Response, g, jsonify, send_file, make_response, url_for, request
+from functools import wraps
 from io import BytesIO
-from data_analysis import DataAnalyzer
-from report_generator import ReportGenerator
+import time
+import pandas as pd
+from analyzer_cache import registry
+from cohorts import FREQUENCIES
+from charts import CHART_FORMATS, CHARTS, ChartRenderer
+from exports import EXPORT_FORMATS, analysis_tables, iter_file, remove_file, write_export
+from instrumentation import ENABLED as INSTRUMENTATION_ENABLED, SLOW_REQUEST_MS, dump_profile, metrics, start_profile
+from ga_store import store_from_env
+from live import MAX_BATCH_EVENTS, WINDOWS, LiveAggregator, parse_events
+from report_jobs import ReportJobManager, ReportTimeout, DONE, FAILED
+from rollups import GRANULARITIES, format_periods, hour_bound
+from responses import (
+    dataset_etag, decode_cursor, encode_cursor, etag_matches, json_response, loads, not_modified,
+    series_payload
+)
 from datetime import datetime
+import os
+import tempfile
+from dateutil.tz import tzlocal
 
 app = Flask(__name__)
 
+# File CSV/Parquet, thư mục partition hoặc glob (vd. data/events/*.csv)
+DATA_PATH = os.getenv('DATA_PATH', 'data/user_behavior.csv')
+
+# Snapshot GA cục bộ (GA_STORE_DIR), None nếu không cấu hình
+ga_store = store_from_env()
+
+# ANALYZER_INCREMENTAL=1: chỉ đọc thêm các dòng mới được append vào CSV (state lưu ở ANALYZER_STATE_DIR)
+registry.configure(
+    incremental=os.getenv('ANALYZER_INCREMENTAL', '0') == '1',
+    workers=int(os.environ['ANALYZER_WORKERS']) if os.getenv('ANALYZER_WORKERS') else None,
+    ga_store=ga_store,
+)
+
+# CHART_WORKERS > 0: render các biểu đồ song song trong process pool
+chart_renderer = ChartRenderer(workers=int(os.getenv('CHART_WORKERS', '2' if (os.cpu_count() or 1) > 1 else '0')))
+report_jobs = ReportJobManager(
+    registry, max_workers=int(os.getenv('REPORT_WORKERS', '1')), chart_renderer=chart_renderer
+)
+# /api/download-report chờ tối đa chừng này giây, sau đó trả 503 kèm job để theo dõi
+REPORT_TIMEOUT = float(os.getenv('REPORT_TIMEOUT', '60'))
+
+# Event realtime: ring buffer trong RAM + log append-only (LIVE_LOG_PATH, cùng schema CSV).
+# Buffer và thread ghi log chỉ được tạo khi có request /api/events đầu tiên
+live_events = LiveAggregator(
+    capacity=int(os.getenv('LIVE_BUFFER_SIZE', '100000')),
+    log_path=os.getenv('LIVE_LOG_PATH', 'data/live_events.csv') or None,
+    flush_rows=int(os.getenv('LIVE_FLUSH_ROWS', '10000')),
+    flush_interval=float(os.getenv('LIVE_FLUSH_SECONDS', '1')),
+)
+
+# Aggregate của dashboard được tính sẵn khi PREWARM=1
+PREWARM_AGGREGATES = ('get_daily_visits', 'get_top_pages', 'get_avg_session_duration')
+
+def prewarm(path=None):
+    """
+    Load the dataset snapshot and the dashboard aggregates into the registry
+    (with gunicorn --preload the forked workers share the warmed snapshot)
+    """
+    path = path or DATA_PATH
+    started = time.perf_counter()
+    for name in PREWARM_AGGREGATES:
+        registry.aggregate(path, name)
+    app.logger.info("Pre-warmed %s in %.2fs", path, time.perf_counter() - started)
+
+if os.getenv('PREWARM', '0') == '1':
+    prewarm()
+
+@app.before_request
+def _start_request():
+    g.request_started = time.perf_counter()
+    if INSTRUMENTATION_ENABLED and SLOW_REQUEST_MS is not None:
+        g.profiler = start_profile()
+
+@app.after_request
+def _record_request(response):
+    if not INSTRUMENTATION_ENABLED:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.inc('http_requests_total', (
+        ('method', request.method), ('route', route), ('status', response.status_code)
+    ))
+    metrics.observe('http_request_duration_seconds', (('route', route),),
+                    time.perf_counter() - g.request_started)
+    return response
+
+@app.teardown_request
+def _finish_profile(exc):
+    # teardown luôn chạy (kể cả khi có exception) nên profiler không bị bỏ ngỏ
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiler.disable()
+    elapsed_ms = (time.perf_counter() - g.request_started) * 1000
+    if elapsed_ms >= SLOW_REQUEST_MS:
+        dump_profile(profiler, f"{request.method}_{request.path}")
+
+# Giới hạn số phiên trả về mỗi trang
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+# Số chuyển trang tối đa của /api/transitions
+MAX_TRANSITIONS = 1000
+
+def dataset_json(view):
+    """
+    For routes whose output depends only on the dataset and the query string:
+    answer 304 when the client's ETag matches the current dataset version,
+    otherwise serialize the returned dict/list with compression and an ETag
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = dataset_etag(registry.version(DATA_PATH), request.full_path)
+        if etag_matches(etag):
+            return not_modified(etag)
+        result = view(*args, **kwargs)
+        if isinstance(result, (dict, list)):
+            return json_response(result, etag)
+        return result
+    return wrapper
+
+def _pdf_response(pdf_content):
+    # Tạo timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"analysis_report_{timestamp}.pdf"
+
+    # Tạo response với PDF content
+    buffer = BytesIO(pdf_content)
+    response = make_response(send_file(
+        buffer,
+        mimetype='application/pdf',
+        download_name=filename
+    ))
+
+    # Thêm headers
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+
+    return response
+
+def _parse_time(value, is_end=False):
+    """Query time -> naive server-local Timestamp (the clock the event log uses)"""
+    if not value:
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp is pd.NaT:
+        raise ValueError(f"Invalid time: {value}")
+    if timestamp.tzinfo is not None:
+        # Có múi giờ (Z, +07:00): đổi sang giờ địa phương của server
+        timestamp = timestamp.tz_convert(tzlocal()).tz_localize(None)
+    if is_end and len(value) <= 10:
+        # end chỉ có ngày (YYYY-MM-DD) thì tính cả ngày đó
+        timestamp += pd.Timedelta(days=1)
+    return timestamp
+
+def _rollup_query():
+    """
+    Read start/end/granularity/page query parameters (None if none are given).
+    start and end must be on the hour, since the rollups are hourly.
+    """
+    args = request.args
+    if not any(args.get(name) for name in ('start', 'end', 'granularity', 'page')):
+        return None
+    granularity = args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    query = {
+        'start': _parse_time(args.get('start')),
+        'end': _parse_time(args.get('end'), is_end=True),
+        'granularity': granularity,
+        'page': args.get('page') or None,
+    }
+    for name in ('start', 'end'):
+        if query[name] is not None:
+            hour_bound(query[name], name)
+    return query
+
 @app.route('/api/daily-visits', methods=['GET'])
+@dataset_json
 def get_daily_visits():
-    analyzer = DataAnalyzer('data/user_behavior.csv')
-    daily_visits = analyzer.get_daily_visits()
-    return jsonify(daily_visits.to_dict())
+    try:
+        query = _rollup_query()
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if query is None:
+        daily_visits = registry.aggregate(DATA_PATH, 'get_daily_visits')
+    else:
+        # Trả lời từ rollup theo giờ, không quét lại dữ liệu gốc
+        daily_visits = registry.get(DATA_PATH).get_visits(**query)
+    return series_payload(daily_visits)
+
+@app.route('/api/rollups', methods=['GET'])
+@dataset_json
+def get_rollups():
+    try:
+        query = _rollup_query() or {'granularity': 'day'}
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    cube = registry.aggregate(DATA_PATH, 'get_rollups')
+    result = cube.query(**query)
+    result.index = format_periods(result.index, query['granularity'])
+    return result.reset_index().to_dict(orient='records')
+
+def _approximate():
+    return request.args.get('approx') in ('1', 'true')
 
 @app.route('/api/top-pages', methods=['GET'])
+@dataset_json
 def get_top_pages():
-    analyzer = DataAnalyzer('data/user_behavior.csv')
-    top_pages = analyzer.get_top_pages()
-    return jsonify(top_pages.to_dict())
+    if _approximate():
+        summary = registry.aggregate(DATA_PATH, 'get_approximate_summary')
+        return summary['top_pages']
+    top_pages = registry.aggregate(DATA_PATH, 'get_top_pages')
+    return series_payload(top_pages)
+
+@app.route('/api/approximate-summary', methods=['GET'])
+@dataset_json
+def get_approximate_summary():
+    return registry.aggregate(DATA_PATH, 'get_approximate_summary')
+
+def _session_page_params():
+    """Pagination parameters (None when the client wants the legacy full dict)"""
+    args = request.args
+    if not any(args.get(name) for name in ('limit', 'offset', 'cursor', 'sort', 'order')):
+        return None
+    if args.get('cursor'):
+        params = decode_cursor(args['cursor'])
+        if params.get('version') != dataset_etag(registry.version(DATA_PATH)):
+            raise LookupError("Cursor expired: the dataset has changed")
+    else:
+        params = {
+            'offset': args.get('offset', 0, type=int),
+            'limit': args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            'sort': args.get('sort', 'session_id'),
+            'order': args.get('order', 'asc'),
+        }
+    if params['sort'] not in ('session_id', 'duration') or params['order'] not in ('asc', 'desc'):
+        raise ValueError("sort must be session_id|duration and order asc|desc")
+    params['offset'] = max(int(params['offset']), 0)
+    params['limit'] = min(max(int(params['limit']), 1), MAX_PAGE_SIZE)
+    return params
 
 @app.route('/api/avg-session-duration', methods=['GET'])
+@dataset_json
 def get_avg_session_duration():
-    analyzer = DataAnalyzer('data/user_behavior.csv')
-    avg_session_duration = analyzer.get_avg_session_duration()
-    return jsonify(avg_session_duration.to_dict())
+    if _approximate():
+        # Chỉ trả về phân bố (quantile) thay vì một giá trị cho mỗi phiên
+        summary = registry.aggregate(DATA_PATH, 'get_approximate_summary')
+        return summary['session_duration']
+    try:
+        params = _session_page_params()
+    except LookupError as e:
+        return {'error': str(e)}, 410
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if params is None:
+        avg_session_duration = registry.aggregate(DATA_PATH, 'get_avg_session_duration')
+        return series_payload(avg_session_duration)
+
+    durations = registry.aggregate(
+        DATA_PATH, 'get_sorted_session_durations',
+        by=params['sort'], ascending=params['order'] == 'asc'
+    )
+    offset, limit = params['offset'], params['limit']
+    page = durations.iloc[offset:offset + limit]
+    payload = {
+        'total': len(durations),
+        'offset': offset,
+        'limit': limit,
+        'sort': params['sort'],
+        'order': params['order'],
+        'items': [
+            {'session_id': session_id, 'duration': duration}
+            for session_id, duration in zip(page.index.tolist(), page.tolist())
+        ],
+        'next_cursor': None,
+    }
+    if offset + limit < len(durations):
+        payload['next_cursor'] = encode_cursor(dict(
+            params, offset=offset + limit, version=dataset_etag(registry.version(DATA_PATH))
+        ))
+    return payload
+
+def _path_options():
+    """session_gap for re-sessionizing; ValueError if it is not a positive duration"""
+    gap = request.args.get('session_gap') or None
+    if gap is not None:
+        try:
+            valid = pd.Timedelta(gap) > pd.Timedelta(0)
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError("session_gap must be a positive duration such as 30min or 1h")
+    return {'session_gap': gap}
+
+@app.route('/api/funnel', methods=['GET'])
+@dataset_json
+def get_funnel():
+    steps = request.args.get('steps')
+    try:
+        kwargs = _path_options()
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if steps:
+        kwargs['steps'] = tuple(step.strip() for step in steps.split(',') if step.strip())
+    funnel = registry.aggregate(DATA_PATH, 'get_funnel', **kwargs)
+    return funnel.to_dict(orient='records')
+
+@app.route('/api/transitions', methods=['GET'])
+@dataset_json
+def get_transitions():
+    k = request.args.get('k', 10, type=int)
+    if k < 1:
+        return {'error': 'k must be a positive integer'}, 400
+    k = min(k, MAX_TRANSITIONS)
+    try:
+        options = _path_options()
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    transitions = registry.aggregate(DATA_PATH, 'get_transitions', k=k, **options)
+    return transitions.to_dict(orient='records')
+
+@app.route('/api/next-pages', methods=['GET'])
+@dataset_json
+def get_next_pages():
+    page = request.args.get('page')
+    if not page:
+        return {'error': 'page is required'}, 400
+    try:
+        options = _path_options()
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    probabilities = registry.aggregate(DATA_PATH, 'get_next_page_probabilities', page=page, **options)
+    return series_payload(probabilities)
+
+@app.route('/api/entry-exit-pages', methods=['GET'])
+@dataset_json
+def get_entry_exit_pages():
+    try:
+        options = _path_options()
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    pages = registry.aggregate(DATA_PATH, 'get_entry_exit_pages', **options)
+    return pages.reset_index().to_dict(orient='records')
+
+def _cohort_freq():
+    freq = request.args.get('freq', 'day')
+    if freq not in FREQUENCIES:
+        raise ValueError(f"freq must be one of {', '.join(FREQUENCIES)}")
+    return freq
+
+@app.route('/api/retention', methods=['GET'])
+@dataset_json
+def get_retention():
+    """Cohort x period retention (freq=day|week, periods=N, normalize=1 for rates)"""
+    try:
+        freq = _cohort_freq()
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    periods = request.args.get('periods', type=int)
+    if periods is not None and periods < 0:
+        return {'error': 'periods must be a non-negative integer'}, 400
+    normalize = request.args.get('normalize') in ('1', 'true')
+    retention = registry.aggregate(
+        DATA_PATH, 'get_retention', freq=freq, max_periods=periods, normalize=normalize
+    )
+    sizes = registry.aggregate(DATA_PATH, 'get_retention', freq=freq, max_periods=0)
+    return {
+        'freq': freq,
+        'normalize': normalize,
+        'periods': retention.columns.tolist(),
+        'cohorts': [
+            {'cohort': cohort, 'users': users, 'values': values}
+            for cohort, users, values in zip(
+                retention.index.tolist(), sizes[0].tolist(), retention.to_numpy().tolist()
+            )
+        ],
+    }
+
+@app.route('/api/repeat-visits', methods=['GET'])
+@dataset_json
+def get_repeat_visits():
+    """Users by number of distinct active days/weeks"""
+    try:
+        freq = _cohort_freq()
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return series_payload(registry.aggregate(DATA_PATH, 'get_repeat_visits', freq=freq))
+
+@app.route('/api/user-summary', methods=['GET'])
+@dataset_json
+def get_user_summary():
+    return registry.aggregate(DATA_PATH, 'get_user_summary')
+
+@app.route('/api/users', methods=['GET'])
+@dataset_json
+def get_users():
+    """
+    Per-user activity, paginated (limit, offset) and sorted by user_id,
+    first_seen, last_seen, active_days, events, sessions or dwell_seconds
+    """
+    sort = request.args.get('sort', 'user_id')
+    order = request.args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        return {'error': 'order must be asc|desc'}, 400
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    try:
+        stats = registry.aggregate(DATA_PATH, 'get_user_stats', sort=sort, ascending=order == 'asc')
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    page = stats.iloc[offset:offset + limit]
+    return {
+        'total': len(stats),
+        'offset': offset,
+        'limit': limit,
+        'sort': sort,
+        'order': order,
+        'items': page.reset_index().to_dict(orient='records'),
+    }
+
+def _ga_view(method):
+    """
+    Serve DataAnalyzer.<method> over the GA snapshot store. The ETag covers
+    the event log and the GA store manifest and is checked before anything
+    is synced or computed; live=1 adds not yet settled days fetched from GA
+    and disables the ETag.
+    """
+    if ga_store is None:
+        return {'error': 'GA snapshot store is not configured (set GA_STORE_DIR)'}, 404
+    args = request.args
+    live = args.get('live') in ('1', 'true')
+    try:
+        start = _parse_time(args.get('start'))
+        end = _parse_time(args.get('end'))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    etag = None
+    if not live:
+        # ETag lấy từ manifest trước khi sync/tính toán: 304 không tốn gì.
+        # Part do lần sync này thêm vào sẽ làm ETag của request sau khác đi
+        etag = dataset_etag((registry.version(DATA_PATH), ga_store.version()), request.full_path)
+        if etag_matches(etag):
+            return not_modified(etag)
+    result = getattr(registry.get(DATA_PATH), method)(start, end, live=live)
+    # Ngày chỉ có ở một nguồn (outer join) trả về null thay vì NaN
+    result = result.astype(object).where(result.notna(), None)
+    return json_response(result.reset_index().to_dict(orient='records'), etag)
+
+@app.route('/api/ga-daily', methods=['GET'])
+def get_ga_daily():
+    return _ga_view('get_ga_daily')
+
+@app.route('/api/daily-overview', methods=['GET'])
+def get_daily_overview():
+    return _ga_view('get_daily_overview')
+
+@app.route('/api/events', methods=['POST'])
+def ingest_events():
+    """
+    Bulk ingestion: a JSON array of events (or {"events": [...]}) in the
+    EVENT_SCHEMA layout. Invalid events are rejected, the rest accepted.
+    """
+    try:
+        payload = loads(request.get_data())
+    except ValueError:
+        return {'error': 'Body must be JSON'}, 400
+    records = payload.get('events') if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        return {'error': 'Expected a list of event objects'}, 400
+    if len(records) > MAX_BATCH_EVENTS:
+        return {'error': f"At most {MAX_BATCH_EVENTS} events per request"}, 413
+    events, errors = parse_events(records)
+    accepted = live_events.ingest(events)
+    if accepted < len(events):
+        errors.append(f"{len(events) - accepted} events are too far in the future")
+    metrics.inc('live_events_accepted_total', (), accepted)
+    metrics.inc('live_events_rejected_total', (), len(records) - accepted)
+    return jsonify({'accepted': accepted, 'rejected': len(records) - accepted, 'errors': errors}), 202
+
+@app.route('/api/live', methods=['GET'])
+def get_live_summary():
+    """Aggregates of the ingested events over a sliding window (window=5m|1h|24h)"""
+    window = request.args.get('window', '5m')
+    if window not in WINDOWS:
+        return {'error': f"window must be one of {', '.join(WINDOWS)}"}, 400
+    n = request.args.get('n', 5, type=int)
+    return json_response(live_events.summary(window, n))
+
+@app.route('/api/live/events', methods=['GET'])
+def get_live_events():
+    """The most recent ingested events, newest first"""
+    limit = min(max(request.args.get('limit', 100, type=int), 0), MAX_PAGE_SIZE)
+    recent = live_events.recent(limit)
+    recent['timestamp'] = recent['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return json_response({'stats': live_events.stats(), 'items': recent.to_dict('records')})
 
 @app.route('/api/health', methods=['GET'])
 def get_health():
     return jsonify({"status": "okee"})
 
+@app.route('/api/memory-usage', methods=['GET'])
+def get_memory_usage():
+    return jsonify(registry.get(DATA_PATH).memory_usage())
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Stage timings, request metrics and cache counters in Prometheus text format"""
+    lines = [metrics.render()]
+    for name, value in registry.stats().items():
+        if isinstance(value, int):
+            lines.append(f"# TYPE analyzer_cache_{name}_total counter\nanalyzer_cache_{name}_total {value}\n")
+    return Response(''.join(lines), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    stats = registry.stats()
+    stats['charts'] = chart_renderer.stats()
+    return jsonify(stats)
+
+@app.route('/api/charts/<chart_type>', methods=['GET'])
+def get_chart(chart_type):
+    """A report chart as PNG or SVG (format=png|svg), cached per dataset version"""
+    fmt = request.args.get('format', 'png')
+    if chart_type not in CHARTS or fmt not in CHART_FORMATS:
+        return {'error': f"chart must be one of {', '.join(CHARTS)} and format one of {', '.join(CHART_FORMATS)}"}, 400
+    version = registry.version(DATA_PATH)
+    etag = dataset_etag(version, chart_type, fmt)
+    if etag_matches(etag):
+        return not_modified(etag)
+    data = registry.aggregate(DATA_PATH, 'get_' + chart_type)
+    image = chart_renderer.render({chart_type: data}, version=version, fmt=fmt, source=DATA_PATH)[chart_type]
+    response = Response(image, mimetype=CHART_FORMATS[fmt])
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/download-report', methods=['GET'])
 def download_report():
     try:
-        # Tạo timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"analysis_report_{timestamp}.pdf"
-        
-        # Tạo report
-        report_gen = ReportGenerator("data/user_behavior.csv")
-        pdf_content = report_gen.create_report()
-        
-        # Tạo response với PDF content
-        buffer = BytesIO(pdf_content)
-        response = make_response(send_file(
-            buffer,
-            mimetype='application/pdf',
-            download_name=filename
-        ))
-        
-        # Thêm headers
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        
+        # Dùng report đã cache nếu dữ liệu chưa đổi
+        pdf_content = report_jobs.build(DATA_PATH, timeout=REPORT_TIMEOUT)
+        return _pdf_response(pdf_content)
+    except ReportTimeout as e:
+        payload = e.job.to_dict()
+        payload['error'] = str(e)
+        payload['status_url'] = url_for('get_report_job', job_id=e.job.id)
+        payload['download_url'] = url_for('download_report_job', job_id=e.job.id)
+        response = jsonify(payload)
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
         return response
-        
     except Exception as e:
         return {'error': str(e)}, 500
 
+@app.route('/api/export', methods=['GET'])
+def download_export():
+    """
+    Stream the aggregates as .xlsx (format=xlsx, default) or as a zip of
+    CSV/Parquet files (format=csv|parquet). The file is written to a temp
+    file with a streaming writer, then sent in chunks and deleted when the
+    response is closed.
+    """
+    fmt = request.args.get('format', 'xlsx')
+    if fmt not in EXPORT_FORMATS:
+        return {'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}, 400
+    # Dùng lại aggregate đã cache theo version của dữ liệu
+    tables = analysis_tables(
+        registry.aggregate(DATA_PATH, 'get_daily_visits'),
+        registry.aggregate(DATA_PATH, 'get_top_pages'),
+        registry.aggregate(DATA_PATH, 'get_avg_session_duration'),
+    )
+    extension = 'xlsx' if fmt == 'xlsx' else 'zip'
+    fd, path = tempfile.mkstemp(suffix='.' + extension)
+    os.close(fd)
+    try:
+        write_export(tables, path, fmt)
+    except Exception:
+        remove_file(path)
+        raise
+    filename = f"analysis_{fmt}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    response = Response(iter_file(path), mimetype=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'Content-Length': str(os.path.getsize(path)),
+    })
+    # Xóa file tạm cả khi body không được đọc hết (HEAD, client ngắt kết nối)
+    response.call_on_close(lambda: remove_file(path))
+    return response
+
+@app.route('/api/reports', methods=['POST'])
+def create_report_job():
+    job = report_jobs.submit(DATA_PATH)
+    payload = job.to_dict()
+    payload['status_url'] = url_for('get_report_job', job_id=job.id)
+    payload['download_url'] = url_for('download_report_job', job_id=job.id)
+    return jsonify(payload), 202
+
+@app.route('/api/reports/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/reports/<job_id>/download', methods=['GET'])
+def download_report_job(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    if job.status == FAILED:
+        return {'error': job.error}, 500
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 409
+    pdf_content = report_jobs.result(job)
+    if pdf_content is None:
+        return {'error': 'Report expired from cache, please create a new job'}, 410
+    return _pdf_response(pdf_content)
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
\ No newline at end of file
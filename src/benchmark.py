@@ -0,0 +1,239 @@
+"""
+Benchmark storage reads, DataAnalyzer, the per-version aggregate cache,
+the API routes, exports and the PDF report on synthetic data of
+increasing size.
+
+    python src/benchmark.py --sizes 10000,100000,1000000 --formats csv,parquet --output bench.json
+
+Every stage is timed (best of --repeat runs) and its peak traced memory
+recorded; the results are written as JSON so runs can be compared.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from analyzer_cache import AnalyzerRegistry
+from data_analysis import DataAnalyzer
+from storage import read_events
+from utils.generate_mock_data import generate_mock_data, save_mock_data
+
+# Aggregate mà các route của dashboard đọc qua AnalyzerRegistry
+REGISTRY_AGGREGATES = [
+    ('get_daily_visits', {}),
+    ('get_top_pages', {}),
+    ('get_avg_session_duration', {}),
+    ('get_rollups', {}),
+    ('get_funnel', {}),
+    ('get_transitions', {}),
+    ('get_entry_exit_pages', {}),
+    ('get_retention', {'freq': 'week'}),
+    ('get_user_summary', {}),
+]
+API_ROUTES = [
+    '/api/daily-visits',
+    '/api/top-pages',
+    '/api/avg-session-duration',
+    '/api/avg-session-duration?limit=100&sort=duration&order=desc',
+    '/api/rollups?granularity=hour',
+    '/api/funnel',
+    '/api/transitions',
+    '/api/entry-exit-pages',
+    '/api/retention?freq=week',
+    '/api/user-summary',
+]
+# Client nhận nén như trình duyệt, để đo cả bước serialize + nén
+API_HEADERS = {'Accept-Encoding': 'br, gzip'}
+# Cố định thời điểm kết thúc để dữ liệu sinh ra giống nhau giữa các lần chạy
+DATA_END_TIME = '2025-04-01'
+
+
+def measure(func, repeat=1):
+    """
+    Run func `repeat` times; return (result, stats) with the best and median
+    wall time and the peak memory traced during the first run
+    """
+    timings = []
+    peak = None
+    result = None
+    for i in range(repeat):
+        gc.collect()
+        if i == 0:
+            tracemalloc.start()
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+        if i == 0:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result, {
+        'seconds': min(timings),
+        'median_seconds': float(np.median(timings)),
+        'peak_bytes': peak,
+    }
+
+
+def _record(results, context, stage, func, repeat):
+    """Measure one stage, recording its error instead of aborting the run"""
+    entry = dict(context, stage=stage)
+    try:
+        result, stats = measure(func, repeat)
+        entry.update(stats)
+    except Exception as e:
+        result = None
+        entry['error'] = f"{type(e).__name__}: {e}"
+    results.append(entry)
+    print(json.dumps(entry), file=sys.stderr)
+    return result
+
+
+def _load(path):
+    """DataAnalyzer with its events read into memory (Parquet/Feather are otherwise read lazily)"""
+    analyzer = DataAnalyzer(path)
+    analyzer.df
+    return analyzer
+
+
+def bench_analyzer(path, context, results, repeat, workdir, skip):
+    # Đọc một cột: lợi thế của định dạng cột so với CSV
+    _record(results, context, 'read_timestamp_column', lambda: read_events(path, columns=['timestamp']), repeat)
+    analyzer = _record(results, context, 'load', lambda: _load(path), 1)
+    if analyzer is None:
+        return
+
+    def build_rollups():
+        # Cube được cache trong analyzer: xây lại từ đầu mỗi lần đo
+        analyzer._rollups = None
+        return analyzer.get_rollups()
+
+    stages = {
+        'get_daily_visits': analyzer.get_daily_visits,
+        'get_top_pages': analyzer.get_top_pages,
+        'get_avg_session_duration': analyzer.get_avg_session_duration,
+        'get_rollups': build_rollups,
+        'get_funnel': analyzer.get_funnel,
+        'get_transitions': analyzer.get_transitions,
+        'get_entry_exit_pages': analyzer.get_entry_exit_pages,
+        'get_approximate_summary': analyzer.get_approximate_summary,
+        'get_retention': analyzer.get_retention,
+        'get_user_summary': analyzer.get_user_summary,
+    }
+    for stage, func in stages.items():
+        _record(results, context, stage, func, repeat)
+
+    if 'excel' not in skip:
+        output = os.path.join(workdir, 'analysis.xlsx')
+        _record(results, context, 'export_to_excel', lambda: analyzer.export_to_excel(output), 1)
+    if 'report' not in skip:
+        from report_generator import ReportGenerator
+        _record(results, context, 'create_report',
+                lambda: ReportGenerator(path, analyzer=analyzer).create_report(), 1)
+
+
+def bench_registry(path, context, results, repeat):
+    """Aggregates served through a fresh AnalyzerRegistry, as the API routes do"""
+    registry = AnalyzerRegistry()
+    _record(results, context, 'registry_load', lambda: registry.get(path), 1)
+    for name, kwargs in REGISTRY_AGGREGATES:
+        def aggregate():
+            return registry.aggregate(path, name, **kwargs)
+        # Lần đầu tính aggregate (cold), các lần sau lấy từ cache (warm)
+        _record(results, dict(context, cache='cold'), f"registry.{name}", aggregate, 1)
+        _record(results, dict(context, cache='warm'), f"registry.{name}", aggregate, repeat)
+
+
+def _import_api():
+    """
+    Import the API with the live event log and the chart process pool
+    turned off, so only the routes themselves are measured
+    """
+    os.environ['LIVE_LOG_PATH'] = ''
+    os.environ['CHART_WORKERS'] = '0'
+    import api
+    return api
+
+
+def bench_api(path, context, results, repeat):
+    """Routes through the Flask test client: aggregate, JSON, compression and ETag/304"""
+    api = _import_api()
+    api.DATA_PATH = path
+    api.registry.clear()
+    client = api.app.test_client()
+    for route in API_ROUTES:
+        def get(headers=API_HEADERS, expected=200):
+            response = client.get(route, headers=headers)
+            if response.status_code != expected:
+                raise RuntimeError(f"{route} returned {response.status_code}")
+            return response
+        # Lần đầu tính aggregate (cold), các lần sau lấy từ cache (warm)
+        response = _record(results, dict(context, cache='cold'), f"GET {route}", get, 1)
+        _record(results, dict(context, cache='warm'), f"GET {route}", get, repeat)
+        if response is not None and response.headers.get('ETag'):
+            revalidate = dict(API_HEADERS, **{'If-None-Match': response.headers['ETag']})
+            _record(results, dict(context, cache='etag'), f"GET {route}",
+                    lambda: get(revalidate, expected=304), repeat)
+
+
+def run(sizes, formats, repeat=3, seed=42, skip=(), workdir=None):
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for size in sizes:
+            generation = {'rows': size, 'format': None}
+            df = _record(results, generation, 'generate',
+                         lambda: generate_mock_data(num_records=size, seed=seed, end_time=DATA_END_TIME), 1)
+            for fmt in formats:
+                context = {'rows': size, 'format': fmt}
+                path = os.path.join(tmp, f"events_{size}.{fmt}")
+                _record(results, context, 'write', lambda: save_mock_data(df, path), 1)
+                context['file_bytes'] = os.path.getsize(path)
+                bench_analyzer(path, context, results, repeat, tmp, skip)
+                if 'registry' not in skip:
+                    bench_registry(path, context, results, repeat)
+                if 'api' not in skip:
+                    bench_api(path, context, results, repeat)
+            del df
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+        },
+        'parameters': {'sizes': sizes, 'formats': formats, 'repeat': repeat, 'seed': seed, 'skip': sorted(skip)},
+        'results': results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark phân tích dữ liệu trên dữ liệu mẫu")
+    parser.add_argument('--sizes', default='10000,100000', help="số events, phân cách bởi dấu phẩy")
+    parser.add_argument('--formats', default='csv,parquet', help="csv, parquet, feather")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip', default='', help="bỏ qua các bước: excel, report, registry, api")
+    parser.add_argument('--workdir', default=None, help="thư mục chứa file dữ liệu tạm")
+    parser.add_argument('--output', default=None, help="file JSON kết quả (mặc định: stdout)")
+    args = parser.parse_args()
+
+    report = run(
+        sizes=[int(size) for size in args.sizes.split(',')],
+        formats=[fmt.strip() for fmt in args.formats.split(',')],
+        repeat=args.repeat,
+        seed=args.seed,
+        skip={step.strip() for step in args.skip.split(',') if step.strip()},
+        workdir=args.workdir,
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
@@ -0,0 +1,171 @@
+"""
+Report charts rendered with matplotlib's object-oriented API on the Agg
+backend: no pyplot global state, so rendering is thread-safe and every
+figure is released as soon as its image is written. matplotlib is only
+imported when the first chart is rendered.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from instrumentation import stage
+from pools import process_pool
+
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+CHART_SIZE = (10, 6.5)
+
+
+def _daily_visits_chart(ax, daily_visits):
+    ax.plot(list(daily_visits.index), daily_visits.to_numpy())
+    ax.set_title("Daily Visits")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Visit Count")
+    ax.tick_params(axis='x', rotation=45)
+
+
+def _top_pages_chart(ax, top_pages):
+    ax.bar([str(page) for page in top_pages.index], top_pages.to_numpy())
+    ax.set_title(f"Top {len(top_pages)} Most Visited Pages")
+    ax.set_xlabel("Page URL")
+    ax.set_ylabel("Visit Count")
+    ax.tick_params(axis='x', rotation=45)
+
+
+CHARTS = {
+    'daily_visits': _daily_visits_chart,
+    'top_pages': _top_pages_chart,
+}
+
+
+def render_charts(panels, fmt='png', dpi=100):
+    """
+    Render [(chart_type, data), ...] stacked vertically in one image and
+    return its PNG/SVG bytes (a plain function, so it can run in a worker process)
+    """
+    for chart_type, _ in panels:
+        if chart_type not in CHARTS:
+            raise ValueError(f"Unknown chart type: {chart_type}")
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"Unknown chart format: {fmt}")
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(CHART_SIZE[0], CHART_SIZE[1] * len(panels)), dpi=dpi)
+    try:
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(len(panels), 1, squeeze=False, gridspec_kw={'hspace': 0.5})[:, 0]
+        for ax, (chart_type, data) in zip(axes, panels):
+            CHARTS[chart_type](ax, data)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, bbox_inches='tight')
+        return buffer.getvalue()
+    finally:
+        # Giải phóng artist ngay, không chờ garbage collector
+        fig.clear()
+
+
+def render_chart(chart_type, data, fmt='png', dpi=100):
+    """Render one chart to PNG/SVG bytes"""
+    return render_charts([(chart_type, data)], fmt, dpi)
+
+
+class ChartRenderer:
+    """
+    Renders charts, caching images by (data source, dataset version, chart type, format).
+
+    With workers > 0, charts that are not cached are rendered in parallel in
+    a persistent process pool (see pools.py); with workers=0 they render in the
+    calling thread. Without a version nothing is cached.
+    """
+
+    def __init__(self, workers=0, max_cached=64):
+        self.workers = workers
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = process_pool(self.workers)
+            return self._pool
+
+    def _render_all(self, jobs):
+        """jobs: list of (chart_type, data, fmt) -> list of image bytes"""
+        if self.workers and len(jobs) > 1:
+            try:
+                futures = [self._executor().submit(render_chart, *job) for job in jobs]
+                return [future.result() for future in futures]
+            except BrokenProcessPool:
+                # Worker bị kill: tạo lại pool lần sau, lần này render tại chỗ
+                with self._lock:
+                    self._pool = None
+        return [render_chart(*job) for job in jobs]
+
+    @staticmethod
+    def _dataset(source, version):
+        # Cùng version (mtime, size) có thể thuộc về hai file khác nhau
+        return (os.path.abspath(source) if source is not None else None), version
+
+    def render(self, charts, version=None, fmt='png', source=None):
+        """
+        charts: {chart_type: data}; returns {chart_type: image bytes}.
+        source: path of the dataset the data comes from (part of the cache key)
+        """
+        dataset = self._dataset(source, version)
+        images = {}
+        with self._lock:
+            for chart_type in charts:
+                key = (dataset, chart_type, fmt)
+                if version is not None and key in self._cache:
+                    self._cache.move_to_end(key)
+                    images[chart_type] = self._cache[key]
+        missing = [chart_type for chart_type in charts if chart_type not in images]
+        if missing:
+            with stage('charts.render') as s:
+                rendered = self._render_all([(chart_type, charts[chart_type], fmt) for chart_type in missing])
+                s.bytes(sum(len(image) for image in rendered))
+            images.update(zip(missing, rendered))
+            if version is not None:
+                with self._lock:
+                    for chart_type, image in zip(missing, rendered):
+                        self._cache[(dataset, chart_type, fmt)] = image
+                    self._evict()
+        return {chart_type: images[chart_type] for chart_type in charts}
+
+    def render_stacked(self, charts, version=None, fmt='png', source=None):
+        """charts: {chart_type: data} drawn one below the other; returns the image bytes"""
+        key = (self._dataset(source, version), tuple(charts), fmt)
+        if version is not None:
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    return self._cache[key]
+        with stage('charts.render') as s:
+            image = render_charts(list(charts.items()), fmt)
+            s.bytes(len(image))
+        if version is not None:
+            with self._lock:
+                self._cache[key] = image
+                self._evict()
+        return image
+
+    def _evict(self):
+        """Drop least recently used images. Caller holds self._lock."""
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'cached': len(self._cache), 'workers': self.workers}
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+# Renderer dùng chung khi không truyền renderer riêng (render trong thread gọi)
+renderer = ChartRenderer()
@@ -0,0 +1,216 @@
+"""
+User cohorts and retention.
+
+Events are reduced to a mergeable UserActivity: events per (user, day),
+distinct (user, session) pairs and total dwell time per user. Chunks and
+partitions are reduced independently and merged, and every query works on
+integer-coded users with vectorized group operations (no per-user loops).
+"""
+import numpy as np
+import pandas as pd
+from storage import iter_events
+
+COHORT_COLUMNS = ['user_id', 'session_id', 'timestamp', 'event_duration']
+FREQUENCIES = ('day', 'week')
+NS_PER_DAY = 86_400 * 10**9
+# 1970-01-01 là thứ Năm: cộng 3 ngày để tuần bắt đầu từ thứ Hai
+WEEK_OFFSET = 3
+# Gộp các phần đang chờ khi số phần vượt ngưỡng này, để bộ nhớ không tăng theo số chunk
+MAX_PENDING_PARTS = 16
+
+
+def _periods(days, freq):
+    """Day numbers (since 1970-01-01) -> day or Monday-based week numbers"""
+    if freq == 'day':
+        return days
+    if freq == 'week':
+        return (days + WEEK_OFFSET) // 7
+    raise ValueError(f"freq must be one of {', '.join(FREQUENCIES)}")
+
+
+def _session_keys(users, sessions):
+    """
+    64-bit key per (user, session): session ids (strings, categoricals or
+    codes) are factorized first so each distinct id is hashed only once
+    """
+    if isinstance(sessions.dtype, pd.CategoricalDtype):
+        codes, uniques = sessions.cat.codes.to_numpy(), sessions.cat.categories
+    else:
+        codes, uniques = pd.factorize(sessions)
+    # Các giá trị đã là duy nhất nên không cần để hash_array factorize lại
+    hashed = pd.util.hash_array(np.asarray(uniques, dtype=object), categorize=False)[codes]
+    return hashed ^ pd.util.hash_array(users)
+
+
+def _period_labels(periods, freq):
+    """Period numbers -> 'YYYY-MM-DD' of the day, or of the Monday of the week"""
+    days = periods if freq == 'day' else periods * 7 - WEEK_OFFSET
+    return pd.to_datetime(np.asarray(days, dtype='int64'), unit='D').strftime('%Y-%m-%d').tolist()
+
+
+class UserActivity:
+    """
+    Mergeable per-user activity. Memory is bounded by the number of
+    (user, active day) and (user, session) pairs, not by the number of events.
+    """
+
+    def __init__(self):
+        self._days = []
+        self._sessions = []
+        self._dwell = []
+        self.rows = 0
+
+    def update(self, chunk):
+        """Fold one chunk of events (COHORT_COLUMNS) into the activity"""
+        if chunk.empty:
+            return self
+        users = chunk['user_id'].to_numpy(dtype=np.int64)
+        days = chunk['timestamp'].to_numpy(dtype='datetime64[ns]').view('int64') // NS_PER_DAY
+        # Khóa (user, session) dạng hash để gộp được giữa các chunk và partition
+        sessions = _session_keys(users, chunk['session_id'])
+        durations = chunk['event_duration'].to_numpy(dtype=np.int64)
+
+        self._days.append(
+            pd.DataFrame({'user_id': users, 'day': days})
+            .groupby(['user_id', 'day'], sort=False).size().rename('events').reset_index()
+        )
+        first = ~pd.Series(sessions).duplicated().to_numpy()
+        self._sessions.append(pd.DataFrame({'user_id': users[first], 'session': sessions[first]}))
+        self._dwell.append(pd.Series(durations).groupby(users, sort=False).sum())
+        self.rows += len(chunk)
+        if len(self._days) > MAX_PENDING_PARTS:
+            self.compact()
+        return self
+
+    def merge(self, other):
+        """Merge another UserActivity (e.g. from a later file or partition) into this one"""
+        self._days.extend(other._days)
+        self._sessions.extend(other._sessions)
+        self._dwell.extend(other._dwell)
+        self.rows += other.rows
+        if len(self._days) > MAX_PENDING_PARTS:
+            self.compact()
+        return self
+
+    def compact(self):
+        """Collapse the pending parts into one (user, day), one session and one dwell table"""
+        if len(self._days) > 1:
+            days = pd.concat(self._days, ignore_index=True)
+            self._days = [days.groupby(['user_id', 'day'], sort=False)['events'].sum().reset_index()]
+            sessions = pd.concat(self._sessions, ignore_index=True)
+            self._sessions = [sessions[~sessions['session'].duplicated()]]
+            self._dwell = [pd.concat(self._dwell).groupby(level=0, sort=False).sum()]
+        return self
+
+    @property
+    def user_days(self):
+        """DataFrame of (user_id, day, events), one row per active user-day"""
+        self.compact()
+        if not self._days:
+            return pd.DataFrame({
+                'user_id': np.zeros(0, np.int64), 'day': np.zeros(0, np.int64), 'events': np.zeros(0, np.int64)
+            })
+        return self._days[0]
+
+    def _active_periods(self, freq):
+        """(user codes, users, periods) with one entry per distinct (user, period)"""
+        user_days = self.user_days
+        codes, users = pd.factorize(user_days['user_id'], sort=True)
+        periods = _periods(user_days['day'].to_numpy(dtype=np.int64), freq)
+        if freq != 'day':
+            # Nhiều ngày trong cùng một tuần chỉ tính là một lần hoạt động
+            pairs = pd.DataFrame({'code': codes, 'period': periods}).drop_duplicates()
+            codes, periods = pairs['code'].to_numpy(), pairs['period'].to_numpy()
+        return codes, np.asarray(users), periods
+
+    def cohorts(self, freq='day'):
+        """First-seen cohort label of every user"""
+        codes, users, periods = self._active_periods(freq)
+        first = pd.Series(periods).groupby(codes).min()
+        return pd.Series(
+            _period_labels(first.to_numpy(), freq),
+            index=pd.Index(users[first.index.to_numpy()], name='user_id'), name='cohort'
+        )
+
+    def retention(self, freq='day', max_periods=None, normalize=False):
+        """
+        Cohort x period matrix: row = first-seen period, column k = users of
+        that cohort active k periods later (column 0 is the cohort size).
+        normalize=True divides each row by its cohort size.
+        """
+        if max_periods is not None and max_periods < 0:
+            raise ValueError("max_periods must be non-negative")
+        codes, users, periods = self._active_periods(freq)
+        if len(codes) == 0:
+            # Vẫn giữ cột 0 (kích thước cohort) để bên gọi không phải xử lý riêng ma trận rỗng
+            return pd.DataFrame(
+                np.zeros((0, 1), dtype=float if normalize else np.int64),
+                index=pd.Index([], name='cohort'), columns=pd.RangeIndex(1, name='period'),
+            )
+        first = pd.Series(periods).groupby(codes).min().to_numpy()
+        offsets = periods - first[codes]
+        base = first.min()
+        n_cohorts = int(first.max() - base) + 1
+        n_offsets = int(offsets.max()) + 1
+        cells = (first[codes] - base) * n_offsets + offsets
+        matrix = np.bincount(cells, minlength=n_cohorts * n_offsets).reshape(n_cohorts, n_offsets)
+        if max_periods is not None:
+            matrix = matrix[:, :max_periods + 1]
+        # Bỏ các kỳ không có người dùng mới
+        keep = matrix[:, 0] > 0
+        result = pd.DataFrame(
+            matrix[keep],
+            index=pd.Index(_period_labels(np.flatnonzero(keep) + base, freq), name='cohort'),
+            columns=pd.RangeIndex(matrix.shape[1], name='period'),
+        )
+        if normalize:
+            result = result.div(result[0], axis=0)
+        return result
+
+    def repeat_visits(self, freq='day'):
+        """Number of users by how many distinct days/weeks they were active"""
+        codes, _, _ = self._active_periods(freq)
+        active = np.bincount(codes)
+        counts = np.bincount(active)[1:]
+        nonzero = np.flatnonzero(counts)
+        return pd.Series(
+            counts[nonzero], index=pd.Index(nonzero + 1, name='active_periods'), name='users'
+        )
+
+    def user_stats(self):
+        """Per-user first/last active day, active days, events, sessions and dwell time"""
+        user_days = self.user_days
+        stats = user_days.groupby('user_id').agg(
+            first_seen=('day', 'min'), last_seen=('day', 'max'),
+            active_days=('day', 'size'), events=('events', 'sum'),
+        )
+        sessions = self._sessions[0] if self._sessions else pd.DataFrame({'user_id': [], 'session': []})
+        stats['sessions'] = sessions.groupby('user_id').size().reindex(stats.index, fill_value=0)
+        dwell = self._dwell[0] if self._dwell else pd.Series(dtype='int64')
+        stats['dwell_seconds'] = dwell.reindex(stats.index, fill_value=0).astype('int64')
+        for column in ('first_seen', 'last_seen'):
+            stats[column] = _period_labels(stats[column].to_numpy(), 'day')
+        return stats
+
+    def summary(self):
+        """Users, returning users and per-user averages"""
+        stats = self.user_stats()
+        users = len(stats)
+        returning = int((stats['active_days'] > 1).sum())
+        return {
+            'users': users,
+            'returning_users': returning,
+            'returning_rate': returning / users if users else None,
+            'avg_active_days': float(stats['active_days'].mean()) if users else None,
+            'avg_sessions_per_user': float(stats['sessions'].mean()) if users else None,
+            'avg_events_per_user': float(stats['events'].mean()) if users else None,
+            'avg_dwell_seconds': float(stats['dwell_seconds'].mean()) if users else None,
+        }
+
+
+def activity_file(path, chunksize=100_000):
+    """Stream one event file into a UserActivity"""
+    activity = UserActivity()
+    for chunk in iter_events(path, columns=COHORT_COLUMNS, chunksize=chunksize):
+        activity.update(chunk)
+    return activity.compact()
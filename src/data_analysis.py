@@ -1,41 +1,302 @@
 import pandas as pd
+from datetime import date
+from storage import compact_frame, read_events, resolve_paths, storage_format
+from aggregates import count_values, top_n
+from incremental import IncrementalAggregator
+from parallel import activity_partitions, aggregate_partitions, sketch_partitions
+from cohorts import COHORT_COLUMNS, UserActivity
+from rollups import ROLLUP_COLUMNS, RollupCube, format_periods
+import path_analysis
+from instrumentation import instrumented, stage
+from exports import analysis_tables, write_export
 
 class DataAnalyzer:
-    def __init__(self, csv_path):
-        self.df = pd.read_csv(csv_path)
-        self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
+    def __init__(self, data_path, chunksize=None, incremental=False, state_path=None,
+                 workers=None, compact=True, ga_store=None):
+        """
+        data_path: a CSV/Parquet/Feather file, a directory of partitions or a glob
+        chunksize: if set, aggregates are computed by streaming the file in
+        chunks of this many rows instead of loading it into memory
+        incremental: keep persisted aggregate state for an append-only CSV
+        and only parse rows appended since the last run (see IncrementalAggregator)
+        workers: pre-aggregate partitions in a process pool of this size
+        compact: load events with EVENT_SCHEMA (categoricals, int session
+        codes + session_lookup, downcast integers) to cut memory use
+        ga_store: optional GASnapshotStore whose daily GA metrics are served
+        alongside the event log (see get_ga_daily)
+        """
+        self.data_path = data_path
+        self.paths = resolve_paths(data_path)
+        self.format = storage_format(self.paths[0])
+        self.chunksize = chunksize
+        self.incremental = incremental
+        self.state_path = state_path
+        self.workers = workers
+        self.compact = compact
+        self.ga_store = ga_store
+        # session_lookup[code] -> session_id gốc khi compact=True
+        self.session_lookup = None
+        self._streaming = chunksize is not None or incremental or workers is not None
+        self._df = None
+        self._columns_cache = {}
+        self._partials = None
+        self._rollups = None
+        self._activity = None
+        all_csv = all(storage_format(path) == 'csv' for path in self.paths)
+        if all_csv and not self._streaming:
+            # CSV không đọc được theo cột, nên vẫn load toàn bộ ngay như trước
+            self._df = self._read()
+
+    @instrumented('analyzer.load')
+    def _read(self, columns=None):
+        frames = [read_events(path, columns=columns, compact=self.compact) for path in self.paths]
+        df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        if self.compact:
+            with stage('analyzer.compact'):
+                df, session_lookup = compact_frame(df)
+            if session_lookup is not None:
+                self.session_lookup = session_lookup
+        return df
+
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = self._read()
+        return self._df
+
+    def _columns(self, *columns):
+        """Return a frame holding at least `columns`, reading only those from columnar files"""
+        if self._df is not None:
+            return self._df
+        missing = [c for c in columns if c not in self._columns_cache]
+        if missing:
+            loaded = self._read(columns=missing)
+            for column in missing:
+                self._columns_cache[column] = loaded[column]
+        return pd.DataFrame({c: self._columns_cache[c] for c in columns})
+
+    def _session_ids(self, index):
+        """Map an index of session codes back to the original session ids"""
+        if self.session_lookup is not None:
+            return self.session_lookup[index.to_numpy()]
+        if isinstance(index, pd.CategoricalIndex):
+            return index.astype(str)
+        return index
+
+    def memory_usage(self):
+        """Bytes held by the loaded events, per column plus the session lookup table"""
+        usage = {}
+        if self._df is not None:
+            usage.update(self._df.memory_usage(index=False, deep=True).to_dict())
+        else:
+            usage.update({c: int(s.memory_usage(index=False, deep=True)) for c, s in self._columns_cache.items()})
+        if self.session_lookup is not None:
+            usage['session_lookup'] = int(self.session_lookup.memory_usage(deep=True))
+        usage = {column: int(size) for column, size in usage.items()}
+        usage['total'] = sum(usage.values())
+        return usage
+
+    def _streamed(self):
+        """Partial aggregates from one streaming pass, or None when running in memory"""
+        if not self._streaming:
+            return None
+        if self._partials is None:
+            chunksize = self.chunksize or 100_000
+            if self.incremental and len(self.paths) == 1 and self.format == 'csv':
+                aggregator = IncrementalAggregator(self.paths[0], self.state_path, chunksize=chunksize)
+                self._partials = aggregator.refresh()
+            else:
+                self._partials = aggregate_partitions(
+                    self.paths, chunksize, workers=self.workers or 1, incremental=self.incremental
+                )
+        return self._partials
         
+    @instrumented('analyzer.get_daily_visits')
     def get_daily_visits(self):
-        daily_visits = self.df.groupby(self.df['timestamp'].dt.date).size()
+        if self._streamed() is not None:
+            return self._streamed().daily_visits()
+        df = self._columns('timestamp')
+        daily_visits = df.groupby(df['timestamp'].dt.date).size()
         daily_visits.index = daily_visits.index.map(str)
         return daily_visits
     
+    @instrumented('analyzer.get_top_pages')
     def get_top_pages(self, n=5):
-        top_pages = self.df['page_url'].value_counts().head(n)
+        if self._streamed() is not None:
+            return self._streamed().top_pages(n)
+        top_pages = top_n(count_values(self._columns('page_url')['page_url']), n)
+        top_pages.name = 'count'
         return top_pages
     
+    @instrumented('analyzer.get_avg_session_duration')
     def get_avg_session_duration(self):
-        session_durations = self.df.groupby('session_id')['event_duration'].mean()
-        return session_durations
+        if self._streamed() is not None:
+            return self._streamed().avg_session_duration()
+        df = self._columns('session_id', 'event_duration')
+        session_durations = df.groupby('session_id', observed=True)['event_duration'].mean()
+        return session_durations.set_axis(self._session_ids(session_durations.index))
     
-    def export_to_excel(self, output_path):
-        with pd.ExcelWriter(output_path) as writer:
-            # Daily visits
-            daily_visits = self.get_daily_visits()
-            daily_visits.to_excel(writer, sheet_name='Daily Visits')
-            
-            # Top pages
-            top_pages = self.get_top_pages()
-            top_pages.to_excel(writer, sheet_name='Top Pages')
-            
-            # Session duration
-            session_durations = self.get_avg_session_duration()
-            session_durations.to_excel(
-                writer, 
-                sheet_name='Session Duration',
-                header=['Duration (seconds)']
-            )
+    @instrumented('analyzer.get_sorted_session_durations')
+    def get_sorted_session_durations(self, by='session_id', ascending=True):
+        """Per-session mean durations sorted by session id or by duration (for pagination)"""
+        session_durations = self.get_avg_session_duration()
+        if by == 'duration':
+            return session_durations.sort_values(ascending=ascending, kind='stable')
+        if by == 'session_id':
+            # Đã được sắp xếp theo session_id sau groupby
+            return session_durations if ascending else session_durations.iloc[::-1]
+        raise ValueError(f"Unknown sort key: {by}")
+
+    @instrumented('analyzer.get_rollups')
+    def get_rollups(self):
+        """Hourly (hour, page_url, event_type) rollup cube, built once per analyzer"""
+        if self._streamed() is not None:
+            return self._streamed().rollups
+        if self._rollups is None:
+            self._rollups = RollupCube.from_frame(self._columns(*ROLLUP_COLUMNS))
+        return self._rollups
+
+    @instrumented('analyzer.get_visits')
+    def get_visits(self, start=None, end=None, granularity='day', page=None):
+        """Visit counts per hour/day/week/month in [start, end), answered from the rollups"""
+        visits = self.get_rollups().query(start, end, granularity, page)['events']
+        visits.index = format_periods(visits.index, granularity)
+        return visits
+
+    @instrumented('analyzer.get_ga_daily')
+    def get_ga_daily(self, start=None, end=None, **options):
+        """
+        Daily GA metrics from the local snapshot store, by default over the
+        date range of the event log. Missing settled days are fetched once.
+        """
+        if self.ga_store is None:
+            raise ValueError("No GA snapshot store configured")
+        if start is None or end is None:
+            days = self.get_daily_visits().index
+            if len(days) == 0:
+                return self.ga_store.daily_totals(date.today(), date.today(), sync=False)
+            start = start or days.min()
+            end = end or days.max()
+        return self.ga_store.daily_totals(start, end, **options)
+
+    @instrumented('analyzer.get_daily_overview')
+    def get_daily_overview(self, start=None, end=None, **options):
+        """Event-log visits and GA metrics side by side, one row per day"""
+        visits = self.get_daily_visits().rename('visits')
+        ga_daily = self.get_ga_daily(start, end, **options)
+        overview = ga_daily.join(visits, how='outer')
+        # Index là chuỗi 'YYYY-MM-DD' nên so sánh chuỗi đúng thứ tự ngày
+        if start is not None:
+            overview = overview[overview.index >= pd.Timestamp(start).strftime('%Y-%m-%d')]
+        if end is not None:
+            overview = overview[overview.index <= pd.Timestamp(end).strftime('%Y-%m-%d')]
+        overview.index.name = 'date'
+        return overview
+
+    @instrumented('analyzer.get_approximate_summary')
+    def get_approximate_summary(self, n=5, **sketch_options):
+        """
+        Fixed-memory approximate answers (unique users/sessions, session
+        duration quantiles, heavy-hitter pages) with error bounds, computed
+        by streaming the data through mergeable sketches (see sketches.py)
+        """
+        sketch = sketch_partitions(
+            self.paths, self.chunksize or 100_000, workers=self.workers or 1, **sketch_options
+        )
+        return sketch.summary(n)
+
+    def _user_activity(self):
+        """Per-user activity for cohort queries, built once per analyzer"""
+        if self._activity is None:
+            if self._streaming:
+                self._activity = activity_partitions(
+                    self.paths, self.chunksize or 100_000, workers=self.workers or 1
+                )
+            else:
+                self._activity = UserActivity().update(self._columns(*COHORT_COLUMNS)).compact()
+        return self._activity
+
+    @instrumented('analyzer.get_retention')
+    def get_retention(self, freq='day', max_periods=None, normalize=False):
+        """
+        Cohort x period retention matrix: users grouped by first-seen day or
+        week (freq), column k = users active k periods later
+        """
+        return self._user_activity().retention(freq, max_periods, normalize)
+
+    @instrumented('analyzer.get_user_cohorts')
+    def get_user_cohorts(self, freq='day'):
+        """First-seen cohort of every user"""
+        return self._user_activity().cohorts(freq)
+
+    @instrumented('analyzer.get_repeat_visits')
+    def get_repeat_visits(self, freq='day'):
+        """Number of users by count of distinct active days/weeks"""
+        return self._user_activity().repeat_visits(freq)
+
+    @instrumented('analyzer.get_user_stats')
+    def get_user_stats(self, sort='user_id', ascending=True):
+        """Per-user first/last seen, active days, events, sessions and dwell time"""
+        stats = self._user_activity().user_stats()
+        if sort == 'user_id':
+            return stats if ascending else stats.iloc[::-1]
+        if sort not in stats.columns:
+            raise ValueError(f"Unknown sort key: {sort}")
+        return stats.sort_values(sort, ascending=ascending, kind='stable')
+
+    @instrumented('analyzer.get_user_summary')
+    def get_user_summary(self):
+        return self._user_activity().summary()
+
+    def _path_events(self, session_gap=None):
+        """Events for path analysis, optionally re-sessionized by inactivity gap"""
+        df = self._columns('user_id', 'session_id', 'page_url', 'timestamp')
+        if session_gap is not None:
+            df = path_analysis.sessionize(df, session_gap)
+        return df
+
+    @instrumented('analyzer.get_sessionized')
+    def get_sessionized(self, gap='30min'):
+        """Events with session_id re-assigned by an inactivity gap"""
+        return path_analysis.sessionize(self._columns('user_id', 'session_id', 'page_url', 'timestamp'), gap)
+
+    @instrumented('analyzer.get_funnel')
+    def get_funnel(self, steps=tuple(path_analysis.DEFAULT_FUNNEL), session_gap=None):
+        return path_analysis.funnel(self._path_events(session_gap), list(steps))
+
+    @instrumented('analyzer.get_transitions')
+    def get_transitions(self, k=10, session_gap=None):
+        return path_analysis.transitions(self._path_events(session_gap), k)
+
+    @instrumented('analyzer.get_next_page_probabilities')
+    def get_next_page_probabilities(self, page=None, session_gap=None):
+        return path_analysis.next_page_probabilities(self._path_events(session_gap), page)
+
+    @instrumented('analyzer.get_entry_exit_pages')
+    def get_entry_exit_pages(self, session_gap=None):
+        return path_analysis.entry_exit_pages(self._path_events(session_gap))
+
+    def export_tables(self):
+        """Aggregates included in an export, each computed once"""
+        return analysis_tables(
+            self.get_daily_visits(), self.get_top_pages(), self.get_avg_session_duration()
+        )
+
+    @instrumented('analyzer.export')
+    def export(self, output_path, fmt=None, chunksize=None):
+        """
+        Export the aggregates as a streaming .xlsx workbook (oversized sheets
+        are split) or as a zip of CSV/Parquet files (fmt='csv'/'parquet')
+        """
+        # Cho phép export ở chế độ streaming kể cả khi analyzer đang chạy in-memory
+        source = self
+        if chunksize is not None and chunksize != self.chunksize:
+            source = DataAnalyzer(self.data_path, chunksize=chunksize, workers=self.workers)
+        return write_export(source.export_tables(), output_path, fmt)
+
+    def export_to_excel(self, output_path, chunksize=None):
+        return self.export(output_path, 'xlsx', chunksize)
 
 if __name__ == "__main__":
-    analyzer = DataAnalyzer('data/user_behavior.csv')
+    analyzer = DataAnalyzer('data/user_behavior.csv', incremental=True)
     analyzer.export_to_excel('reports/excel_reports/analysis_results.xlsx')
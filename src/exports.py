@@ -0,0 +1,164 @@
+import io
+import math
+import os
+import zipfile
+from instrumentation import stage
+
+# Giới hạn số dòng của một sheet Excel (kể cả dòng header)
+EXCEL_MAX_ROWS = 1_048_576
+# Số dòng chuyển sang Python mỗi lần ghi, để bộ nhớ tạm không phụ thuộc kích thước bảng
+WRITE_BATCH_ROWS = 100_000
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'application/zip',
+    'parquet': 'application/zip',
+}
+
+
+def analysis_tables(daily_visits, top_pages, session_durations):
+    """Sheet name -> (series, [index header, value header]) for an export"""
+    return {
+        'Daily Visits': (daily_visits, ['date', 'visits']),
+        'Top Pages': (top_pages, ['page_url', 'count']),
+        'Session Duration': (session_durations, ['session_id', 'Duration (seconds)']),
+    }
+
+
+def _batches(series):
+    for start in range(0, len(series), WRITE_BATCH_ROWS):
+        part = series.iloc[start:start + WRITE_BATCH_ROWS]
+        yield zip(part.index.tolist(), part.tolist())
+
+
+def _sheet_names(name, rows, max_rows):
+    """Sheet names for `rows` data rows split into sheets of max_rows - 1 rows"""
+    n_sheets = max(1, -(-rows // (max_rows - 1)))
+    # Tên sheet Excel tối đa 31 ký tự
+    return [name[:31] if i == 0 else f"{name[:26]} ({i + 1})" for i in range(n_sheets)]
+
+
+class _XlsxWriterBook:
+    """xlsxwriter in constant_memory mode: each row is flushed to disk when the next one starts"""
+
+    def __init__(self, output_path):
+        import xlsxwriter
+        # NaN/inf được ghi thành lỗi #NUM!/#DIV/0! của Excel thay vì làm hỏng cả file
+        self.workbook = xlsxwriter.Workbook(output_path, {'constant_memory': True, 'nan_inf_to_errors': True})
+        self.rows = {}
+
+    def add_sheet(self, name):
+        sheet = self.workbook.add_worksheet(name)
+        self.rows[sheet.name] = 0
+        return sheet
+
+    def append(self, sheet, row):
+        sheet.write_row(self.rows[sheet.name], 0, row)
+        self.rows[sheet.name] += 1
+
+    def close(self):
+        self.workbook.close()
+
+
+class _OpenpyxlBook:
+    """openpyxl write-only workbook (fallback when xlsxwriter is not installed)"""
+
+    def __init__(self, output_path):
+        from openpyxl import Workbook
+        self.workbook = Workbook(write_only=True)
+        self.output_path = output_path
+
+    def add_sheet(self, name):
+        return self.workbook.create_sheet(name)
+
+    def append(self, sheet, row):
+        # openpyxl ghi NaN/inf thành XML không hợp lệ: để trống ô
+        sheet.append([None if isinstance(v, float) and not math.isfinite(v) else v for v in row])
+
+    def close(self):
+        self.workbook.save(self.output_path)
+
+
+def _streaming_workbook(output_path):
+    try:
+        return _XlsxWriterBook(output_path)
+    except ImportError:
+        return _OpenpyxlBook(output_path)
+
+
+def write_excel(tables, output_path, max_rows=EXCEL_MAX_ROWS):
+    """
+    Write the tables to an .xlsx file row by row with a streaming engine.
+    Tables longer than a sheet continue on 'Name (2)', 'Name (3)', ...
+    """
+    workbook = _streaming_workbook(output_path)
+    with stage('export.excel') as s:
+        for name, (series, header) in tables.items():
+            sheets = iter(_sheet_names(name, len(series), max_rows))
+            sheet, used = None, max_rows
+            for batch in _batches(series):
+                for row in batch:
+                    if used >= max_rows:
+                        sheet = workbook.add_sheet(next(sheets))
+                        workbook.append(sheet, header)
+                        used = 1
+                    workbook.append(sheet, row)
+                    used += 1
+            if sheet is None:
+                workbook.append(workbook.add_sheet(next(sheets)), header)
+            s.rows(len(series))
+        workbook.close()
+    return output_path
+
+
+def write_archive(tables, output_path, fmt='csv'):
+    """Write one CSV or Parquet file per table into a zip archive (no row limit)"""
+    if fmt not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported archive format: {fmt}")
+    with stage(f'export.{fmt}') as s, zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, (series, header) in tables.items():
+            filename = name.lower().replace(' ', '_') + '.' + fmt
+            frame = series.rename_axis(header[0]).rename(header[1]).reset_index()
+            # Ghi thẳng vào entry của zip, không giữ bản sao toàn bộ file trong RAM
+            with archive.open(filename, 'w', force_zip64=True) as entry:
+                if fmt == 'csv':
+                    with io.TextIOWrapper(entry, encoding='utf-8', newline='') as text:
+                        frame.to_csv(text, index=False, chunksize=WRITE_BATCH_ROWS)
+                else:
+                    frame.to_parquet(entry, index=False)
+            s.rows(len(frame))
+    return output_path
+
+
+def write_export(tables, output_path, fmt=None):
+    """Write tables as 'xlsx', or as a zip of 'csv'/'parquet' files (default: by extension)"""
+    if fmt is None:
+        fmt = 'xlsx' if os.path.splitext(output_path)[1].lower() == '.xlsx' else 'csv'
+    if fmt == 'xlsx':
+        return write_excel(tables, output_path)
+    return write_archive(tables, output_path, fmt)
+
+
+def remove_file(path):
+    """Delete a file if it still exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def iter_file(path, chunk_size=64 * 1024, delete=False):
+    """
+    Yield a file in chunks (for streamed HTTP downloads), optionally deleting
+    it afterwards. A generator that is never started cannot clean up, so
+    HTTP responses should delete the file with call_on_close(remove_file) instead.
+    """
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if delete:
+            remove_file(path)
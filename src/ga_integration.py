@@ -1,44 +1,265 @@
 from google.analytics.data_v1beta import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import (
+    BatchRunReportsRequest,
     DateRange,
     Dimension,
     Metric,
+    MetricType,
     RunReportRequest,
+    RunReportResponse,
 )
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
+from storage import storage_format
+from instrumentation import instrumented, stage
 
 # Load environment variables from .env file
 load_dotenv()
 
+DASHBOARD_METRICS = ['activeUsers', 'eventCount', 'newUsers']
+# batch_run_reports nhận tối đa 5 request mỗi lần gọi
+MAX_BATCH_SIZE = 5
+# GA4 có thể cập nhật số liệu tới ~48h sau; khoảng thời gian kết thúc trước
+# mốc này được coi là bất biến và cache vĩnh viễn
+DATA_SETTLE_DAYS = 2
+# Số dòng mỗi trang khi phân trang report (API cho phép tối đa 250000)
+PAGE_SIZE = 100_000
+INTEGER_METRIC_TYPES = {MetricType.TYPE_INTEGER}
+# Dimension thời gian được parse thành datetime64
+DATE_DIMENSIONS = {'date': '%Y%m%d', 'dateHour': '%Y%m%d%H', 'dateHourMinute': '%Y%m%d%H%M'}
+
+_DAYS_AGO = re.compile(r'^(\d+)daysAgo$')
+
+
+def resolve_date(value, today=None):
+    """Turn a GA date ('today', 'yesterday', 'NdaysAgo' or YYYY-MM-DD) into a date"""
+    today = today or date.today()
+    if isinstance(value, date):
+        return value
+    if value == 'today':
+        return today
+    if value == 'yesterday':
+        return today - timedelta(days=1)
+    match = _DAYS_AGO.match(value)
+    if match:
+        return today - timedelta(days=int(match.group(1)))
+    return date.fromisoformat(value)
+
+
+class ReportCache:
+    """
+    Thread-safe LRU cache of report DataFrames with a per-entry TTL.
+    Entries stored with ttl=None never expire (only LRU eviction applies).
+    """
+
+    def __init__(self, max_entries=128, ttl=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > self._clock()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, permanent=False):
+        expires = None if permanent else self._clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
 class GoogleAnalyticsConnector:
-    def __init__(self):
+    def __init__(self, property_id=None, client=None, cache=None, max_workers=4, page_size=PAGE_SIZE):
         # GA4 property ID should be stored in .env file
-        self.property_id = os.getenv("GA_PROPERTY_ID")
+        self.property_id = property_id or os.getenv("GA_PROPERTY_ID")
         # Initialize the client
         # Note: This assumes you have set up authentication 
         # (either via GOOGLE_APPLICATION_CREDENTIALS env var or explicitly)
-        self.client = BetaAnalyticsDataClient()
+        # Có thể truyền client giả lập (cùng interface batch_run_reports) để test offline
+        self.client = client if client is not None else BetaAnalyticsDataClient()
+        self.cache = cache if cache is not None else ReportCache(
+            max_entries=int(os.getenv("GA_CACHE_SIZE", "128")),
+            ttl=float(os.getenv("GA_CACHE_TTL", "300")),
+        )
+        self.max_workers = max_workers
+        self.page_size = page_size
     
+    @instrumented('ga.decode')
     def _process_response(self, response):
         """
-        Process API response into a pandas DataFrame
+        Process API response into a typed pandas DataFrame, one column array at a time:
+        integer metrics as int64, other metrics as float64, date dimensions as datetime64.
+        Any object with the RunReportResponse fields is accepted (e.g. a fake client's response).
         """
-        rows = []
-        for row in response.rows:
-            row_data = {}
-            for i, dimension in enumerate(response.dimension_headers):
-                row_data[dimension.name] = row.dimension_values[i].value
-            
-            for i, metric in enumerate(response.metric_headers):
-                row_data[metric.name] = row.metric_values[i].value
-            
-            rows.append(row_data)
-        
-        return pd.DataFrame(rows)
-    
-    
+        # Với message proto-plus, duyệt protobuf gốc thay vì wrapper (nhanh hơn nhiều lần)
+        if isinstance(response, RunReportResponse):
+            response = RunReportResponse.pb(response)
+        rows = list(response.rows)
+        n_rows = len(rows)
+
+        columns = {}
+        for i, header in enumerate(response.dimension_headers):
+            values = np.fromiter((row.dimension_values[i].value for row in rows), dtype=object, count=n_rows)
+            if header.name in DATE_DIMENSIONS:
+                values = pd.to_datetime(values, format=DATE_DIMENSIONS[header.name], errors='coerce')
+            columns[header.name] = values
+        for i, header in enumerate(response.metric_headers):
+            values = np.fromiter((row.metric_values[i].value for row in rows), dtype=object, count=n_rows)
+            # Giá trị rỗng hoặc không phải số thành NaN thay vì làm hỏng cả report
+            values = pd.to_numeric(values, errors='coerce').astype('float64')
+            if getattr(header, 'type_', None) in INTEGER_METRIC_TYPES and not np.isnan(values).any():
+                values = values.astype('int64')
+            columns[header.name] = values
+        return pd.DataFrame(columns, index=pd.RangeIndex(n_rows))
+
+    def _cache_key(self, dimensions, metrics, start_date, end_date):
+        return (self.property_id, tuple(dimensions), tuple(metrics), start_date.isoformat(), end_date.isoformat())
+
+    def _report_request(self, dimensions, metrics, start_date, end_date, offset=0, limit=PAGE_SIZE):
+        return RunReportRequest(
+            property=f"properties/{self.property_id}",
+            dimensions=[Dimension(name=name) for name in dimensions],
+            metrics=[Metric(name=name) for name in metrics],
+            date_ranges=[DateRange(start_date=str(start_date), end_date=str(end_date))],
+            offset=offset,
+            limit=limit,
+        )
+
+    def _page_offsets(self, request, first_page):
+        """Offsets of the pages still missing after the first page of a report"""
+        return range(request.offset + len(first_page.rows), first_page.row_count, request.limit)
+
+    def _next_page(self, request, offset):
+        page = RunReportRequest(request)
+        page.offset = offset
+        with stage('ga.run_report'):
+            return self.client.run_report(page)
+
+    def _complete_report(self, request, first_page):
+        """Decode a report, fetching its remaining pages concurrently when row_count exceeds one page"""
+        frames = [self._process_response(first_page)]
+        offsets = self._page_offsets(request, first_page)
+        if len(offsets):
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(offsets))) as executor:
+                pages = executor.map(lambda offset: self._next_page(request, offset), offsets)
+                frames.extend(self._process_response(page) for page in pages)
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def _run_batch(self, requests):
+        """One batch_run_reports round trip for up to MAX_BATCH_SIZE requests"""
+        with stage('ga.batch_run_reports'):
+            response = self.client.batch_run_reports(BatchRunReportsRequest(
+                property=f"properties/{self.property_id}",
+                requests=requests,
+            ))
+        return [self._complete_report(request, report) for request, report in zip(requests, response.reports)]
+
+    def iter_report_pages(self, dimensions, metrics, start_date, end_date, page_size=PAGE_SIZE):
+        """
+        Yield a report page by page as typed DataFrames, so memory stays
+        bounded by `page_size` whatever the size of the report
+        """
+        request = self._report_request(dimensions, metrics, start_date, end_date, limit=page_size)
+        while True:
+            with stage('ga.run_report'):
+                page = self.client.run_report(request)
+            yield self._process_response(page)
+            request.offset += len(page.rows)
+            if not len(page.rows) or request.offset >= page.row_count:
+                return
+
+    def export_report(self, output_path, dimensions, metrics, start_date, end_date, page_size=PAGE_SIZE):
+        """
+        Stream a report of any size to CSV or Parquet one page at a time.
+        Returns the number of rows written.
+        """
+        fmt = storage_format(output_path)
+        writer = None
+        rows = 0
+        try:
+            for page in self.iter_report_pages(dimensions, metrics, start_date, end_date, page_size):
+                if fmt == 'parquet':
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                    table = pa.Table.from_pandas(page, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(output_path, table.schema)
+                    writer.write_table(table)
+                elif fmt == 'csv':
+                    page.to_csv(output_path, mode='w' if rows == 0 else 'a', header=rows == 0, index=False)
+                else:
+                    raise ValueError(f"Unsupported export format: {output_path}")
+                rows += len(page)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    @instrumented('ga.fetch_reports')
+    def fetch_reports(self, specs):
+        """
+        Fetch several reports, each given as (dimensions, metrics, start_date, end_date).
+
+        Relative dates are resolved first so cache keys are absolute. Cached
+        reports are served locally; the rest are sent in batches of
+        MAX_BATCH_SIZE, with batches running concurrently; reports longer
+        than page_size rows are paged through transparently. Returns one
+        DataFrame per spec, in order (copies, so callers may modify them).
+        """
+        today = date.today()
+        settled = today - timedelta(days=DATA_SETTLE_DAYS)
+        keys = []
+        for dimensions, metrics, start_date, end_date in specs:
+            keys.append(self._cache_key(dimensions, metrics, resolve_date(start_date, today), resolve_date(end_date, today)))
+
+        results = {key: self.cache.get(key) for key in keys}
+        missing = list(dict.fromkeys(key for key, frame in results.items() if frame is None))
+        if missing:
+            requests = [
+                self._report_request(dimensions, metrics, start_date, end_date, limit=self.page_size)
+                for _, dimensions, metrics, start_date, end_date in missing
+            ]
+            batches = [requests[i:i + MAX_BATCH_SIZE] for i in range(0, len(requests), MAX_BATCH_SIZE)]
+            if len(batches) == 1:
+                frames = self._run_batch(batches[0])
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                    frames = [frame for batch in executor.map(self._run_batch, batches) for frame in batch]
+            for key, frame in zip(missing, frames):
+                results[key] = frame
+                self.cache.set(key, frame, permanent=date.fromisoformat(key[4]) < settled)
+        return [results[key].copy() for key in keys]
+
 
     def get_dashboard_metrics(self, current_period_days=7):
         """
@@ -54,50 +275,15 @@ class GoogleAnalyticsConnector:
         previous_start_date = f"{current_period_days*2}daysAgo"
         previous_end_date = f"{current_period_days+1}daysAgo"
         
-        # Current period request
-        current_request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            dimensions=[Dimension(name="date")],
-            metrics=[
-                Metric(name="activeUsers"),
-                Metric(name="eventCount"),
-                Metric(name="newUsers"),
-            ],
-            date_ranges=[DateRange(start_date=start_date, end_date=end_date)],
-        )
-        
-        # Previous period request
-        previous_request = RunReportRequest(
-            property=f"properties/{self.property_id}",
-            dimensions=[Dimension(name="date")],
-            metrics=[
-                Metric(name="activeUsers"),
-                Metric(name="eventCount"),
-                Metric(name="newUsers"),
-            ],
-            date_ranges=[DateRange(start_date=previous_start_date, end_date=previous_end_date)],
-        )
-        
-        # Get responses
-        current_response = self.client.run_report(current_request)
-        previous_response = self.client.run_report(previous_request)
-        
-        # Process data
-        current_data = self._process_response(current_response)
-        previous_data = self._process_response(previous_response)
+        # Hai kỳ được lấy trong cùng một batch request (một round trip thay vì hai)
+        current_data, previous_data = self.fetch_reports([
+            (["date"], DASHBOARD_METRICS, start_date, end_date),
+            (["date"], DASHBOARD_METRICS, previous_start_date, previous_end_date),
+        ])
         
-        # Calculate totals
-        current_totals = {
-            'activeUsers': current_data['activeUsers'].astype(float).sum(),
-            'eventCount': current_data['eventCount'].astype(float).sum(),
-            'newUsers': current_data['newUsers'].astype(float).sum()
-        }
-        
-        previous_totals = {
-            'activeUsers': previous_data['activeUsers'].astype(float).sum(),
-            'eventCount': previous_data['eventCount'].astype(float).sum(),
-            'newUsers': previous_data['newUsers'].astype(float).sum()
-        }
+        # Calculate totals (metric đã có kiểu số sau khi decode)
+        current_totals = {metric: float(current_data[metric].sum()) for metric in DASHBOARD_METRICS}
+        previous_totals = {metric: float(previous_data[metric].sum()) for metric in DASHBOARD_METRICS}
         
         # Calculate percentage changes
         percentage_changes = {}
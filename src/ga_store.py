@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+from datetime import date, timedelta
+import pandas as pd
+
+# Giống DASHBOARD_METRICS của GoogleAnalyticsConnector
+DEFAULT_METRICS = ['activeUsers', 'eventCount', 'newUsers']
+# Chỉ lưu những ngày GA không còn cập nhật số liệu (xem DATA_SETTLE_DAYS)
+DEFAULT_SETTLE_DAYS = 2
+
+_PART_NAME = re.compile(r'^part-(\d{8})-(\d{8})\.parquet$')
+
+
+def _day(value):
+    return pd.Timestamp(value).date()
+
+
+def _ranges(days):
+    """Group sorted dates into contiguous (start, end) ranges"""
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] + timedelta(days=1) == day:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(r) for r in ranges]
+
+
+class GASnapshotStore:
+    """
+    Local, append-only store of daily GA report rows (one report definition
+    per directory).
+
+    Every sync writes one Parquet part per contiguous range of fetched days,
+    named part-YYYYMMDD-YYYYMMDD.parquet. Coverage is taken from the part
+    names, so days without any GA rows are not fetched again. Only days
+    older than `settle_days` are stored; more recent days can be read live
+    through the connector (and its TTL cache) with load(live=True).
+    """
+
+    def __init__(self, root, connector=None, dimensions=('date',), metrics=DEFAULT_METRICS,
+                 settle_days=DEFAULT_SETTLE_DAYS):
+        if 'date' not in dimensions:
+            raise ValueError("GA snapshots need the 'date' dimension")
+        self.root = root
+        self.connector = connector
+        self.dimensions = list(dimensions)
+        self.metrics = list(metrics)
+        self.settle_days = settle_days
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _parts(self):
+        """(start, end, path) for every stored part, ordered by start date"""
+        parts = []
+        for name in os.listdir(self.root):
+            match = _PART_NAME.match(name)
+            if match:
+                start, end = (pd.Timestamp(value).date() for value in match.groups())
+                parts.append((start, end, os.path.join(self.root, name)))
+        return sorted(parts)
+
+    def _empty_frame(self):
+        columns = {name: pd.Series(dtype='object') for name in self.dimensions}
+        columns['date'] = pd.Series(dtype='datetime64[ns]')
+        columns.update({name: pd.Series(dtype='float64') for name in self.metrics})
+        return pd.DataFrame(columns)
+
+    def version(self, today=None):
+        """
+        Cheap manifest of what load() serves: part names and mtimes, plus the
+        last settled day (a newly settled day means the next sync adds a part)
+        """
+        parts = tuple((os.path.basename(path), os.stat(path).st_mtime_ns) for _, _, path in self._parts())
+        return self.last_settled_day(today).isoformat(), parts
+
+    def last_settled_day(self, today=None):
+        return (today or date.today()) - timedelta(days=self.settle_days + 1)
+
+    def missing_ranges(self, start, end, today=None):
+        """Contiguous settled date ranges in [start, end] that are not stored yet"""
+        start, end = _day(start), min(_day(end), self.last_settled_day(today))
+        if start > end:
+            return []
+        covered = set()
+        for part_start, part_end, _ in self._parts():
+            if part_end >= start and part_start <= end:
+                covered.update(pd.date_range(part_start, part_end).date)
+        days = [day for day in pd.date_range(start, end).date if day not in covered]
+        return _ranges(days)
+
+    def _write_part(self, start, end, frame):
+        name = f"part-{start:%Y%m%d}-{end:%Y%m%d}.parquet"
+        path = os.path.join(self.root, name)
+        # Ghi ra file tạm rồi đổi tên để không bao giờ đọc phải part ghi dở
+        tmp_path = path + '.tmp'
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def sync(self, start, end, today=None):
+        """Fetch and store the settled days of [start, end] not stored yet; returns rows written"""
+        if self.connector is None:
+            return 0
+        with self._lock:
+            missing = self.missing_ranges(start, end, today)
+            if not missing:
+                return 0
+            frames = self.connector.fetch_reports([
+                (self.dimensions, self.metrics, range_start.isoformat(), range_end.isoformat())
+                for range_start, range_end in missing
+            ])
+            for (range_start, range_end), frame in zip(missing, frames):
+                self._write_part(range_start, range_end, frame)
+            return sum(len(frame) for frame in frames)
+
+    def load(self, start, end, sync=True, live=False, today=None):
+        """
+        Stored rows with a date in [start, end], syncing missing settled days
+        first. live=True also fetches the not yet settled days from GA.
+        """
+        start, end = _day(start), _day(end)
+        if sync:
+            self.sync(start, end, today)
+        frames = [
+            pd.read_parquet(path)
+            for part_start, part_end, path in self._parts()
+            if part_end >= start and part_start <= end
+        ]
+        last_settled = self.last_settled_day(today)
+        if live and self.connector is not None and end > last_settled:
+            live_start = max(start, last_settled + timedelta(days=1))
+            frames += self.connector.fetch_reports([
+                (self.dimensions, self.metrics, live_start.isoformat(), end.isoformat())
+            ])
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return self._empty_frame()
+        df = pd.concat(frames, ignore_index=True)
+        days = df['date'].dt.date
+        df = df[(days >= start) & (days <= end)]
+        return df.sort_values('date', kind='stable').reset_index(drop=True)
+
+    def daily_totals(self, start, end, **options):
+        """Metrics summed per day, indexed by 'YYYY-MM-DD' like DataAnalyzer.get_daily_visits"""
+        df = self.load(start, end, **options)
+        totals = df.groupby(df['date'].dt.strftime('%Y-%m-%d'))[self.metrics].sum()
+        totals.index.name = 'date'
+        return totals
+
+
+def store_from_env():
+    """GASnapshotStore in GA_STORE_DIR (None if unset); syncs only when GA_PROPERTY_ID is set"""
+    root = os.getenv('GA_STORE_DIR')
+    if not root:
+        return None
+    connector = None
+    if os.getenv('GA_PROPERTY_ID'):
+        from ga_integration import GoogleAnalyticsConnector
+        connector = GoogleAnalyticsConnector()
+    return GASnapshotStore(root, connector)
@@ -0,0 +1,220 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from aggregates import AGGREGATE_COLUMNS, PartialAggregates
+from rollups import RollupCube
+
+# Tăng khi thay đổi cấu trúc state để state cũ tự bị bỏ qua
+STATE_VERSION = 3
+FINGERPRINT_BYTES = 4096
+# Dòng cuối không có '\n' chỉ được coi là hoàn chỉnh khi file không đổi trong khoảng này (giây)
+STABLE_SECONDS = 1.0
+# State được lưu ngoài thư mục dữ liệu (ANALYZER_STATE_DIR)
+STATE_DIR = os.getenv('ANALYZER_STATE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'user-behaviour-analysis'))
+
+
+def default_state_path(csv_path):
+    """State file for a CSV, named by its absolute path, under STATE_DIR"""
+    absolute = os.path.abspath(csv_path)
+    digest = hashlib.sha1(absolute.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(STATE_DIR, f"{os.path.basename(absolute)}.{digest}.aggstate.npz")
+
+
+def _fingerprint(f, start, end, inode):
+    """
+    Hash the inode plus samples of the consumed bytes [start, end): the
+    head, the middle and the bytes just before `end`, so a replaced file
+    or a rewritten prefix is detected without re-reading it all
+    """
+    digest = hashlib.sha1(str(inode).encode('ascii'))
+    middle = (start + end - FINGERPRINT_BYTES) // 2
+    for offset in (start, max(start, middle), max(start, end - FINGERPRINT_BYTES)):
+        f.seek(offset)
+        digest.update(f.read(min(FINGERPRINT_BYTES, end - offset)))
+    return digest.hexdigest()
+
+
+def _text_array(values):
+    # Lưu chuỗi dạng unicode numpy để np.load không cần pickle
+    return np.asarray([str(value) for value in values], dtype=str)
+
+
+def _series_arrays(name, series):
+    index = series.index.to_numpy()
+    if index.dtype.kind not in 'iufM':
+        index = _text_array(index)
+    return {f"{name}_index": index, f"{name}_values": series.to_numpy(dtype='int64')}
+
+
+def _series_from(arrays, name):
+    return pd.Series(arrays[f"{name}_values"], index=arrays[f"{name}_index"], dtype='int64')
+
+
+PARTIAL_SERIES = ('daily_counts', 'page_counts', 'session_sums', 'session_counts')
+
+
+def _partials_arrays(partials):
+    arrays = {}
+    for name in PARTIAL_SERIES:
+        arrays.update(_series_arrays(name, getattr(partials, name)))
+    table = partials.rollups.table
+    arrays['rollup_hour'] = table['hour'].to_numpy(dtype='datetime64[ns]')
+    arrays['rollup_page_url'] = _text_array(table['page_url'])
+    arrays['rollup_event_type'] = _text_array(table['event_type'])
+    arrays['rollup_events'] = table['events'].to_numpy(dtype='int64')
+    arrays['rollup_duration_sum'] = table['duration_sum'].to_numpy(dtype='int64')
+    return arrays
+
+
+def _partials_from(arrays, rows):
+    partials = PartialAggregates()
+    for name in PARTIAL_SERIES:
+        setattr(partials, name, _series_from(arrays, name))
+    partials.rollups = RollupCube(pd.DataFrame({
+        'hour': arrays['rollup_hour'],
+        'page_url': arrays['rollup_page_url'].astype(object),
+        'event_type': arrays['rollup_event_type'].astype(object),
+        'events': arrays['rollup_events'],
+        'duration_sum': arrays['rollup_duration_sum'],
+    }))
+    partials.rows = rows
+    return partials
+
+
+class IncrementalAggregator:
+    """
+    Persisted aggregate state for an append-only CSV event log.
+
+    The state stores the PartialAggregates together with the byte offset
+    of the last complete line consumed. refresh() only parses bytes
+    appended after that offset. The state is rebuilt from scratch when the
+    file is truncated or replaced, its header changes or the sampled
+    consumed bytes no longer match.
+
+    The state is a plain .npz archive (loaded without pickle) kept outside
+    the data directory, see default_state_path.
+    """
+
+    def __init__(self, csv_path, state_path=None, chunksize=100_000):
+        self.csv_path = csv_path
+        self.state_path = state_path or default_state_path(csv_path)
+        self.chunksize = chunksize
+
+    def _load_state(self):
+        try:
+            with np.load(self.state_path, allow_pickle=False) as arrays:
+                meta = json.loads(str(arrays['meta']))
+                if meta.get('version') != STATE_VERSION:
+                    return None
+                meta['partials'] = _partials_from(arrays, meta.pop('rows'))
+        except (OSError, ValueError, KeyError):
+            return None
+        return meta
+
+    def _save_state(self, state):
+        meta = {key: value for key, value in state.items() if key != 'partials'}
+        meta['rows'] = state['partials'].rows
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        # Ghi ra file tạm rồi replace để không bao giờ để lại state hỏng
+        tmp_path = f"{self.state_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **_partials_arrays(state['partials']))
+        os.replace(tmp_path, self.state_path)
+
+    def _is_valid(self, state, f, stat, header):
+        if state is None or state['header'] != header:
+            return False
+        if stat.st_size < state['offset']:
+            # File bị truncate
+            return False
+        if state.get('unterminated'):
+            # Dòng cuối lần trước không có '\n': chỉ hợp lệ nếu phần mới bắt đầu bằng '\n'
+            # (nếu không, dòng đó đã được ghi tiếp và phải đọc lại từ đầu)
+            f.seek(state['offset'])
+            following = f.read(1)
+            if following not in (b'', b'\n', b'\r'):
+                return False
+        return _fingerprint(f, state['header_end'], state['offset'], stat.st_ino) == state['fingerprint']
+
+    def _parse(self, data, names):
+        for chunk in pd.read_csv(io.BytesIO(data), header=None, names=names,
+                                 usecols=AGGREGATE_COLUMNS, chunksize=self.chunksize):
+            chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
+            yield chunk
+
+    def _iter_new_rows(self, f, offset, names, stable):
+        """
+        Yield (chunk, end_offset, unterminated) for complete lines after `offset`.
+        When the file is stable, a last line without '\n' counts as complete.
+        """
+        block_size = max(self.chunksize * 64, 1 << 20)
+        f.seek(offset)
+        pending = b''
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            data = pending + block
+            cut = data.rfind(b'\n')
+            if cut < 0:
+                pending = data
+                continue
+            pending = data[cut + 1:]
+            complete = data[:cut + 1]
+            offset += len(complete)
+            for chunk in self._parse(complete, names):
+                yield chunk, offset, False
+        if pending.strip() and stable:
+            offset += len(pending)
+            for chunk in self._parse(pending, names):
+                yield chunk, offset, True
+        # Ngược lại dòng cuối chưa có '\n' có thể đang được ghi dở, để lần refresh sau
+
+    def refresh(self):
+        """Fold newly appended rows into the persisted state and return the aggregates"""
+        with open(self.csv_path, 'rb') as f:
+            header_line = f.readline()
+            header_end = f.tell()
+            header = next(csv.reader([header_line.decode('utf-8-sig')]))
+            stat = os.fstat(f.fileno())
+            stable = time.time() - stat.st_mtime >= STABLE_SECONDS
+
+            state = self._load_state()
+            if not self._is_valid(state, f, stat, header):
+                state = {
+                    'version': STATE_VERSION,
+                    'header': header,
+                    'header_end': header_end,
+                    'offset': header_end,
+                    'partials': PartialAggregates(),
+                }
+            start_offset = state['offset']
+            unterminated = state.get('unterminated', False)
+            if unterminated:
+                # Bỏ qua ký tự xuống dòng kết thúc dòng cuối đã đọc ở lần trước
+                f.seek(start_offset)
+                first = f.read(1)
+                if first == b'\r':
+                    start_offset += 1 + (f.read(1) == b'\n')
+                    unterminated = False
+                elif first == b'\n':
+                    start_offset += 1
+                    unterminated = False
+
+            partials = state['partials']
+            offset = start_offset
+            for chunk, offset, unterminated in self._iter_new_rows(f, start_offset, header, stable):
+                partials.update(chunk)
+
+            if offset != state['offset'] or 'fingerprint' not in state:
+                state['offset'] = offset
+                state['unterminated'] = unterminated
+                state['inode'] = stat.st_ino
+                state['fingerprint'] = _fingerprint(f, header_end, offset, stat.st_ino)
+                self._save_state(state)
+        return partials
@@ -0,0 +1,251 @@
+"""
+Lightweight stage instrumentation exported in Prometheus text format.
+
+    with stage('csv_parse') as s:
+        df = pd.read_csv(path)
+        s.rows(len(df))
+
+Each stage records its duration (histogram), rows and bytes processed, and
+its peak memory growth when tracemalloc is running (python -X tracemalloc).
+INSTRUMENTATION=0 turns every stage into a shared no-op object.
+"""
+import cProfile
+import functools
+import os
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ENABLED = os.getenv('INSTRUMENTATION', '1') != '0'
+# Profile mọi request và lưu lại những request chậm hơn ngưỡng này (ms); tắt nếu không đặt
+SLOW_REQUEST_MS = float(os.environ['PROFILE_SLOW_REQUESTS_MS']) if os.getenv('PROFILE_SLOW_REQUESTS_MS') else None
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'reports/profiles')
+# Cận trên (giây) của các bucket histogram
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Histogram:
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges (max) and duration histograms keyed by (name, labels)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._maxima = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_max(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            if value > self._maxima.get(key, float('-inf')):
+                self._maxima[key] = value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._maxima.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            maxima = sorted(self._maxima.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            lines = []
+            seen = set()
+
+            def header(name, kind):
+                if name not in seen:
+                    seen.add(name)
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+
+            for (name, labels), value in counters:
+                header(name, 'counter')
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), value in maxima:
+                header(name, 'gauge')
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), histogram in histograms:
+                header(name, 'histogram')
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', repr(float(bound))),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        if resource is not None:
+            # ru_maxrss tính bằng KB trên Linux
+            lines.append("# TYPE process_peak_rss_bytes gauge")
+            lines.append(f"process_peak_rss_bytes {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+# Registry dùng chung cho cả process
+metrics = MetricsRegistry()
+metrics.describe('stage_duration_seconds', 'Wall time of an instrumented stage')
+metrics.describe('stage_rows_total', 'Rows processed by a stage')
+metrics.describe('stage_bytes_total', 'Bytes read or written by a stage')
+metrics.describe('stage_peak_memory_bytes', 'Largest memory growth during a stage above its starting point (needs tracemalloc)')
+metrics.describe('stage_errors_total', 'Stages that raised an exception')
+
+
+# Stage đang chạy của mỗi thread, để truyền peak memory của stage con lên stage cha
+_active = threading.local()
+
+
+class _Stage:
+    __slots__ = ('labels', 'started', 'base', 'peak', 'parent')
+
+    def __init__(self, name):
+        self.labels = (('stage', name),)
+        self.base = 0
+        self.peak = 0
+        self.parent = None
+
+    def rows(self, count):
+        metrics.inc('stage_rows_total', self.labels, int(count))
+
+    def bytes(self, count):
+        metrics.inc('stage_bytes_total', self.labels, int(count))
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            # reset_peak là toàn cục: peak trước đó của stage cha được giữ lại trong parent.peak
+            self.parent = getattr(_active, 'stage', None)
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, tracemalloc.get_traced_memory()[1])
+            _active.stage = self
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics.observe('stage_duration_seconds', self.labels, time.perf_counter() - self.started)
+        if tracemalloc.is_tracing() and getattr(_active, 'stage', None) is self:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            metrics.set_max('stage_peak_memory_bytes', self.labels, self.peak - self.base)
+            _active.stage = self.parent
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, self.peak)
+        if exc_type is not None:
+            metrics.inc('stage_errors_total', self.labels)
+        return False
+
+
+class _NullStage:
+    """Shared no-op stage used when instrumentation is disabled"""
+
+    def rows(self, count):
+        pass
+
+    def bytes(self, count):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """Context manager timing one stage (no-op when instrumentation is disabled)"""
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def instrumented(name):
+    """Decorator: run the function as a stage and count the rows of a DataFrame/Series result"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as s:
+                result = func(*args, **kwargs)
+                if hasattr(result, 'shape'):
+                    s.rows(result.shape[0])
+                return result
+        return wrapper
+    return decorator
+
+
+def start_profile():
+    """Start a cProfile profiler, or return None if another profiler is already active"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: chỉ một profiler được chạy tại một thời điểm trong process
+        return None
+    return profiler
+
+
+def dump_profile(profiler, label):
+    """Write profiler stats to PROFILE_DIR (open with pstats or snakeviz); returns the path"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'request'
+    path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{name}.prof")
+    profiler.dump_stats(path)
+    metrics.inc('slow_request_profiles_total', ())
+    return path
@@ -0,0 +1,480 @@
+"""
+Real-time event ingestion with sliding-window aggregates.
+
+Accepted events go to a fixed-size ring buffer (the oldest are evicted)
+and to an append-only CSV log in the EVENT_SCHEMA layout, written in
+batches by a background thread. Each event is also folded into a
+per-minute bucket; every window (5m, 1h, 24h) keeps running totals that
+are increased on ingest and decreased when a bucket slides out, so a
+query costs O(pages + sessions in the window), never a rescan of events.
+
+Like the CSV event log, everything runs on naive server-local time: event
+timestamps with a timezone are converted to the server's timezone and
+windows end at the current local minute.
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+from instrumentation import metrics
+from storage import EVENT_COLUMNS
+
+WINDOWS = {'5m': 5, '1h': 60, '24h': 24 * 60}
+NS_PER_MINUTE = 60 * 10**9
+MINUTES_PER_DAY = 24 * 60
+# Giới hạn số event trong một request ingest
+MAX_BATCH_EVENTS = 100_000
+# Chỉ compact từ điển session khi nó lớn hơn ngưỡng này
+COMPACT_MIN_SESSIONS = 100_000
+MAX_ERRORS_REPORTED = 10
+# Event đi trước đồng hồ server quá số phút này bị từ chối
+MAX_FUTURE_SKEW_MINUTES = 5
+
+
+def _local_naive(value):
+    """One timestamp -> naive server-local time (NaT if invalid)"""
+    try:
+        timestamp = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return pd.NaT
+    if timestamp is not pd.NaT and timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(tzlocal()).tz_localize(None)
+    return timestamp
+
+
+def parse_timestamps(values):
+    """Parse event timestamps to naive server-local datetimes; invalid values become NaT"""
+    try:
+        timestamp = pd.to_datetime(values, errors='coerce', format='mixed')
+    except ValueError:
+        # Batch trộn nhiều múi giờ (hoặc có và không có múi giờ): parse từng giá trị
+        return pd.Series([_local_naive(value) for value in values], index=values.index, dtype='datetime64[ns]')
+    if timestamp.dt.tz is not None:
+        timestamp = timestamp.dt.tz_convert(tzlocal()).dt.tz_localize(None)
+    return timestamp
+
+
+def local_minute(seconds):
+    """Epoch seconds -> minutes since 1970-01-01 00:00 of the server-local wall clock"""
+    return pd.Timestamp(datetime.fromtimestamp(seconds)).value // NS_PER_MINUTE
+
+
+def parse_events(records):
+    """
+    Validate a list of event dicts against EVENT_SCHEMA.
+    Returns (typed DataFrame of valid events, list of error messages).
+    """
+    df = pd.DataFrame.from_records(records, columns=EVENT_COLUMNS)
+    user_id = pd.to_numeric(df['user_id'], errors='coerce')
+    duration = pd.to_numeric(df['event_duration'], errors='coerce')
+    timestamp = parse_timestamps(df['timestamp'])
+    strings = df[['session_id', 'page_url', 'event_type']]
+    valid = (
+        user_id.notna() & (user_id % 1 == 0)
+        & duration.notna() & (duration >= 0)
+        & timestamp.notna()
+        & strings.notna().all(axis=1)
+    )
+    errors = [
+        f"event {i}: invalid or missing fields"
+        for i in np.flatnonzero(~valid.to_numpy())[:MAX_ERRORS_REPORTED]
+    ]
+    events = pd.DataFrame({
+        'user_id': user_id[valid].astype('int64'),
+        'session_id': strings['session_id'][valid].astype(str),
+        'page_url': strings['page_url'][valid].astype(str),
+        'timestamp': timestamp[valid].astype('datetime64[ns]'),
+        'event_type': strings['event_type'][valid].astype(str),
+        'event_duration': duration[valid].astype('int64'),
+    }).reset_index(drop=True)
+    return events, errors
+
+
+class _Vocabulary:
+    """String -> dense integer code, growing as new values arrive"""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, values):
+        local_codes, uniques = pd.factorize(values)
+        codes = np.empty(len(uniques), dtype=np.int64)
+        for i, value in enumerate(uniques):
+            code = self.index.get(value)
+            if code is None:
+                code = self.index[value] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        return codes[local_codes]
+
+    def keep(self, codes):
+        """Keep only `codes` (renumbered 0..n-1 in order)"""
+        self.values = [self.values[code] for code in codes]
+        self.index = {value: code for code, value in enumerate(self.values)}
+
+
+def _grow(array, size):
+    if len(array) >= size:
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class _Bucket:
+    """Aggregates of the events of one minute"""
+    __slots__ = ('events', 'pages', 'sessions')
+
+    def __init__(self):
+        self.events = 0
+        self.pages = np.zeros(0, dtype=np.int64)
+        # Các phần (session codes duy nhất, tổng duration, số event) theo từng batch
+        self.sessions = []
+
+
+class _Window:
+    """Running totals over the buckets in [start, now] (minutes)"""
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self.start = None
+        self.reset()
+
+    def reset(self):
+        self.events = 0
+        self.pages = np.zeros(0, dtype=np.int64)
+        self.session_sum = np.zeros(0, dtype=np.int64)
+        self.session_count = np.zeros(0, dtype=np.int64)
+        self.daily = {}
+
+    def _apply_sessions(self, codes, sums, counts, sign):
+        if len(codes):
+            size = int(codes.max()) + 1
+            self.session_sum = _grow(self.session_sum, size)
+            self.session_count = _grow(self.session_count, size)
+            # codes là duy nhất trong mỗi phần nên cộng trực tiếp theo chỉ số
+            self.session_sum[codes] += sign * sums
+            self.session_count[codes] += sign * counts
+
+    def apply(self, minute, events, pages, codes, sums, counts, sign):
+        self.events += sign * events
+        self.pages = _grow(self.pages, len(pages))
+        self.pages[:len(pages)] += sign * pages
+        self._apply_sessions(codes, sums, counts, sign)
+        day = minute // MINUTES_PER_DAY
+        count = self.daily.get(day, 0) + sign * events
+        if count:
+            self.daily[day] = count
+        else:
+            self.daily.pop(day, None)
+
+    def apply_bucket(self, minute, bucket, sign):
+        """Add (sign=1) or subtract (sign=-1) a whole bucket"""
+        self.apply(minute, bucket.events, bucket.pages, np.zeros(0, dtype=np.int64), None, None, sign)
+        for codes, sums, counts in bucket.sessions:
+            self._apply_sessions(codes, sums, counts, sign)
+
+
+class _Ring:
+    """Fixed-capacity columnar buffer of the most recent events"""
+
+    @staticmethod
+    def empty():
+        return pd.DataFrame({
+            'user_id': np.zeros(0, dtype=np.int64),
+            'session_id': np.empty(0, dtype=object),
+            'page_url': np.empty(0, dtype=object),
+            'timestamp': np.zeros(0, dtype='datetime64[ns]'),
+            'event_type': np.empty(0, dtype=object),
+            'event_duration': np.zeros(0, dtype=np.int64),
+        })
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.head = 0
+        self.size = 0
+        self.columns = {
+            'user_id': np.zeros(capacity, dtype=np.int64),
+            'session_id': np.empty(capacity, dtype=object),
+            'page_url': np.empty(capacity, dtype=object),
+            'timestamp': np.zeros(capacity, dtype='datetime64[ns]'),
+            'event_type': np.empty(capacity, dtype=object),
+            'event_duration': np.zeros(capacity, dtype=np.int64),
+        }
+
+    def append(self, df):
+        if len(df) > self.capacity:
+            df = df.iloc[-self.capacity:]
+        positions = (self.head + np.arange(len(df))) % self.capacity
+        for name, column in self.columns.items():
+            column[positions] = df[name].to_numpy()
+        self.head = (self.head + len(df)) % self.capacity
+        self.size = min(self.size + len(df), self.capacity)
+
+    def recent(self, limit):
+        """The last `limit` events, newest first"""
+        positions = (self.head - 1 - np.arange(min(limit, self.size))) % self.capacity
+        return pd.DataFrame({name: column[positions] for name, column in self.columns.items()})
+
+
+class _EventLog:
+    """Append-only CSV log written in batches by a background thread"""
+
+    def __init__(self, path, flush_rows=10_000, flush_interval=1.0):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._pending_rows = 0
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='event-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, df):
+        with self._condition:
+            self._pending.append(df)
+            self._pending_rows += len(df)
+            if self._pending_rows >= self.flush_rows:
+                self._condition.notify()
+
+    def flush(self):
+        with self._condition:
+            frames, self._pending, self._pending_rows = self._pending, [], 0
+        if not frames:
+            return 0
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        try:
+            with self._write_lock:
+                write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                df.to_csv(self.path, mode='a', header=write_header, index=False,
+                          date_format='%Y-%m-%d %H:%M:%S')
+        except OSError:
+            # Giữ lại các event chưa ghi được để lần flush sau thử lại
+            with self._condition:
+                self._pending.insert(0, df)
+                self._pending_rows += len(df)
+            raise
+        return len(df)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and self._pending_rows < self.flush_rows:
+                    self._condition.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+            except OSError:
+                metrics.inc('live_log_write_errors_total', ())
+            if closed:
+                return
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+
+class LiveAggregator:
+    """
+    Ingests event batches and answers daily visits, top pages and session
+    duration queries over sliding windows (see WINDOWS).
+
+    Windows end at the current server-local minute. Events older than the
+    largest window are logged and buffered but not aggregated; events more
+    than max_future_skew minutes ahead of the clock are rejected.
+    The ring buffer and the log writer thread are only created by the
+    first ingest, so constructing an aggregator costs nothing.
+    """
+
+    def __init__(self, capacity=100_000, log_path=None, flush_rows=10_000, flush_interval=1.0,
+                 windows=WINDOWS, clock=time.time, max_future_skew=MAX_FUTURE_SKEW_MINUTES):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.capacity = capacity
+        self.max_future_skew = max_future_skew
+        self._ring = None
+        self._log_options = (log_path, flush_rows, flush_interval)
+        self._log = None
+        self._pages = _Vocabulary()
+        self._sessions = _Vocabulary()
+        self._windows = {name: _Window(minutes) for name, minutes in windows.items()}
+        self._retention = max(windows.values())
+        self._buckets = {}
+        self._minute = None
+        self.total_events = 0
+
+    def _now_minute(self):
+        return local_minute(self._clock())
+
+    def _advance(self, now):
+        """Slide every window so it ends at minute `now`, subtracting expired buckets"""
+        if now == self._minute:
+            return
+        self._minute = now
+        for window in self._windows.values():
+            start = now - window.minutes + 1
+            if window.start is not None and start > window.start:
+                if start - window.start >= window.minutes:
+                    # Cả cửa sổ đã trôi qua: tính lại từ các bucket còn thuộc cửa sổ mới
+                    # (bucket đi trước đồng hồ trong giới hạn max_future_skew)
+                    window.reset()
+                    for minute, bucket in self._buckets.items():
+                        if minute >= start:
+                            window.apply_bucket(minute, bucket, 1)
+                else:
+                    for minute in range(window.start, start):
+                        bucket = self._buckets.get(minute)
+                        if bucket is not None:
+                            window.apply_bucket(minute, bucket, -1)
+            window.start = start
+        oldest = now - self._retention + 1
+        for minute in [m for m in self._buckets if m < oldest]:
+            del self._buckets[minute]
+        if len(self._sessions) > COMPACT_MIN_SESSIONS:
+            self._compact_sessions()
+
+    def _compact_sessions(self):
+        """Forget sessions no longer present in any bucket (keeps the vocabulary bounded)"""
+        widest = max(self._windows.values(), key=lambda window: window.minutes)
+        counts = _grow(widest.session_count, len(self._sessions))[:len(self._sessions)]
+        active = np.flatnonzero(counts > 0)
+        if len(active) * 4 > len(self._sessions):
+            return
+        mapping = np.full(len(self._sessions), -1, dtype=np.int64)
+        mapping[active] = np.arange(len(active))
+        self._sessions.keep(active)
+        for window in self._windows.values():
+            window.session_sum = _grow(window.session_sum, len(mapping))[active]
+            window.session_count = _grow(window.session_count, len(mapping))[active]
+        for bucket in self._buckets.values():
+            bucket.sessions = [(mapping[codes], sums, counts) for codes, sums, counts in bucket.sessions]
+
+    def ingest(self, events):
+        """
+        Add a validated batch (see parse_events); returns the number of
+        events accepted (events too far in the future are dropped)
+        """
+        if events.empty:
+            return 0
+        minutes = events['timestamp'].to_numpy(dtype='datetime64[ns]').view('int64') // NS_PER_MINUTE
+        with self._lock:
+            now = self._now_minute()
+            ahead = minutes > now + self.max_future_skew
+            if ahead.any():
+                events = events[~ahead].reset_index(drop=True)
+                minutes = minutes[~ahead]
+                if events.empty:
+                    return 0
+            if self._ring is None:
+                self._ring = _Ring(self.capacity)
+            log_path, flush_rows, flush_interval = self._log_options
+            if self._log is None and log_path:
+                self._log = _EventLog(log_path, flush_rows, flush_interval)
+            if self._log is not None:
+                self._log.append(events)
+            self._ring.append(events)
+            self.total_events += len(events)
+            self._advance(now)
+            page_codes = self._pages.encode(events['page_url'].to_numpy())
+            session_codes = self._sessions.encode(events['session_id'].to_numpy())
+            durations = events['event_duration'].to_numpy(dtype=np.int64)
+
+            # Sắp xếp một lần theo phút rồi xử lý từng đoạn liên tiếp cùng phút
+            order = np.argsort(minutes, kind='stable')
+            minutes, page_codes = minutes[order], page_codes[order]
+            session_codes, durations = session_codes[order], durations[order]
+            boundaries = np.flatnonzero(np.diff(minutes)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(minutes)]))
+            oldest = now - self._retention + 1
+            for start, end in zip(starts, ends):
+                minute = int(minutes[start])
+                if minute < oldest:
+                    continue
+                pages = np.bincount(page_codes[start:end], minlength=len(self._pages))
+                codes, inverse = np.unique(session_codes[start:end], return_inverse=True)
+                sums = np.bincount(inverse, weights=durations[start:end]).astype(np.int64)
+                counts = np.bincount(inverse).astype(np.int64)
+                events_in_minute = int(end - start)
+
+                bucket = self._buckets.get(minute)
+                if bucket is None:
+                    bucket = self._buckets[minute] = _Bucket()
+                bucket.events += events_in_minute
+                bucket.pages = _grow(bucket.pages, len(pages))
+                bucket.pages[:len(pages)] += pages
+                bucket.sessions.append((codes, sums, counts))
+                for window in self._windows.values():
+                    if minute >= window.start:
+                        window.apply(minute, events_in_minute, pages, codes, sums, counts, 1)
+        return len(events)
+
+    def session_durations(self, window='5m'):
+        """Mean event duration per session in the window (like get_avg_session_duration)"""
+        with self._lock:
+            self._advance(self._now_minute())
+            totals = self._windows[window]
+            active = np.flatnonzero(totals.session_count > 0)
+            means = totals.session_sum[active] / totals.session_count[active]
+            names = [self._sessions.values[code] for code in active]
+        return pd.Series(means, index=pd.Index(names, name='session_id'), name='event_duration').sort_index()
+
+    def summary(self, window='5m', n=5):
+        """Events, daily visits, top pages and session durations over one window"""
+        if window not in self._windows:
+            raise ValueError(f"window must be one of {', '.join(self._windows)}")
+        with self._lock:
+            self._advance(self._now_minute())
+            totals = self._windows[window]
+            order = np.argsort(-totals.pages, kind='stable')[:n]
+            top_pages = {self._pages.values[code]: int(totals.pages[code]) for code in order if totals.pages[code] > 0}
+            counts = totals.session_count
+            active = counts > 0
+            means = totals.session_sum[active] / counts[active]
+            daily = sorted(totals.daily.items())
+            start = totals.start
+        return {
+            'window': window,
+            'start': pd.Timestamp(start * NS_PER_MINUTE).isoformat(),
+            'events': int(totals.events),
+            'daily_visits': {
+                pd.Timestamp(day * MINUTES_PER_DAY * NS_PER_MINUTE).strftime('%Y-%m-%d'): int(count)
+                for day, count in daily
+            },
+            'top_pages': top_pages,
+            'sessions': int(active.sum()),
+            'avg_session_duration': float(means.mean()) if len(means) else None,
+        }
+
+    def recent(self, limit=100):
+        with self._lock:
+            if self._ring is None:
+                return _Ring.empty()
+            return self._ring.recent(limit)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'total_events': self.total_events,
+                'buffered': self._ring.size if self._ring is not None else 0,
+                'capacity': self.capacity,
+                'buckets': len(self._buckets),
+                'sessions_tracked': len(self._sessions),
+            }
+
+    def flush(self):
+        return self._log.flush() if self._log is not None else 0
@@ -0,0 +1,74 @@
+import os
+from aggregates import PartialAggregates, aggregate_file
+from cohorts import activity_file
+from incremental import IncrementalAggregator
+from pools import process_pool
+from sketches import sketch_file
+from storage import storage_format
+
+
+def aggregate_partition(path, chunksize=100_000, incremental=False):
+    """Pre-aggregate a single partition (runs inside a worker process)"""
+    if incremental and storage_format(path) == 'csv':
+        return IncrementalAggregator(path, chunksize=chunksize).refresh()
+    return aggregate_file(path, chunksize)
+
+
+def _sketch_partition(path, chunksize, options):
+    return sketch_file(path, chunksize, **options)
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def aggregate_partitions(paths, chunksize=100_000, workers=None, incremental=False):
+    """
+    Aggregate partition files with a process pool and merge the partial results.
+
+    Each worker parses and pre-aggregates whole partitions; the parent only
+    merges (day, page, session) partials, in the same order as `paths`, so
+    the result is identical to processing the partitions one by one.
+    """
+    workers = min(workers or default_workers(), len(paths))
+    if workers <= 1:
+        parts = [aggregate_partition(path, chunksize, incremental) for path in paths]
+    else:
+        with process_pool(workers) as pool:
+            parts = list(pool.map(
+                aggregate_partition,
+                paths,
+                [chunksize] * len(paths),
+                [incremental] * len(paths),
+            ))
+    return PartialAggregates.combine(parts)
+
+
+def sketch_partitions(paths, chunksize=100_000, workers=None, **options):
+    """Build ApproximateAggregates per partition (in a process pool) and merge them"""
+    workers = min(workers or default_workers(), len(paths))
+    if workers <= 1:
+        parts = [sketch_file(path, chunksize, **options) for path in paths]
+    else:
+        with process_pool(workers) as pool:
+            parts = list(pool.map(
+                _sketch_partition, paths, [chunksize] * len(paths), [options] * len(paths)
+            ))
+    sketch = parts[0]
+    for part in parts[1:]:
+        sketch.merge(part)
+    return sketch
+
+
+def activity_partitions(paths, chunksize=100_000, workers=None):
+    """Reduce each partition to a UserActivity (in a process pool) and merge them"""
+    workers = min(workers or default_workers(), len(paths))
+    if workers <= 1:
+        parts = [activity_file(path, chunksize) for path in paths]
+    else:
+        with process_pool(workers) as pool:
+            parts = list(pool.map(activity_file, paths, [chunksize] * len(paths)))
+    activity = parts[0]
+    for part in parts[1:]:
+        activity.merge(part)
+    return activity.compact()
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+# Funnel mặc định theo luồng mua hàng điển hình
+DEFAULT_FUNNEL = ['/home', '/products', '/product-detail', '/cart', '/checkout']
+
+
+class _Paths:
+    """
+    Events sorted by (session, timestamp) with sessions and pages as integer codes.
+    All path computations below work on these arrays without per-row Python loops.
+    """
+
+    def __init__(self, df):
+        # Event thiếu trang hoặc phiên không thuộc đường đi nào (factorize mã hóa NaN thành -1)
+        missing = df['page_url'].isna() | df['session_id'].isna()
+        if missing.any():
+            df = df[~missing]
+        session_codes, self.sessions = pd.factorize(df['session_id'], sort=False)
+        page_codes, self.pages = pd.factorize(df['page_url'], sort=False)
+        timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]').view('int64')
+        # lexsort ổn định, khóa cuối là khóa chính
+        order = np.lexsort((timestamps, session_codes))
+        self.session = session_codes[order]
+        self.page = page_codes[order]
+        self.pages = np.asarray(self.pages, dtype=object)
+        self.sessions = np.asarray(self.sessions, dtype=object)
+
+        # Vị trí đầu/cuối của mỗi phiên trong mảng đã sắp xếp
+        boundary = np.ones(len(self.session), dtype=bool)
+        boundary[1:] = self.session[1:] != self.session[:-1]
+        self.first = np.flatnonzero(boundary)
+        self.last = np.append(self.first[1:] - 1, len(self.session) - 1) if len(self.first) else self.first
+
+    def page_code(self, page):
+        matches = np.flatnonzero(self.pages == page)
+        return matches[0] if len(matches) else -1
+
+
+def sessionize(df, gap='30min'):
+    """
+    Re-assign session_id by inactivity: a new session starts when a user's
+    next event comes more than `gap` after the previous one.
+    Returns a copy of df with session_id = '<user_id>_<n>'.
+    """
+    gap = pd.Timedelta(gap).value
+    user_codes, _ = pd.factorize(df['user_id'])
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]').view('int64')
+    order = np.lexsort((timestamps, user_codes))
+
+    users = user_codes[order]
+    times = timestamps[order]
+    new_session = np.ones(len(order), dtype=bool)
+    new_session[1:] = (users[1:] != users[:-1]) | (np.diff(times) > gap)
+    session_numbers = np.cumsum(new_session)
+
+    session_ids = np.empty(len(order), dtype=np.int64)
+    session_ids[order] = session_numbers
+    result = df.copy()
+    result['session_id'] = df['user_id'].astype(str).to_numpy() + '_' + session_ids.astype(str)
+    return result
+
+
+def funnel(df, steps=DEFAULT_FUNNEL):
+    """
+    Ordered step funnel: a session reaches step i if it visits steps[0..i]
+    in that order (other pages may appear in between).
+    """
+    paths = _Paths(df)
+    positions = np.arange(len(paths.page))
+    n_sessions = len(paths.sessions)
+    # reached[s]: vị trí sự kiện thỏa bước hiện tại của phiên s (-1 nếu chưa tới)
+    reached = np.full(n_sessions, -1, dtype=np.int64)
+    counts = []
+    for i, step in enumerate(steps):
+        mask = paths.page == paths.page_code(step)
+        sessions = paths.session[mask]
+        pos = positions[mask]
+        prev = reached[sessions]
+        valid = (prev >= 0) & (pos > prev) if i > 0 else np.ones(len(pos), dtype=bool)
+        # Mảng đã sắp xếp theo (phiên, thời gian) nên lần xuất hiện đầu là sớm nhất
+        first_sessions, first_index = np.unique(sessions[valid], return_index=True)
+        reached = np.full(n_sessions, -1, dtype=np.int64)
+        reached[first_sessions] = pos[valid][first_index]
+        counts.append(len(first_sessions))
+
+    result = pd.DataFrame({'step': range(1, len(steps) + 1), 'page_url': list(steps), 'sessions': counts})
+    first = result['sessions'].iloc[0] if len(result) else 0
+    result['conversion_rate'] = result['sessions'] / first if first else 0.0
+    previous = result['sessions'].shift(1, fill_value=first)
+    result['step_conversion'] = np.where(previous > 0, result['sessions'] / previous.where(previous > 0, 1), 0.0)
+    return result
+
+
+def _transition_pairs(paths):
+    """
+    Distinct (page, next page) pairs within sessions and their counts.
+    Pairs are encoded as one int64 key, so no dense page x page matrix is needed.
+    """
+    same_session = paths.session[1:] == paths.session[:-1]
+    n_pages = len(paths.pages)
+    keys = paths.page[:-1][same_session].astype(np.int64) * n_pages + paths.page[1:][same_session]
+    keys, counts = np.unique(keys, return_counts=True)
+    source, target = np.divmod(keys, n_pages)
+    totals = np.bincount(source, weights=counts, minlength=n_pages)
+    return source, target, counts, counts / totals[source]
+
+
+def transitions(df, k=10):
+    """Top-k page -> next page transitions within sessions, with next-page probability"""
+    if k < 1:
+        raise ValueError("k must be a positive integer")
+    paths = _Paths(df)
+    source, target, counts, probabilities = _transition_pairs(paths)
+    # Sắp xếp ổn định theo count giảm dần
+    top = np.argsort(-counts, kind='stable')[:k]
+    return pd.DataFrame({
+        'from_page': paths.pages[source[top]],
+        'to_page': paths.pages[target[top]],
+        'count': counts[top],
+        'probability': probabilities[top],
+    })
+
+
+def next_page_probabilities(df, page=None):
+    """
+    Matrix of P(next page | current page). If `page` is given, return the
+    distribution for that page only, most likely first.
+    """
+    paths = _Paths(df)
+    source, target, _, probabilities = _transition_pairs(paths)
+    if page is not None:
+        mask = source == paths.page_code(page)
+        result = pd.Series(probabilities[mask], index=pd.Index(paths.pages[target[mask]], name='next_page'), name=page)
+        return result.sort_values(ascending=False, kind='stable')
+
+    n_pages = len(paths.pages)
+    matrix = np.zeros((n_pages, n_pages))
+    matrix[source, target] = probabilities
+    result = pd.DataFrame(matrix, index=paths.pages, columns=paths.pages)
+    result.index.name = 'page_url'
+    result.columns.name = 'next_page'
+    return result
+
+
+def entry_exit_pages(df):
+    """Number of sessions entering and exiting on each page"""
+    paths = _Paths(df)
+    n_pages = len(paths.pages)
+    entries = np.bincount(paths.page[paths.first], minlength=n_pages)
+    exits = np.bincount(paths.page[paths.last], minlength=n_pages)
+    result = pd.DataFrame({'entries': entries, 'exits': exits}, index=pd.Index(paths.pages, name='page_url'))
+    result['entry_rate'] = result['entries'] / max(len(paths.first), 1)
+    result['exit_rate'] = result['exits'] / max(len(paths.first), 1)
+    return result.sort_values('entries', ascending=False, kind='stable')
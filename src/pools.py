@@ -0,0 +1,21 @@
+"""
+Process pools shared by the partition aggregation and the chart renderer.
+
+Workers are started with POOL_START_METHOD ('spawn' by default): the API
+process runs threads (request handlers, the live event-log writer), and
+forking a threaded process can deadlock the child on a lock that was held
+by another thread at fork time.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# 'spawn' hoặc 'forkserver'; 'fork' chỉ an toàn khi process không có thread nào khác
+POOL_START_METHOD = os.getenv('POOL_START_METHOD', 'spawn')
+
+
+def process_pool(max_workers):
+    """ProcessPoolExecutor whose workers start with POOL_START_METHOD"""
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context(POOL_START_METHOD)
+    )
@@ -1,73 +1,164 @@
+import os
+import threading
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
 import io
+from types import MappingProxyType
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+import reportlab
 from data_analysis import DataAnalyzer
+from instrumentation import instrumented, stage
+from exports import analysis_tables, write_excel
+import charts
+
+# Các percentile hiển thị trong phần phân bố thời gian phiên
+SESSION_PERCENTILES = [0.25, 0.5, 0.75, 0.9, 0.99]
+
+# Tên font dùng trong PDF, đăng ký một lần cho cả process
+FONT_NAME = 'ReportFont'
+# Font có dấu tiếng Việt, thử lần lượt sau REPORT_FONT_PATH
+FONT_CANDIDATES = [
+    'C:/Windows/Fonts/Calibri.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
+    '/System/Library/Fonts/Supplemental/Arial.ttf',
+]
+# Vera đi kèm reportlab nên luôn có, nhưng thiếu một số ký tự tiếng Việt
+BUNDLED_FONT = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'Vera.ttf')
+
+_font_lock = threading.Lock()
+_font_path = None
+
+
+def register_font():
+    """
+    Register FONT_NAME once per process and return the font file used:
+    REPORT_FONT_PATH if set, else the first FONT_CANDIDATES entry that
+    loads, else reportlab's bundled Vera
+    """
+    global _font_path
+    with _font_lock:
+        if _font_path is not None:
+            return _font_path
+        configured = os.getenv('REPORT_FONT_PATH')
+        if configured:
+            # Font được cấu hình rõ ràng: báo lỗi thay vì lặng lẽ dùng font khác
+            pdfmetrics.registerFont(TTFont(FONT_NAME, configured))
+            _font_path = configured
+            return _font_path
+        for path in FONT_CANDIDATES + [BUNDLED_FONT]:
+            if not os.path.exists(path):
+                continue
+            try:
+                pdfmetrics.registerFont(TTFont(FONT_NAME, path))
+            except TTFError:
+                continue
+            _font_path = path
+            break
+        return _font_path
 
 class ReportGenerator:
-    def __init__(self, csv_file):
-        # Register font
-        pdfmetrics.registerFont(TTFont('Calibri', 'C:/Windows/Fonts/Calibri.ttf'))
+    def __init__(self, csv_file, analyzer=None, layout='compact', max_rows=50, histogram_bins=10,
+                 chart_renderer=None, version=None, cohort_freq='week', cohort_periods=8):
+        """
+        layout: 'compact' renders tables with at most `max_rows` rows plus
+        distribution summaries; 'full' lists every day and session
+        cohort_freq, cohort_periods: cohorts by first-seen 'day' or 'week',
+        showing retention for that many periods
+        chart_renderer: ChartRenderer used for the charts (default: charts.renderer)
+        version: dataset version; when given, rendered charts are cached under it
+        """
+        self.csv_file = csv_file
+        self.chart_renderer = chart_renderer if chart_renderer is not None else charts.renderer
+        self.version = version
+        if layout not in ('compact', 'full'):
+            raise ValueError(f"Unknown report layout: {layout}")
+        self.layout = layout
+        self.max_rows = max_rows
+        self.histogram_bins = histogram_bins
+        self.cohort_freq = cohort_freq
+        self.cohort_periods = cohort_periods
+
+        register_font()
         
-        self.analyzer = DataAnalyzer(csv_file)
+        # Cho phép dùng lại analyzer đã cache (vd. từ AnalyzerRegistry)
+        self.analyzer = analyzer if analyzer is not None else DataAnalyzer(csv_file)
         
         self.styles = getSampleStyleSheet()
         
         # Customize style with font
-        self.styles['Normal'].fontName = 'Calibri'
-        self.styles['Heading1'].fontName = 'Calibri'
-        self.styles['Heading2'].fontName = 'Calibri'
+        self.styles['Normal'].fontName = FONT_NAME
+        self.styles['Heading1'].fontName = FONT_NAME
+        self.styles['Heading2'].fontName = FONT_NAME
+
+        # Style dùng chung, không tạo mới cho từng dòng
+        self.styles.add(ParagraphStyle(
+            'Indented',
+            parent=self.styles['Normal'],
+            leftIndent=30
+        ))
+        self.table_style = TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), FONT_NAME),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+            ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+        ])
         
         self.elements = []
 
+    @instrumented('report.analyze')
     def analyze_data(self):
-        """Enhanced data analysis"""
+        """Enhanced data analysis, returned as a read-only snapshot"""
         analysis = {
             'daily_visits': self.analyzer.get_daily_visits(),
             'top_pages': self.analyzer.get_top_pages(),
             'avg_session_duration': self.analyzer.get_avg_session_duration(),
+            'retention': self.analyzer.get_retention(self.cohort_freq, max_periods=self.cohort_periods),
+            'user_summary': self.analyzer.get_user_summary(),
         }
+        if getattr(self.analyzer, 'ga_store', None) is not None:
+            # Số liệu GA lấy từ snapshot cục bộ, cùng khoảng ngày với event log
+            analysis['daily_overview'] = self.analyzer.get_daily_overview()
         
-        return analysis
+        return MappingProxyType(analysis)
 
-    def create_visualizations(self):
-        """Enhanced visualizations"""
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 13))
-        
-        # Plot daily visits
-        daily_visits = self.analyze_data()['daily_visits']
-        daily_visits.plot(kind='line', ax=ax1)
-        ax1.set_title("Daily Visits")
-        ax1.set_xlabel("Date")
-        ax1.set_ylabel("Visit Count")
-        ax1.tick_params(axis='x', rotation=45)
-        
-        # Plot top pages
-        top_pages = self.analyze_data()['top_pages']
-        top_pages.plot(kind='bar', ax=ax2)
-        ax2.set_title("Top 5 Most Visited Pages")
-        ax2.set_xlabel("Page URL")
-        ax2.set_ylabel("Visit Count")
-        ax2.tick_params(axis='x', rotation=45)
-        
-        # Điều chỉnh khoảng cách và layout
-        plt.subplots_adjust(hspace=0.5)  # Đặt trước khi lưu
-        
-        # Save plot to buffer
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, bbox_inches='tight')
-        img_buffer.seek(0)
-        return img_buffer
+    @instrumented('report.charts')
+    def create_visualizations(self, analysis=None):
+        """Daily visits and top pages charts in one PNG, returned as a buffer (cached per dataset version)"""
+        if analysis is None:
+            analysis = self.analyze_data()
+        image = self.chart_renderer.render_stacked({
+            'daily_visits': analysis['daily_visits'],
+            'top_pages': analysis['top_pages'],
+        }, version=self.version, source=self.csv_file)
+        return io.BytesIO(image)
+
+    @instrumented('report.charts')
+    def chart_images(self, analysis=None):
+        """The report charts as separate PNG buffers, rendered in parallel when the renderer has workers"""
+        if analysis is None:
+            analysis = self.analyze_data()
+        images = self.chart_renderer.render({
+            'daily_visits': analysis['daily_visits'],
+            'top_pages': analysis['top_pages'],
+        }, version=self.version, source=self.csv_file)
+        return {chart_type: io.BytesIO(image) for chart_type, image in images.items()}
 
-    def generate_recommendations(self):
+    def generate_recommendations(self, analysis=None):
         """Generate recommendations based on analysis"""
-        daily_visits = self.analyze_data()['daily_visits']
-        top_pages = self.analyze_data()['top_pages']
+        if analysis is None:
+            analysis = self.analyze_data()
+        daily_visits = analysis['daily_visits']
+        top_pages = analysis['top_pages']
         
         # Format daily visits details
         daily_visits_details = "\n".join([f"- Ngày {date}: {count} lượt truy cập" 
@@ -99,7 +190,112 @@ class ReportGenerator:
         
         return recommendations
 
-    def create_report(self):
+    def _add_table(self, header, rows, col_widths=None):
+        """Append a paginated table of at most max_rows rows, noting any omitted rows"""
+        data = [header]
+        omitted = 0
+        for i, row in enumerate(rows):
+            if i >= self.max_rows:
+                omitted += 1
+                continue
+            data.append([self._format_cell(value) for value in row])
+        # repeatRows=1: lặp lại header khi bảng sang trang mới
+        self.elements.append(Table(data, colWidths=col_widths, repeatRows=1, style=self.table_style, hAlign='LEFT'))
+        if omitted:
+            self.elements.append(Paragraph(
+                f"... và {omitted} dòng khác (xem file chi tiết)",
+                self.styles['Indented']
+            ))
+
+    @staticmethod
+    def _format_cell(value):
+        if value is None:
+            return "-"
+        if isinstance(value, (float, np.floating)):
+            return f"{value:.2f}"
+        return str(value)
+
+    def _add_session_summary(self, session_durations):
+        """Percentiles, histogram and longest sessions instead of one line per session"""
+        if session_durations.empty:
+            return
+        values = session_durations.to_numpy(dtype='float64')
+
+        self.elements.append(Paragraph("Phân bố thời gian phiên (giây):", self.styles['Normal']))
+        quantiles = np.quantile(values, SESSION_PERCENTILES)
+        summary = [("Trung bình", values.mean()), ("Nhỏ nhất", values.min())]
+        summary += [(f"P{int(q * 100)}", v) for q, v in zip(SESSION_PERCENTILES, quantiles)]
+        summary.append(("Lớn nhất", values.max()))
+        self._add_table(["Chỉ số", "Giây"], summary)
+        self.elements.append(Spacer(1, 8))
+
+        counts, edges = np.histogram(values, bins=self.histogram_bins)
+        histogram = [
+            (f"{edges[i]:.0f} - {edges[i + 1]:.0f}", int(count), f"{count / len(values) * 100:.1f}%")
+            for i, count in enumerate(counts)
+        ]
+        self._add_table(["Khoảng (giây)", "Số phiên", "Tỉ lệ"], histogram)
+        self.elements.append(Spacer(1, 8))
+
+        self.elements.append(Paragraph("Các phiên dài nhất:", self.styles['Normal']))
+        self._add_table(["Phiên", "Giây"], session_durations.nlargest(self.max_rows).items())
+
+    def _add_retention(self, retention, user_summary):
+        """User totals plus the cohort retention matrix as percentages of each cohort"""
+        if not user_summary['users']:
+            return
+        self.elements.append(Paragraph(
+            f"Tổng số người dùng: {user_summary['users']}, quay lại: {user_summary['returning_users']} "
+            f"({user_summary['returning_rate'] * 100:.1f}%), trung bình {user_summary['avg_sessions_per_user']:.2f} "
+            f"phiên và {user_summary['avg_dwell_seconds']:.0f} giây mỗi người dùng",
+            self.styles['Normal']
+        ))
+        unit = "Tuần" if self.cohort_freq == 'week' else "Ngày"
+        rates = retention.div(retention[0], axis=0) * 100
+        rows = (
+            [cohort, int(size)] + [f"{rate:.1f}%" for rate in values[1:]]
+            for cohort, size, values in zip(retention.index, retention[0], rates.to_numpy())
+        )
+        self._add_table(["Cohort", "Người dùng"] + [f"{unit} {k}" for k in retention.columns[1:]], rows)
+
+    def export_details(self, output_path, analysis=None):
+        """Write the full per-day and per-session data to a CSV or .xlsx file"""
+        extension = os.path.splitext(output_path)[1].lower()
+        if extension == '.xls':
+            raise ValueError("Legacy .xls is not supported, use .xlsx")
+        if analysis is None:
+            analysis = self.analyze_data()
+        session_durations = analysis['avg_session_duration'].rename('duration_seconds')
+        if extension == '.xlsx':
+            tables = analysis_tables(analysis['daily_visits'], analysis['top_pages'], analysis['avg_session_duration'])
+            del tables['Top Pages']
+            # Ghi streaming, tự tách sheet khi vượt giới hạn dòng của Excel
+            write_excel(tables, output_path)
+        else:
+            # CSV chỉ có một bảng: chi tiết theo phiên
+            session_durations.to_csv(output_path)
+        return output_path
+
+    @instrumented('report.create')
+    def create_report(self, progress=None, detail_path=None):
+        """
+        Build the PDF and return its bytes.
+        progress: optional callback receiving the completed fraction (0..1)
+        detail_path: if set, also write the full detail there (see export_details)
+        """
+        def report_progress(fraction):
+            if progress is not None:
+                progress(fraction)
+
+        # Mỗi lần build bắt đầu với danh sách element mới
+        self.elements = []
+
+        # Tính analysis một lần và dùng chung cho mọi phần của report
+        analysis = self.analyze_data()
+        if detail_path is not None:
+            self.export_details(detail_path, analysis)
+        report_progress(0.2)
+
         # Tạo buffer để lưu PDF
         buffer = io.BytesIO()
         
@@ -119,13 +315,12 @@ class ReportGenerator:
             fontSize=24,
             spaceAfter=30,
             alignment=1,
-            fontName='Calibri'
+            fontName=FONT_NAME
         )
         self.elements.append(Paragraph("BÁO CÁO PHÂN TÍCH DỮ LIỆU", title_style))
         self.elements.append(Spacer(1, 20))
 
         # Detailed analysis section
-        analysis = self.analyze_data()
         self.elements.append(Paragraph("1. Kết Quả Phân Tích", self.styles['Heading1']))
         
         # Daily visits
@@ -135,29 +330,27 @@ class ReportGenerator:
             self.styles['Normal']
         ))
         daily_visits = analysis['daily_visits']
-        for date, count in daily_visits.items():
-            self.elements.append(Paragraph(
-                f"• {date}: {count} lượt truy cập",
-                ParagraphStyle(
-                    'Indented',
-                    parent=self.styles['Normal'],
-                    leftIndent=30
-                )
-            ))
+        if self.layout == 'full':
+            for date, count in daily_visits.items():
+                self.elements.append(Paragraph(
+                    f"• {date}: {count} lượt truy cập",
+                    self.styles['Indented']
+                ))
+        else:
+            self._add_table(["Ngày", "Lượt truy cập"], daily_visits.items())
         self.elements.append(Spacer(1, 12))
 
         # Top pages
         self.elements.append(Paragraph("1.2 Trang được truy cập nhiều nhất", self.styles['Heading2']))
         top_pages = analysis['top_pages']
-        for url, count in top_pages.items():
-            self.elements.append(Paragraph(
-                f"• {url}: {count} lượt truy cập",
-                ParagraphStyle(
-                    'Indented',
-                    parent=self.styles['Normal'],
-                    leftIndent=30
-                )
-            ))
+        if self.layout == 'full':
+            for url, count in top_pages.items():
+                self.elements.append(Paragraph(
+                    f"• {url}: {count} lượt truy cập",
+                    self.styles['Indented']
+                ))
+        else:
+            self._add_table(["Trang", "Lượt truy cập"], top_pages.items())
         self.elements.append(Spacer(1, 12))
         
         # Average session duration
@@ -167,44 +360,64 @@ class ReportGenerator:
             f"Tổng số phiên: {len(session_durations)}",
             self.styles['Normal']
         ))
-        for session_id, duration in session_durations.items():
+        if self.layout == 'full':
+            for session_id, duration in session_durations.items():
+                self.elements.append(Paragraph(
+                    f"• Phiên {session_id}: {duration:.2f} giây",
+                    self.styles['Indented']
+                ))
+        else:
+            self._add_session_summary(session_durations)
+        self.elements.append(Spacer(1, 12))
+
+        daily_overview = analysis.get('daily_overview')
+        if daily_overview is not None:
+            self.elements.append(Paragraph("1.4 Google Analytics theo ngày", self.styles['Heading2']))
+            totals = daily_overview.sum()
             self.elements.append(Paragraph(
-                f"• Phiên {session_id}: {duration:.2f} giây",
-                ParagraphStyle(
-                    'Indented',
-                    parent=self.styles['Normal'],
-                    leftIndent=30
-                )
+                ", ".join(f"{column}: {totals[column]:,.0f}" for column in daily_overview.columns),
+                self.styles['Normal']
             ))
+            rows = (
+                [date] + [None if pd.isna(value) else value for value in values]
+                for date, values in zip(daily_overview.index, daily_overview.to_numpy(dtype=object))
+            )
+            self._add_table(["Ngày"] + list(daily_overview.columns), rows)
+            self.elements.append(Spacer(1, 12))
+
+        section = "1.5" if daily_overview is not None else "1.4"
+        self.elements.append(Paragraph(f"{section} Người dùng quay lại theo cohort", self.styles['Heading2']))
+        self._add_retention(analysis['retention'], analysis['user_summary'])
         self.elements.append(Spacer(1, 12))
 
+        report_progress(0.4)
+
         # Visualization section
         self.elements.append(Paragraph("2. Trực Quan Hóa Dữ Liệu", self.styles['Heading1']))
-        img_buffer = self.create_visualizations()
-        img = Image(img_buffer, width=15*cm, height=20*cm)
-        self.elements.append(img)
-        self.elements.append(Spacer(1, 40))
+        for img_buffer in self.chart_images(analysis).values():
+            self.elements.append(Image(img_buffer, width=15*cm, height=10*cm))
+            self.elements.append(Spacer(1, 20))
+
+        report_progress(0.6)
 
         # Recommendations section
         self.elements.append(Paragraph("3. Đề Xuất Cải Thiện", self.styles['Heading1']))
-        recommendations = self.generate_recommendations()
+        recommendations = self.generate_recommendations(analysis)
         for rec in recommendations:
             if rec.startswith("→"):
                 # Indent recommendations that start with arrow
-                self.elements.append(Paragraph(
-                    rec,
-                    ParagraphStyle(
-                        'Indented',
-                        parent=self.styles['Normal'],
-                        leftIndent=30
-                    )
-                ))
+                self.elements.append(Paragraph(rec, self.styles['Indented']))
             else:
                 self.elements.append(Paragraph(rec, self.styles['Normal']))
             self.elements.append(Spacer(1, 10))
 
+        report_progress(0.7)
+
         # Build PDF vào buffer
-        doc.build(self.elements)
+        with stage('report.pdf_build') as s:
+            doc.build(self.elements)
+            s.bytes(buffer.tell())
+        report_progress(1.0)
         
         # Trả về bytes của PDF
         buffer.seek(0)
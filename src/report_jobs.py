@@ -0,0 +1,165 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ReportTimeout(Exception):
+    """The report is still being built; `job` can be polled for the result"""
+
+    def __init__(self, job):
+        super().__init__(f"Report {job.id} is still being built")
+        self.job = job
+
+
+class ReportJob:
+    def __init__(self, data_path):
+        self.id = uuid.uuid4().hex
+        self.data_path = data_path
+        self.status = QUEUED
+        self.progress = 0.0
+        self.version = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def set_progress(self, progress):
+        self.progress = round(progress, 2)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ReportJobManager:
+    """
+    Builds PDF reports on a background pool.
+
+    Finished reports are cached by (dataset, dataset version), so a job for
+    data that has not changed completes immediately, and concurrent jobs
+    for the same version share one build.
+    """
+
+    def __init__(self, registry, max_workers=1, max_cached=8, max_jobs=256, chart_renderer=None):
+        # Biểu đồ render bằng API hướng đối tượng (không dùng pyplot) nên có thể build song song
+        self.registry = registry
+        self.chart_renderer = chart_renderer
+        self.max_cached = max_cached
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._reports = OrderedDict()
+        self._building = {}
+
+    def _cache_key(self, data_path, version):
+        return (os.path.abspath(data_path), version)
+
+    def submit(self, data_path):
+        """Start building a report for `data_path` and return the job"""
+        job = ReportJob(data_path)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def result(self, job):
+        """Return the PDF bytes of a finished job, or None if not available"""
+        with self._lock:
+            return self._reports.get(self._cache_key(job.data_path, job.version))
+
+    def cached(self, data_path):
+        """PDF bytes for the current version of `data_path` if already built, else None"""
+        key = self._cache_key(data_path, self.registry.version(data_path))
+        with self._lock:
+            pdf_content = self._reports.get(key)
+            if pdf_content is not None:
+                self._reports.move_to_end(key)
+            return pdf_content
+
+    def build(self, data_path, timeout=None):
+        """
+        Return the PDF for the current data (used by the synchronous download
+        route). A cached report is returned without going through the pool;
+        otherwise a job is submitted and awaited. Raises ReportTimeout if the
+        job is not finished after `timeout` seconds.
+        """
+        pdf_content = self.cached(data_path)
+        if pdf_content is not None:
+            return pdf_content
+        job = self.submit(data_path)
+        if not job.done.wait(timeout):
+            raise ReportTimeout(job)
+        if job.status == FAILED:
+            raise RuntimeError(job.error)
+        pdf_content = self.result(job)
+        if pdf_content is None:
+            raise RuntimeError("Report was evicted from the cache before it could be returned")
+        return pdf_content
+
+    def _run(self, job):
+        try:
+            job.status = RUNNING
+            analyzer, job.version = self.registry.snapshot(job.data_path)
+            key = self._cache_key(job.data_path, job.version)
+
+            with self._lock:
+                cached = key in self._reports
+                if cached:
+                    self._reports.move_to_end(key)
+                    owner = None
+                else:
+                    owner = self._building.get(key)
+                    if owner is None:
+                        self._building[key] = job
+
+            if not cached and owner is not None:
+                # Một job khác đang build cùng version: chờ kết quả của nó
+                owner.done.wait()
+                if owner.status == FAILED:
+                    raise RuntimeError(owner.error)
+            elif not cached:
+                try:
+                    # reportlab/matplotlib chỉ được import khi có report đầu tiên
+                    from report_generator import ReportGenerator
+                    report_gen = ReportGenerator(
+                        job.data_path, analyzer=analyzer,
+                        chart_renderer=self.chart_renderer, version=job.version
+                    )
+                    pdf_content = report_gen.create_report(progress=job.set_progress)
+                    with self._lock:
+                        self._reports[key] = pdf_content
+                        while len(self._reports) > self.max_cached:
+                            self._reports.popitem(last=False)
+                finally:
+                    with self._lock:
+                        self._building.pop(key, None)
+
+            job.progress = 1.0
+            job.status = DONE
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now()
+            job.done.set()
@@ -0,0 +1,109 @@
+import base64
+import gzip
+import hashlib
+import json
+from flask import Response, request
+from instrumentation import stage
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, fallback về json chuẩn
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Payload nhỏ hơn ngưỡng này không đáng để nén
+MIN_COMPRESS_SIZE = 1024
+
+
+def series_payload(series):
+    """Fast {index: value} dict for a Series, with Python scalars (no per-item numpy boxing)"""
+    return dict(zip(series.index.tolist(), series.tolist()))
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dataset_etag(version, *parts):
+    """
+    ETag value for a dataset version plus whatever identifies the resource.
+    It is sent as a weak validator, since the same tag covers the gzip, br
+    and identity encodings of the body.
+    """
+    digest = hashlib.sha1(repr((version,) + parts).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+
+def etag_matches(etag):
+    """If-None-Match uses the weak comparison (RFC 9110 13.1.2)"""
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def _compress(body):
+    """Compress with the best encoding the client accepts, or return (body, None)"""
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return brotli.compress(body, quality=5), 'br'
+    if accepted['gzip']:
+        return gzip.compress(body, compresslevel=6), 'gzip'
+    return body, None
+
+
+def json_response(payload, etag=None, status=200):
+    """Serialize `payload` to JSON, compressing it and attaching an ETag when given"""
+    with stage('json_serialize') as s:
+        body = dumps(payload)
+        s.bytes(len(body))
+    with stage('json_compress'):
+        body, encoding = _compress(body)
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        # Client luôn phải revalidate, nhưng được phép dùng lại bản cũ khi nhận 304
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii')
+
+
+# Khóa và kiểu bắt buộc của cursor phân trang
+CURSOR_FIELDS = {'offset': int, 'limit': int, 'sort': str, 'order': str, 'version': str}
+
+
+def decode_cursor(cursor):
+    """Decode a cursor made by encode_cursor; ValueError("Invalid cursor") if it is malformed"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(state, dict) or any(
+        type(state.get(key)) is not kind for key, kind in CURSOR_FIELDS.items()
+    ):
+        raise ValueError("Invalid cursor")
+    return state
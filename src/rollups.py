@@ -0,0 +1,148 @@
+import pandas as pd
+
+ROLLUP_KEYS = ['hour', 'page_url', 'event_type']
+ROLLUP_COLUMNS = ['timestamp', 'page_url', 'event_type', 'event_duration']
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+# Gộp các phần đang chờ khi số phần vượt ngưỡng này (như cohorts.UserActivity)
+MAX_PENDING_PARTS = 16
+
+
+def _empty_table():
+    return pd.DataFrame({
+        'hour': pd.Series(dtype='datetime64[ns]'),
+        'page_url': pd.Series(dtype='object'),
+        'event_type': pd.Series(dtype='object'),
+        'events': pd.Series(dtype='int64'),
+        'duration_sum': pd.Series(dtype='int64'),
+    })
+
+
+def _period_start(hours, granularity):
+    """Map hourly bucket timestamps to the start of their hour/day/week/month"""
+    if granularity == 'hour':
+        return hours
+    if granularity == 'day':
+        return hours.dt.floor('D')
+    if granularity == 'week':
+        # Tuần bắt đầu từ thứ Hai
+        return hours.dt.to_period('W').dt.start_time
+    if granularity == 'month':
+        return hours.dt.to_period('M').dt.start_time
+    raise ValueError(f"Unknown granularity: {granularity} (expected one of {GRANULARITIES})")
+
+
+def hour_bound(value, name='start'):
+    """
+    Timestamp of a query bound. The cube only keeps whole hours, so a bound
+    inside an hour cannot be answered exactly and is rejected with ValueError.
+    """
+    timestamp = pd.Timestamp(value)
+    if timestamp != timestamp.floor('h'):
+        raise ValueError(f"{name} must be on the hour (e.g. 2025-04-01T10:00): rollups are hourly")
+    return timestamp
+
+
+def format_periods(index, granularity):
+    """String labels for period starts: 'YYYY-MM-DD HH:00' for hours, 'YYYY-MM-DD' otherwise"""
+    return index.strftime('%Y-%m-%d %H:00' if granularity == 'hour' else '%Y-%m-%d')
+
+
+class RollupCube:
+    """
+    Hourly event counts and duration sums keyed by (hour, page_url, event_type).
+
+    Day, week and month views are derived from the hourly buckets, so a
+    range query costs O(buckets in range), independent of the number of
+    raw events. Cubes built from different chunks or partitions can be merged;
+    chunk buckets stay pending and are folded in batches of MAX_PENDING_PARTS.
+    """
+
+    def __init__(self, table=None):
+        # Bảng phẳng, sắp xếp theo hour để cắt theo khoảng thời gian bằng searchsorted
+        self._table = _empty_table() if table is None else table
+        self._pending = []
+
+    @property
+    def table(self):
+        self.compact()
+        return self._table
+
+    @table.setter
+    def table(self, table):
+        self._pending = []
+        self._table = table
+
+    @staticmethod
+    def _rollup(df):
+        """Hourly buckets for a frame of raw events"""
+        hours = df['timestamp'].dt.floor('h').rename('hour')
+        # Cộng dồn bằng int64 để duration đã downcast (int16...) không bị tràn số
+        durations = df['event_duration'].astype('int64')
+        table = durations.groupby([hours, df['page_url'], df['event_type']], observed=True, sort=False) \
+            .agg(events='size', duration_sum='sum') \
+            .reset_index()
+        for column in ('page_url', 'event_type'):
+            table[column] = table[column].astype(str)
+        return table
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls().update(df)
+
+    def _set_table(self, tables):
+        tables = [t for t in tables if not t.empty]
+        if not tables:
+            return
+        table = pd.concat(tables, ignore_index=True)
+        table = table.groupby(ROLLUP_KEYS, sort=False, as_index=False)[['events', 'duration_sum']].sum()
+        self._table = table.sort_values('hour', kind='stable').reset_index(drop=True)
+
+    def _add_part(self, table):
+        if not table.empty:
+            self._pending.append(table)
+            if len(self._pending) > MAX_PENDING_PARTS:
+                self.compact()
+
+    def compact(self):
+        """Fold the pending bucket tables into the sorted table"""
+        if self._pending:
+            tables, self._pending = [self._table] + self._pending, []
+            self._set_table(tables)
+        return self
+
+    def update(self, chunk):
+        """Fold a chunk of raw events into the cube"""
+        if not chunk.empty:
+            self._add_part(self._rollup(chunk))
+        return self
+
+    def merge(self, other):
+        self._add_part(other.table)
+        return self
+
+    @classmethod
+    def combine(cls, cubes):
+        combined = cls()
+        combined._set_table([cube.table for cube in cubes])
+        return combined
+
+    def query(self, start=None, end=None, granularity='day', page=None, event_type=None):
+        """
+        Events, total and average duration per period for hours in [start, end).
+        start and end must be on the hour (see hour_bound).
+        Optionally restricted to one page and/or event type.
+        """
+        table = self.table
+        hours = table['hour']
+        lo = 0 if start is None else hours.searchsorted(hour_bound(start, 'start'), side='left')
+        hi = len(table) if end is None else hours.searchsorted(hour_bound(end, 'end'), side='left')
+        table = table.iloc[lo:hi]
+        if page is not None:
+            table = table[table['page_url'] == page]
+        if event_type is not None:
+            table = table[table['event_type'] == event_type]
+
+        periods = _period_start(table['hour'], granularity).rename('period')
+        result = table.groupby(periods)[['events', 'duration_sum']].sum()
+        result['avg_duration'] = result['duration_sum'] / result['events']
+        return result
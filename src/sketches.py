@@ -0,0 +1,277 @@
+"""
+Fixed-memory, mergeable sketches for approximate aggregates.
+
+Every estimate comes with an error bound:
+- HyperLogLog distinct counts: relative standard error 1.04 / sqrt(2**precision)
+  (about 0.8% for the default precision 14, using 16 KB of registers).
+- QuantileSketch (DDSketch-style log buckets) instead of t-digest/KLL, since
+  its bound is deterministic: every quantile in [min_value, max_value] is
+  within relative_accuracy of the true value (1% by default).
+- HeavyHitters (mergeable Misra-Gries summary, Count-Min/Space-Saving family):
+  each reported count is a lower bound and the true count is at most
+  `max_error` higher, with max_error <= N / (capacity + 1).
+"""
+import numpy as np
+import pandas as pd
+from storage import iter_events
+
+SKETCH_COLUMNS = ['user_id', 'session_id', 'page_url', 'timestamp', 'event_duration']
+DEFAULT_PERCENTILES = (0.5, 0.75, 0.9, 0.95, 0.99)
+
+
+def _hash(values):
+    """64-bit hash, stable across processes so sketches stay mergeable"""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iub':
+        values = values.astype('int64')
+    elif values.dtype.kind != 'f':
+        values = values.astype(str).astype(object)
+    return pd.util.hash_array(values, categorize=False)
+
+
+def _bit_length(x):
+    """Vectorized int.bit_length() for uint64 arrays"""
+    x = x.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+class HyperLogLog:
+    """Distinct count estimator with 2**precision one-byte registers"""
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def add(self, values):
+        if len(values) == 0:
+            return self
+        hashes = _hash(values)
+        tail_bits = 64 - self.precision
+        index = (hashes >> np.uint64(tail_bits)).astype(np.int64)
+        tail = hashes & np.uint64((1 << tail_bits) - 1)
+        rank = (tail_bits - _bit_length(tail) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            # Hiệu chỉnh cho tập nhỏ (linear counting)
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class QuantileSketch:
+    """
+    Log-bucket quantile sketch with relative accuracy guarantees.
+
+    Values in [min_value, max_value] fall into buckets of relative width
+    2 * relative_accuracy; smaller values count as zero, larger ones are
+    clamped to max_value. Memory is fixed by the value range.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-3, max_value=1e9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(gamma)
+        self._offset = int(np.ceil(np.log(min_value) / self._log_gamma))
+        n_buckets = int(np.ceil(np.log(max_value) / self._log_gamma)) - self._offset + 1
+        self.counts = np.zeros(n_buckets, dtype=np.int64)
+        self.zero_count = 0
+
+    @property
+    def count(self):
+        return int(self.counts.sum() + self.zero_count)
+
+    def add(self, values):
+        values = np.asarray(values, dtype='float64')
+        small = values < self.min_value
+        self.zero_count += int(small.sum())
+        values = np.minimum(values[~small], self.max_value)
+        keys = np.ceil(np.log(values) / self._log_gamma).astype(np.int64) - self._offset
+        self.counts += np.bincount(keys, minlength=len(self.counts))
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.zero_count += other.zero_count
+        return self
+
+    def quantile(self, q):
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = np.cumsum(self.counts) + self.zero_count
+        key = int(np.searchsorted(cumulative, rank, side='right')) + self._offset
+        gamma = np.exp(self._log_gamma)
+        return float(2 * gamma ** key / (gamma + 1))
+
+
+class HeavyHitters:
+    """
+    Mergeable Misra-Gries summary keeping at most `capacity` counters.
+    True count of a reported key is in [count, count + max_error].
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.counters = pd.Series(dtype='int64')
+        self.max_error = 0
+        self.total = 0
+
+    def _merge_counts(self, counts, error):
+        counters = self.counters.add(counts, fill_value=0).astype('int64')
+        if len(counters) > self.capacity:
+            # Trừ count lớn thứ capacity+1 khỏi mọi counter và bỏ các counter <= 0
+            threshold = int(counters.nlargest(self.capacity + 1).iloc[-1])
+            counters = counters - threshold
+            counters = counters[counters > 0]
+            error += threshold
+        self.counters = counters
+        self.max_error += error
+
+    def add(self, values):
+        counts = pd.Series(values).value_counts(sort=False)
+        if isinstance(counts.index, pd.CategoricalIndex):
+            counts = counts[counts > 0]
+            counts.index = counts.index.astype(str)
+        self.total += int(counts.sum())
+        self._merge_counts(counts, 0)
+        return self
+
+    def merge(self, other):
+        self.total += other.total
+        self._merge_counts(other.counters, other.max_error)
+        return self
+
+    def top(self, n=5):
+        return self.counters.sort_values(ascending=False, kind='stable').head(n)
+
+
+class ApproximateAggregates:
+    """
+    Fixed-memory, mergeable counterpart of PartialAggregates.
+
+    Session durations need per-session means, so sessions are kept "open"
+    until no event has been seen for `session_timeout` in a time-ordered
+    stream, then their mean goes into the quantile sketch. Memory is
+    bounded by the number of concurrently open sessions. Sessions that
+    span more than `session_timeout`, or input that is not roughly ordered
+    by time, can split a session and add error beyond the sketch bound.
+    """
+
+    def __init__(self, precision=14, relative_accuracy=0.01, capacity=64, session_timeout='2h'):
+        self.users = HyperLogLog(precision)
+        self.sessions = HyperLogLog(precision)
+        self.durations = QuantileSketch(relative_accuracy)
+        self.pages = HeavyHitters(capacity)
+        self.session_timeout = pd.Timedelta(session_timeout)
+        self.open_sessions = pd.DataFrame({
+            'sum': pd.Series(dtype='int64'),
+            'count': pd.Series(dtype='int64'),
+            'last': pd.Series(dtype='datetime64[ns]'),
+        })
+        self.rows = 0
+
+    def _fold_sessions(self, frames, horizon=None):
+        """Combine open-session partials; close (sketch) sessions idle since before `horizon`"""
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return
+        combined = pd.concat(frames).groupby(level=0).agg({'sum': 'sum', 'count': 'sum', 'last': 'max'})
+        if horizon is None:
+            self.open_sessions = combined
+            return
+        closed = combined['last'] < horizon
+        self.durations.add((combined['sum'][closed] / combined['count'][closed]).to_numpy())
+        self.open_sessions = combined[~closed]
+
+    def update(self, chunk):
+        if chunk.empty:
+            return self
+        sessions = chunk['session_id'].astype(str)
+        self.users.add(chunk['user_id'].to_numpy())
+        self.sessions.add(sessions.to_numpy())
+        self.pages.add(chunk['page_url'])
+
+        durations = chunk['event_duration'].astype('int64')
+        grouped = pd.DataFrame({
+            'sum': durations.groupby(sessions).sum(),
+            'count': durations.groupby(sessions).size(),
+            'last': chunk['timestamp'].groupby(sessions).max().astype('datetime64[ns]'),
+        })
+        horizon = chunk['timestamp'].max() - self.session_timeout
+        self._fold_sessions([self.open_sessions, grouped], horizon)
+        self.rows += len(chunk)
+        return self
+
+    def merge(self, other):
+        self.users.merge(other.users)
+        self.sessions.merge(other.sessions)
+        self.durations.merge(other.durations)
+        self.pages.merge(other.pages)
+        self._fold_sessions([self.open_sessions, other.open_sessions])
+        self.rows += other.rows
+        return self
+
+    def _closed_durations(self):
+        """Quantile sketch including sessions that are still open"""
+        durations = QuantileSketch(
+            self.durations.relative_accuracy, self.durations.min_value, self.durations.max_value
+        ).merge(self.durations)
+        if not self.open_sessions.empty:
+            durations.add((self.open_sessions['sum'] / self.open_sessions['count']).to_numpy())
+        return durations
+
+    def summary(self, n=5, percentiles=DEFAULT_PERCENTILES):
+        """All approximate answers with their error bounds, as plain Python types"""
+        durations = self._closed_durations()
+        return {
+            'rows': self.rows,
+            'unique_users': {
+                'estimate': self.users.estimate(),
+                'relative_error': round(float(self.users.relative_error), 4),
+            },
+            'unique_sessions': {
+                'estimate': self.sessions.estimate(),
+                'relative_error': round(float(self.sessions.relative_error), 4),
+            },
+            'session_duration': {
+                'sessions': durations.count,
+                'quantiles': {f"p{int(q * 100)}": durations.quantile(q) for q in percentiles},
+                'relative_error': durations.relative_accuracy,
+            },
+            'top_pages': {
+                'pages': {page: int(count) for page, count in self.pages.top(n).items()},
+                'max_error': int(self.pages.max_error),
+            },
+        }
+
+
+def sketch_file(path, chunksize=100_000, **options):
+    """Stream one event file into an ApproximateAggregates"""
+    sketch = ApproximateAggregates(**options)
+    for chunk in iter_events(path, columns=SKETCH_COLUMNS, chunksize=chunksize):
+        sketch.update(chunk)
+    return sketch
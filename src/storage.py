@@ -0,0 +1,219 @@
+import glob
+import os
+import sys
+import pandas as pd
+from instrumentation import stage
+
+# Schema của event log và cách biểu diễn từng cột khi load vào bộ nhớ:
+# - integer: số nguyên nhỏ nhất vừa dữ liệu
+# - category: chuỗi lặp lại nhiều (URL, loại event)
+# - code: mã hóa từ điển thành mã số nguyên + bảng tra ngược (session_id)
+EVENT_SCHEMA = {
+    'user_id': 'integer',
+    'session_id': 'code',
+    'page_url': 'category',
+    'timestamp': 'datetime',
+    'event_type': 'category',
+    'event_duration': 'integer',
+}
+EVENT_COLUMNS = list(EVENT_SCHEMA)
+INTEGER_COLUMNS = [c for c, kind in EVENT_SCHEMA.items() if kind == 'integer']
+# Trên đĩa (Parquet/Feather) session_id được lưu dạng categorical
+CATEGORICAL_COLUMNS = [c for c, kind in EVENT_SCHEMA.items() if kind in ('category', 'code')]
+
+COLUMNAR_FORMATS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+}
+STORAGE_FORMATS = {'.csv': 'csv', **COLUMNAR_FORMATS}
+
+
+def storage_format(path):
+    """Return 'parquet', 'feather' or 'csv' based on the file extension"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in STORAGE_FORMATS:
+        raise ValueError(
+            f"Unsupported event file format: {path} (expected one of {', '.join(STORAGE_FORMATS)})"
+        )
+    return STORAGE_FORMATS[ext]
+
+
+def resolve_paths(source):
+    """
+    Expand a data source into a sorted list of partition files.
+    `source` may be a single file, a directory of partitions or a glob pattern.
+    Directory and glob matches are limited to event file extensions, so state
+    files and partially written temp files next to the data are skipped.
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    elif any(c in source for c in '*?['):
+        paths = glob.glob(source)
+    else:
+        return [source]
+    paths = [path for path in paths if os.path.splitext(path)[1].lower() in STORAGE_FORMATS]
+    if not paths:
+        raise FileNotFoundError(f"No event partitions found for {source}")
+    return sorted(paths)
+
+
+def dataset_version(source):
+    """
+    Identify the current contents of a data source: (mtime_ns, size) for a
+    single file, or one (path, mtime_ns, size) per partition
+    """
+    paths = resolve_paths(source)
+    if len(paths) == 1 and paths[0] == source:
+        stat = os.stat(source)
+        return (stat.st_mtime_ns, stat.st_size)
+    versions = []
+    for path in paths:
+        stat = os.stat(path)
+        versions.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(versions)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required for Parquet/Feather storage: pip install pyarrow"
+        ) from e
+
+
+def to_typed_frame(df):
+    """
+    Convert an event DataFrame to the compact columnar schema:
+    datetime64 timestamps, categorical strings and downcast integers
+    """
+    df = df.copy()
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+
+def compact_frame(df):
+    """
+    Apply EVENT_SCHEMA to an in-memory event frame.
+
+    Returns (df, session_lookup): session_id is replaced by int32 codes and
+    session_lookup[code] gives back the original id. Codes follow the sorted
+    order of the ids, so grouping by code orders sessions like grouping by id.
+    session_lookup is None when the frame has no session_id column.
+    """
+    session_lookup = None
+    sessions = df['session_id'] if 'session_id' in df.columns else None
+    df = to_typed_frame(df.drop(columns=['session_id'], errors='ignore'))
+    if sessions is not None:
+        codes, uniques = pd.factorize(sessions, sort=True)
+        df['session_id'] = codes.astype('int32')
+        session_lookup = pd.Index(uniques).astype(str).rename('session_id')
+    return df, session_lookup
+
+
+def write_events(df, output_path):
+    """Write an event frame to CSV, Parquet or Feather (chosen by extension)"""
+    fmt = storage_format(output_path)
+    if fmt == 'csv':
+        df.to_csv(output_path, index=False)
+        return output_path
+    _require_pyarrow()
+
+    df = to_typed_frame(df)
+    if fmt == 'parquet':
+        df.to_parquet(output_path, index=False)
+    else:
+        # Không nén để có thể memory-map và đọc zero-copy
+        df.reset_index(drop=True).to_feather(output_path, compression='uncompressed')
+    return output_path
+
+
+def convert_events(csv_path, output_path):
+    """Convert a CSV event log to Parquet or Feather (chosen by output extension)"""
+    if storage_format(output_path) == 'csv':
+        raise ValueError(f"Unsupported columnar format: {output_path}")
+    return write_events(pd.read_csv(csv_path), output_path)
+
+
+def read_events(path, columns=None, compact=False):
+    """
+    Read an event log from CSV, Parquet or Feather.
+
+    For columnar formats only the requested columns are read, through a
+    memory map. CSV is parsed in full (restricted to `columns` if given);
+    with compact=True repeated strings are parsed straight into categoricals.
+    """
+    fmt = storage_format(path)
+    if fmt == 'csv':
+        dtype = None
+        if compact:
+            dtype = {c: 'category' for c, kind in EVENT_SCHEMA.items() if kind == 'category'}
+        with stage('csv_parse') as s:
+            df = pd.read_csv(path, usecols=columns, dtype=dtype)
+            s.rows(len(df))
+            s.bytes(os.path.getsize(path))
+        if 'timestamp' in df.columns:
+            with stage('datetime_convert'):
+                df['timestamp'] = pd.to_datetime(df['timestamp'])
+        return df
+
+    _require_pyarrow()
+    with stage(f'{fmt}_read') as s:
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            table = pq.read_table(path, columns=columns, memory_map=True)
+        else:
+            import pyarrow.feather as feather
+            table = feather.read_table(path, columns=columns, memory_map=True)
+        df = table.to_pandas()
+        s.rows(table.num_rows)
+        s.bytes(table.nbytes)
+    return df
+
+
+def iter_events(path, columns=None, chunksize=100_000):
+    """
+    Yield the event log as DataFrames of at most `chunksize` rows,
+    so peak memory depends on the chunk size rather than the file size.
+    """
+    fmt = storage_format(path)
+    if fmt == 'csv':
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+            stage('csv_parse_chunk').rows(len(chunk))
+            if 'timestamp' in chunk.columns:
+                with stage('datetime_convert'):
+                    chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
+            yield chunk
+        return
+
+    _require_pyarrow()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(path, memory_map=True).iter_batches(
+            batch_size=chunksize, columns=columns
+        )
+    else:
+        import pyarrow.feather as feather
+        # Bảng được memory-map nên chỉ batch đang xử lý nằm trong RAM
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        batches = table.to_batches(max_chunksize=chunksize)
+    for batch in batches:
+        yield batch.to_pandas()
+
+
+if __name__ == "__main__":
+    # python src/storage.py data/user_behavior.csv data/user_behavior.parquet
+    if len(sys.argv) != 3:
+        print("Usage: python storage.py <input.csv> <output.parquet|output.feather>")
+        sys.exit(1)
+    convert_events(sys.argv[1], sys.argv[2])
+    print(f"Đã chuyển đổi {sys.argv[1]} -> {sys.argv[2]}")
@@ -1,149 +1,180 @@
+import argparse
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import random
-
-def generate_mock_data(num_users=20, num_records=100):
-    # Các trang web mẫu
-    pages = [
-        '/home', 
-        '/products', 
-        '/product-detail',
-        '/cart', 
-        '/checkout',
-        '/about',
-        '/contact',
-        '/blog',
-        '/profile',
-        '/search'
-    ]
-    
-    # Các loại event
-    event_types = ['view', 'click', 'scroll', 'submit']
-    
-    # Tạo danh sách user_ids
-    user_ids = list(range(1001, 1001 + num_users))
-    
-    # List để lưu các records
-    records = []
-    
-    # Tạo thời gian end là hiện tại
-    end_time = datetime.now()
-    # Thời gian start là 5 ngày trước
-    start_time = end_time - timedelta(days=5)
-    
-    current_session_id = 5001
-    
-    def generate_event_duration(event_type, is_last_in_session=False):
-        # Base duration theo event type
-        base_durations = {
-            'view': (30, 180),    # 30s - 3m
-            'click': (10, 60),    # 10s - 1m
-            'scroll': (20, 120),  # 20s - 2m
-            'submit': (5, 30)     # 5s - 30s
-        }
-        
-        if is_last_in_session:
-            # Các trường hợp đặc biệt cho event cuối
-            scenarios = [
-                (0.3, lambda: random.randint(1, 10)),          # Đóng tab ngay: 1-10s
-                (0.2, lambda: 1800),                           # Timeout 30m
-                (0.3, lambda: random.randint(60, 300)),        # Inactive: 1-5m
-                (0.2, lambda: random.randint(10, 60))          # Logout bình thường: 10-60s
-            ]
-            
-            # Chọn ngẫu nhiên một scenario theo weight
-            scenario = random.choices(scenarios, weights=[w for w, _ in scenarios])[0]
-            return scenario[1]()
-        else:
-            min_dur, max_dur = base_durations[event_type]
-            return random.randint(min_dur, max_dur)
-
-    # Với mỗi user
-    for user_id in user_ids:
-        # Mỗi user có 2-5 sessions trong 5 ngày
-        num_sessions = random.randint(2, 5)
-        
-        for _ in range(num_sessions):
-            # Tạo thời gian bắt đầu ngẫu nhiên cho session này
-            random_minutes = random.randint(0, int((end_time - start_time).total_seconds() / 60))
-            session_start = start_time + timedelta(minutes=random_minutes)
-            
-            # Đảm bảo session không kéo dài quá 30 phút
-            session_end = min(
-                session_start + timedelta(minutes=30),
-                end_time
-            )
-            
-            # Tạo session_id unique
-            session_id = f"{user_id}_{current_session_id}"
-            current_session_id += 1
-            
-            # Số lượng actions trong session này (3-8 actions)
-            num_actions = random.randint(3, 8)
-            
-            # Typical flows với xác suất cao hơn
-            typical_flows = [
-                ['/home', '/products', '/product-detail', '/cart', '/checkout'],
-                ['/home', '/blog', '/product-detail'],
-                ['/home', '/search', '/product-detail', '/cart'],
-                ['/home', '/profile', '/cart', '/checkout'],
-                ['/home', '/about', '/contact'],
-                ['/home', '/search', '/products', '/product-detail']
-            ]
-            
-            # 70% chance để sử dụng typical flow
-            if random.random() < 0.7:
-                page_sequence = random.choice(typical_flows)
-                # Cắt sequence nếu dài hơn num_actions
-                page_sequence = page_sequence[:num_actions]
-            else:
-                page_sequence = random.sample(pages, num_actions)
-            
-            # Tính thời gian giữa các actions trong session
-            available_time = (session_end - session_start).total_seconds()
-            time_per_action = available_time / (len(page_sequence) + 1)
-            
-            current_time = session_start
-            for i, page in enumerate(page_sequence):
-                is_last = (i == len(page_sequence) - 1)
-                event_type = random.choice(event_types)
-                event_duration = generate_event_duration(event_type, is_last)
-                
-                event = {
-                    'user_id': user_id,
-                    'session_id': session_id,
-                    'page_url': page,
-                    'timestamp': current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'event_type': event_type,
-                    'event_duration': event_duration
-                }
-                records.append(event)
-                
-                current_time += timedelta(seconds=event_duration)
-    
-    # Tạo DataFrame
-    df = pd.DataFrame(records)
-    
+from storage import write_events
+
+# Các trang web mẫu
+PAGES = [
+    '/home',
+    '/products',
+    '/product-detail',
+    '/cart',
+    '/checkout',
+    '/about',
+    '/contact',
+    '/blog',
+    '/profile',
+    '/search'
+]
+
+# Các loại event và khoảng duration (giây) tương ứng
+EVENT_TYPES = ['view', 'click', 'scroll', 'submit']
+BASE_DURATIONS = {
+    'view': (30, 180),    # 30s - 3m
+    'click': (10, 60),    # 10s - 1m
+    'scroll': (20, 120),  # 20s - 2m
+    'submit': (5, 30)     # 5s - 30s
+}
+
+# Typical flows với xác suất cao hơn
+TYPICAL_FLOWS = [
+    ['/home', '/products', '/product-detail', '/cart', '/checkout'],
+    ['/home', '/blog', '/product-detail'],
+    ['/home', '/search', '/product-detail', '/cart'],
+    ['/home', '/profile', '/cart', '/checkout'],
+    ['/home', '/about', '/contact'],
+    ['/home', '/search', '/products', '/product-detail']
+]
+TYPICAL_FLOW_RATE = 0.7
+
+# Các trường hợp đặc biệt cho event cuối của session: (weight, min, max)
+LAST_EVENT_SCENARIOS = [
+    (0.3, 1, 10),        # Đóng tab ngay: 1-10s
+    (0.2, 1800, 1800),   # Timeout 30m
+    (0.3, 60, 300),      # Inactive: 1-5m
+    (0.2, 10, 60)        # Logout bình thường: 10-60s
+]
+
+FIRST_USER_ID = 1001
+FIRST_SESSION_ID = 5001
+MIN_ACTIONS, MAX_ACTIONS = 3, 8
+
+
+def _session_plan(rng, num_users, num_records):
+    """
+    Users, flows and lengths of every session. With num_records set, enough
+    users are drawn to reach that many events (each session has >= 3 events).
+    """
+    if num_records is not None:
+        num_users = max(num_users, -(-num_records // (2 * MIN_ACTIONS)))
+    # Mỗi user có 2-5 sessions
+    sessions_per_user = rng.integers(2, 6, size=num_users)
+    users = np.repeat(np.arange(FIRST_USER_ID, FIRST_USER_ID + num_users), sessions_per_user)
+    n_sessions = len(users)
+
+    # Số lượng actions trong session (3-8); 70% session đi theo typical flow
+    num_actions = rng.integers(MIN_ACTIONS, MAX_ACTIONS + 1, size=n_sessions)
+    typical = rng.random(n_sessions) < TYPICAL_FLOW_RATE
+    flows = rng.integers(0, len(TYPICAL_FLOWS), size=n_sessions)
+    flow_lengths = np.array([len(flow) for flow in TYPICAL_FLOWS])
+    lengths = np.where(typical, np.minimum(flow_lengths[flows], num_actions), num_actions)
+
+    if num_records is not None:
+        # Giữ các session đầu tiên đủ num_records events, cắt bớt session cuối
+        n_sessions = int(np.searchsorted(np.cumsum(lengths), num_records)) + 1
+        users, typical, flows, lengths = (a[:n_sessions] for a in (users, typical, flows, lengths))
+        lengths[-1] -= lengths.sum() - num_records
+    return users, typical, flows, lengths
+
+
+def generate_mock_data(num_users=20, num_records=None, days=5, seed=None, end_time=None):
+    """
+    Generate a realistic event log, vectorized with numpy so that tens of
+    millions of events take seconds.
+
+    num_users: users with 2-5 sessions each in the last `days` days
+    num_records: if set, exactly this many events (more users are added as needed)
+    seed: makes the output reproducible (together with a fixed end_time)
+    """
+    rng = np.random.default_rng(seed)
+    # Tạo thời gian end là hiện tại (làm tròn tới giây như dữ liệu gốc)
+    end_time = pd.Timestamp(end_time or datetime.now()).floor('s')
+    start_time = end_time - timedelta(days=days)
+
+    users, typical, flows, lengths = _session_plan(rng, num_users, num_records)
+    n_sessions = len(users)
+    n_events = int(lengths.sum())
+
+    # Vị trí của từng event trong session của nó
+    session_of_event = np.repeat(np.arange(n_sessions), lengths)
+    session_first = np.cumsum(lengths) - lengths
+    position = np.arange(n_events) - np.repeat(session_first, lengths)
+
+    # Trang: theo flow, hoặc các trang khác nhau lấy ngẫu nhiên (như random.sample)
+    flow_table = np.full((len(TYPICAL_FLOWS), MAX_ACTIONS), -1)
+    for i, flow in enumerate(TYPICAL_FLOWS):
+        flow_table[i, :len(flow)] = [PAGES.index(page) for page in flow]
+    page_codes = flow_table[flows[session_of_event], np.minimum(position, MAX_ACTIONS - 1)]
+    random_sessions = np.flatnonzero(~typical)
+    permutations = np.argsort(rng.random((len(random_sessions), len(PAGES))), axis=1)
+    random_row = np.full(n_sessions, -1)
+    random_row[random_sessions] = np.arange(len(random_sessions))
+    is_random = ~typical[session_of_event]
+    page_codes[is_random] = permutations[random_row[session_of_event[is_random]], position[is_random]]
+
+    # Duration theo event type; event cuối của session theo các scenario đặc biệt
+    event_codes = rng.integers(0, len(EVENT_TYPES), size=n_events)
+    low = np.array([BASE_DURATIONS[t][0] for t in EVENT_TYPES])[event_codes]
+    high = np.array([BASE_DURATIONS[t][1] for t in EVENT_TYPES])[event_codes]
+    durations = rng.integers(low, high + 1)
+    last = position == np.repeat(lengths - 1, lengths)
+    weights, scenario_low, scenario_high = (np.array(v) for v in zip(*LAST_EVENT_SCENARIOS))
+    scenarios = rng.choice(len(LAST_EVENT_SCENARIOS), size=int(last.sum()), p=weights)
+    durations[last] = rng.integers(scenario_low[scenarios], scenario_high[scenarios] + 1)
+
+    # Thời gian bắt đầu session ngẫu nhiên theo phút; các event nối tiếp nhau
+    total_minutes = int((end_time - start_time).total_seconds() // 60)
+    session_start = rng.integers(0, total_minutes + 1, size=n_sessions) * 60
+    elapsed = np.cumsum(durations) - durations
+    elapsed -= np.repeat(elapsed[session_first], lengths)
+    seconds = np.repeat(session_start, lengths) + elapsed
+    timestamps = start_time + pd.to_timedelta(seconds, unit='s')
+
+    # session_id dạng '<user_id>_<số thứ tự>' tạo một lần cho mỗi session (categorical)
+    session_names = pd.Index(users.astype(str)).str.cat(
+        pd.Index(np.arange(FIRST_SESSION_ID, FIRST_SESSION_ID + n_sessions).astype(str)), sep='_'
+    )
+    df = pd.DataFrame({
+        'user_id': np.repeat(users, lengths),
+        'session_id': pd.Categorical.from_codes(session_of_event, categories=session_names),
+        'page_url': pd.Categorical.from_codes(page_codes, categories=PAGES),
+        'timestamp': timestamps,
+        'event_type': pd.Categorical.from_codes(event_codes, categories=EVENT_TYPES),
+        'event_duration': durations
+    })
+
     # Sắp xếp theo timestamp
-    df = df.sort_values('timestamp')
-    
-    return df
-
-# Tạo dữ liệu mẫu
-mock_data = generate_mock_data(num_users=20, num_records=100)
-
-# Lưu vào file CSV
-mock_data.to_csv('data/user_behavior.csv', index=False)
-
-# In thống kê
-print("Đã tạo xong dữ liệu mẫu!")
-print("\nMẫu dữ liệu:")
-print(mock_data.head(10))
-print("\nThống kê:")
-print(f"Tổng số records: {len(mock_data)}")
-print(f"Số lượng users unique: {mock_data['user_id'].nunique()}")
-print(f"Số lượng sessions unique: {mock_data['session_id'].nunique()}")
-print("\nPhân bố thời gian:")
-mock_data['date'] = pd.to_datetime(mock_data['timestamp']).dt.date
-print(mock_data.groupby('date').size())
+    return df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+def save_mock_data(df, output_path):
+    """Write to CSV, Parquet or Feather depending on the extension"""
+    return write_events(df, output_path)
+
+
+if __name__ == "__main__":
+    # src phải nằm trong sys.path để import được storage:
+    # PYTHONPATH=src python src/utils/generate_mock_data.py --records 10000000 --seed 42 --output data/events.parquet
+    parser = argparse.ArgumentParser(description="Tạo dữ liệu hành vi người dùng mẫu")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--records', type=int, default=None, help="số events chính xác (tùy chọn)")
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--end', default=None, help="thời điểm kết thúc, vd. 2025-04-01 (mặc định: hiện tại)")
+    parser.add_argument('--output', default='data/user_behavior.csv', help=".csv, .parquet hoặc .feather")
+    args = parser.parse_args()
+
+    mock_data = generate_mock_data(args.users, args.records, args.days, args.seed, args.end)
+    save_mock_data(mock_data, args.output)
+
+    # In thống kê
+    print("Đã tạo xong dữ liệu mẫu!")
+    print("\nMẫu dữ liệu:")
+    print(mock_data.head(10))
+    print("\nThống kê:")
+    print(f"Tổng số records: {len(mock_data)}")
+    print(f"Số lượng users unique: {mock_data['user_id'].nunique()}")
+    print(f"Số lượng sessions unique: {mock_data['session_id'].nunique()}")
+    print("\nPhân bố thời gian:")
+    print(mock_data.groupby(mock_data['timestamp'].dt.date).size())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module trong src/ import lẫn nhau theo tên (vd. `from storage import ...`)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_analysis import DataAnalyzer
+from utils.generate_mock_data import generate_mock_data, save_mock_data
+
+ROLLUP_KEYS = ['hour', 'page_url', 'event_type']
+
+
+@pytest.fixture(scope='module')
+def events():
+    return generate_mock_data(num_users=30, num_records=3000, seed=7, end_time='2025-04-01')
+
+
+@pytest.fixture(scope='module')
+def csv_path(events, tmp_path_factory):
+    return save_mock_data(events, str(tmp_path_factory.mktemp('events') / 'events.csv'))
+
+
+def assert_same_aggregates(expected, actual):
+    """Daily visits, top pages, session durations and rollups of two analyzers are equal"""
+    pd.testing.assert_series_equal(expected.get_daily_visits(), actual.get_daily_visits(), check_dtype=False)
+    pd.testing.assert_series_equal(expected.get_top_pages(), actual.get_top_pages(), check_dtype=False)
+    pd.testing.assert_series_equal(
+        expected.get_avg_session_duration(), actual.get_avg_session_duration(),
+        check_dtype=False, check_index_type=False,
+    )
+    tables = [
+        analyzer.get_rollups().table.sort_values(ROLLUP_KEYS).reset_index(drop=True)
+        for analyzer in (expected, actual)
+    ]
+    pd.testing.assert_frame_equal(*tables, check_dtype=False)
+
+
+@pytest.mark.parametrize('chunksize', [97, 1000])
+def test_chunked_aggregates_equal_in_memory(events, csv_path, chunksize):
+    # Chunk lẻ để các phiên bị cắt ngang ranh giới chunk
+    sessions = events['session_id'].astype(str).to_numpy()
+    assert any(
+        np.intersect1d(sessions[b - chunksize:b], sessions[b:b + chunksize]).size
+        for b in range(chunksize, len(sessions), chunksize)
+    )
+    assert_same_aggregates(DataAnalyzer(csv_path), DataAnalyzer(csv_path, chunksize=chunksize))
+
+
+@pytest.fixture(scope='module')
+def partitions(events, tmp_path_factory):
+    """The same events split into CSV, Parquet and Feather partitions (sessions span partitions)"""
+    root = tmp_path_factory.mktemp('partitions')
+    bounds = [0, 1100, 2050, len(events)]
+    for i, extension in enumerate(['csv', 'parquet', 'feather']):
+        save_mock_data(events.iloc[bounds[i]:bounds[i + 1]].reset_index(drop=True), str(root / f'part-{i}.{extension}'))
+    return str(root)
+
+
+@pytest.mark.parametrize('options', [{}, {'chunksize': 97}, {'workers': 2}])
+def test_partitioned_aggregates_equal_in_memory(csv_path, partitions, options):
+    expected = DataAnalyzer(csv_path)
+    assert_same_aggregates(expected, DataAnalyzer(partitions + '/part-*', **options))
+    assert_same_aggregates(expected, DataAnalyzer(partitions, **options))
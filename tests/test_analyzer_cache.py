@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from analyzer_cache import AnalyzerRegistry
+
+
+class SlowAnalyzer:
+    """Aggregates block until released; counts how often each one runs"""
+
+    def __init__(self, path):
+        self.release = threading.Event()
+        self.calls = {'slow': 0, 'fast': 0, 'fail': 0}
+
+    def slow(self):
+        self.calls['slow'] += 1
+        self.release.wait(5)
+        return 'slow'
+
+    def fast(self):
+        self.calls['fast'] += 1
+        return 'fast'
+
+    def fail(self):
+        self.calls['fail'] += 1
+        raise RuntimeError('boom')
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / 'events.csv'
+    path.write_text('user_id\n')
+    return str(path)
+
+
+def test_slow_aggregate_does_not_block_other_keys(dataset):
+    registry = AnalyzerRegistry(SlowAnalyzer)
+    analyzer = registry.get(dataset)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.aggregate(dataset, 'slow')))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    # Khi 'slow' đang tính, version và key khác vẫn trả lời ngay
+    answers = []
+    other = threading.Thread(target=lambda: answers.extend([
+        registry.version(dataset), registry.aggregate(dataset, 'fast')
+    ]))
+    other.start()
+    other.join(1)
+    finished = not other.is_alive()
+    analyzer.release.set()
+    other.join(5)
+    assert finished and answers[1] == 'fast'
+    for thread in threads:
+        thread.join(5)
+    assert results == ['slow'] * 3
+    assert analyzer.calls['slow'] == 1
+
+
+def test_failed_aggregate_is_not_cached(dataset):
+    registry = AnalyzerRegistry(SlowAnalyzer)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            registry.aggregate(dataset, 'fail')
+    assert registry.get(dataset).calls['fail'] == 2
@@ -0,0 +1,114 @@
+import base64
+import json
+import time
+
+import pytest
+
+import api
+
+
+@pytest.fixture
+def client():
+    return api.app.test_client()
+
+
+def _cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+@pytest.mark.parametrize('state', [[], {}, {'offset': 0}, {
+    'offset': '0', 'limit': 10, 'sort': 'duration', 'order': 'asc', 'version': 'x'
+}])
+def test_malformed_cursor_is_rejected(client, state):
+    response = client.get('/api/avg-session-duration', query_string={'cursor': _cursor(state)})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+
+def test_cursor_round_trip(client):
+    first = client.get('/api/avg-session-duration?limit=5').get_json()
+    following = client.get('/api/avg-session-duration', query_string={'cursor': first['next_cursor']})
+    assert following.status_code == 200
+    assert following.get_json()['offset'] == 5
+
+
+def test_etag_is_weak_and_shared_across_encodings(client):
+    gzipped = client.get('/api/avg-session-duration', headers={'Accept-Encoding': 'gzip'})
+    plain = client.get('/api/avg-session-duration', headers={'Accept-Encoding': 'identity'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in plain.headers
+    assert gzipped.headers['ETag'].startswith('W/"')
+    assert gzipped.headers['ETag'] == plain.headers['ETag']
+    assert gzipped.headers['Vary'] == 'Accept-Encoding'
+
+    revalidated = client.get('/api/avg-session-duration', headers={'If-None-Match': gzipped.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['Vary'] == 'Accept-Encoding'
+
+
+@pytest.mark.parametrize('route', [
+    '/api/funnel', '/api/transitions', '/api/next-pages?page=/home', '/api/entry-exit-pages'
+])
+@pytest.mark.parametrize('gap', ['bogus', '-5min'])
+def test_invalid_session_gap_is_rejected(client, route, gap):
+    separator = '&' if '?' in route else '?'
+    response = client.get(f"{route}{separator}session_gap={gap}")
+    assert response.status_code == 400
+    assert 'session_gap' in response.get_json()['error']
+
+
+def test_valid_session_gap(client):
+    assert client.get('/api/funnel?session_gap=30min').status_code == 200
+
+
+def test_negative_retention_periods_is_rejected(client):
+    response = client.get('/api/retention?periods=-1&normalize=1')
+    assert response.status_code == 400
+    assert client.get('/api/retention?periods=0&normalize=1').status_code == 200
+
+
+@pytest.mark.parametrize('route', ['/api/rollups', '/api/daily-visits'])
+def test_rollup_bounds_must_be_hour_aligned(client, route):
+    response = client.get(f'{route}?start=2025-03-28T10:30&granularity=hour')
+    assert response.status_code == 400
+    assert 'on the hour' in response.get_json()['error']
+    assert client.get(f'{route}?start=2025-03-28T10:00&end=2025-03-29').status_code == 200
+
+
+@pytest.fixture
+def server_tz(monkeypatch):
+    """Server clock pinned to UTC+7"""
+    monkeypatch.setenv('TZ', 'Asia/Ho_Chi_Minh')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize('route', ['/api/rollups', '/api/daily-visits'])
+@pytest.mark.parametrize('start, end', [
+    ('2025-03-28T03:00Z', '2025-03-29T03:00Z'),
+    ('2025-03-28T10:00%2B07:00', '2025-03-29T05:00%2B02:00'),
+])
+def test_timezone_aware_bounds_use_server_local_time(client, server_tz, route, start, end):
+    local = client.get(f'{route}?start=2025-03-28T10:00&end=2025-03-29T10:00&granularity=hour')
+    response = client.get(f'{route}?start={start}&end={end}&granularity=hour')
+    assert response.status_code == 200
+    assert response.get_json() == local.get_json()
+
+
+def test_timezone_aware_bound_inside_an_hour_is_rejected(client, server_tz):
+    # 10:00+05:30 là 11:30 giờ server
+    response = client.get('/api/rollups?start=2025-03-28T10:00%2B05:30')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('k', [-1, 0])
+def test_transitions_k_must_be_positive(client, k):
+    assert client.get(f'/api/transitions?k={k}').status_code == 400
+
+
+def test_transitions_k_is_capped(client, monkeypatch):
+    monkeypatch.setattr(api, 'MAX_TRANSITIONS', 2)
+    response = client.get('/api/transitions?k=1000000')
+    assert response.status_code == 200 and len(response.get_json()) == 2
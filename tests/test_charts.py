@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('matplotlib')
+
+from charts import ChartRenderer
+
+DAILY = pd.Series([3, 5, 4], index=['2025-04-01', '2025-04-02', '2025-04-03'])
+PAGES = pd.Series([7, 2], index=['/home', '/cart'])
+
+
+def test_cache_key_includes_the_data_source():
+    renderer = ChartRenderer()
+    version = (1, 100)
+    first = renderer.render({'top_pages': PAGES}, version=version, source='a.csv')
+    other = renderer.render({'top_pages': PAGES.iloc[:1]}, version=version, source='b.csv')
+    assert other['top_pages'] != first['top_pages']
+    assert renderer.render({'top_pages': None}, version=version, source='a.csv') == first
+    assert renderer.stats()['cached'] == 2
+
+
+def test_stacked_render_is_cached():
+    renderer = ChartRenderer()
+    image = renderer.render_stacked({'daily_visits': DAILY, 'top_pages': PAGES}, version=(1, 1), source='a.csv')
+    assert image.startswith(b'\x89PNG')
+    assert renderer.render_stacked({'daily_visits': None, 'top_pages': None}, version=(1, 1), source='a.csv') is image
+
+
+def test_pool_renders_in_spawned_workers():
+    renderer = ChartRenderer(workers=2)
+    try:
+        images = renderer.render({'daily_visits': DAILY, 'top_pages': PAGES})
+        assert renderer._pool._mp_context.get_start_method() == 'spawn'
+    finally:
+        renderer.shutdown()
+    assert all(image.startswith(b'\x89PNG') for image in images.values())
@@ -0,0 +1,20 @@
+import pandas as pd
+import pytest
+
+from cohorts import UserActivity
+
+
+def test_empty_retention_keeps_cohort_size_column():
+    for normalize in (False, True):
+        retention = UserActivity().retention(max_periods=3, normalize=normalize)
+        assert retention.empty and retention.columns.tolist() == [0]
+
+
+def test_negative_max_periods_is_rejected():
+    activity = UserActivity().update(pd.DataFrame({
+        'user_id': [1, 1], 'session_id': ['a', 'b'], 'event_duration': [5, 7],
+        'timestamp': pd.to_datetime(['2025-04-01 10:00', '2025-04-02 10:00']),
+    }))
+    assert activity.retention(max_periods=0).values.tolist() == [[1]]
+    with pytest.raises(ValueError):
+        activity.retention(max_periods=-1)
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import api
+from exports import write_excel
+
+
+@pytest.mark.parametrize('method', ['head', 'get'])
+def test_export_temp_file_is_removed_when_response_closes(method, monkeypatch):
+    created = []
+    mkstemp = api.tempfile.mkstemp
+
+    def recording_mkstemp(**kwargs):
+        fd, path = mkstemp(**kwargs)
+        # xlsxwriter cũng tạo file tạm riêng; chỉ ghi lại file export
+        if kwargs.get('suffix') == '.xlsx':
+            created.append(path)
+        return fd, path
+
+    monkeypatch.setattr(api.tempfile, 'mkstemp', recording_mkstemp)
+    client = api.app.test_client()
+    if method == 'head':
+        response = client.head('/api/export')
+    else:
+        # Client chỉ đọc một chunk rồi ngắt kết nối
+        response = client.get('/api/export', buffered=False)
+        next(response.response)
+    response.close()
+    assert response.status_code == 200
+    assert len(created) == 1 and not api.os.path.exists(created[0])
+
+
+def test_excel_export_accepts_nan_and_inf(tmp_path):
+    openpyxl = pytest.importorskip('openpyxl')
+    series = pd.Series([1.5, np.nan, np.inf], index=['a', 'b', 'c'])
+    path = write_excel({'Values': (series, ['key', 'value'])}, str(tmp_path / 'out.xlsx'))
+    rows = list(openpyxl.load_workbook(path).active.values)
+    assert rows[0] == ('key', 'value') and rows[1] == ('a', 1.5)
+    assert len(rows) == 4
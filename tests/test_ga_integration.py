@@ -0,0 +1,133 @@
+import threading
+from types import SimpleNamespace as NS
+
+import numpy as np
+from google.analytics.data_v1beta.types import MetricType
+
+from ga_integration import MAX_BATCH_SIZE, GoogleAnalyticsConnector, ReportCache
+
+
+def fake_response(dimensions, metrics, rows, row_count=None):
+    """RunReportResponse look-alike built from plain objects"""
+    return NS(
+        dimension_headers=[NS(name=name) for name in dimensions],
+        metric_headers=[NS(name=name, type_=type_) for name, type_ in metrics],
+        rows=[
+            NS(dimension_values=[NS(value=v) for v in dims], metric_values=[NS(value=v) for v in values])
+            for dims, values in rows
+        ],
+        row_count=len(rows) if row_count is None else row_count,
+    )
+
+
+def test_process_response_accepts_plain_objects_and_coerces_bad_metrics():
+    connector = GoogleAnalyticsConnector(property_id='1', client=object())
+    response = fake_response(
+        ['date', 'pagePath'],
+        [('activeUsers', MetricType.TYPE_INTEGER), ('eventCount', MetricType.TYPE_INTEGER)],
+        [(['20250401', '/a'], ['3', '10']), (['20250402', '/b'], ['4', ''])],
+    )
+    df = connector._process_response(response)
+    assert df['date'].dt.day.tolist() == [1, 2]
+    assert df['activeUsers'].dtype == np.int64 and df['activeUsers'].tolist() == [3, 4]
+    assert df['eventCount'].dtype == np.float64 and np.isnan(df['eventCount'].iloc[1])
+
+
+class FakeClient:
+    """
+    Offline stand-in for BetaAnalyticsDataClient: every report has `rows`
+    rows (dimension values 'd<i>', metric values i) and honours offset/limit
+    """
+
+    def __init__(self, rows=3):
+        self.rows = rows
+        self.batch_calls = []
+        self.page_calls = []
+        self._lock = threading.Lock()
+
+    def _page(self, request):
+        dimensions = [d.name for d in request.dimensions]
+        metrics = [(m.name, MetricType.TYPE_INTEGER) for m in request.metrics]
+        indices = range(request.offset, min(request.offset + request.limit, self.rows))
+        return fake_response(
+            dimensions, metrics,
+            [([f'd{i}'] * len(dimensions), [str(i)] * len(metrics)) for i in indices],
+            row_count=self.rows,
+        )
+
+    def batch_run_reports(self, request):
+        with self._lock:
+            self.batch_calls.append(len(request.requests))
+        return NS(reports=[self._page(r) for r in request.requests])
+
+    def run_report(self, request):
+        with self._lock:
+            self.page_calls.append(request.offset)
+        return self._page(request)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def spec(metric, start='2025-04-01', end='2025-04-07'):
+    return (['pagePath'], [metric], start, end)
+
+
+def test_missing_reports_are_batched_and_deduplicated():
+    client = FakeClient()
+    connector = GoogleAnalyticsConnector(property_id='1', client=client)
+    specs = [spec(f'metric{i}') for i in range(7)] + [spec('metric0')]
+    frames = connector.fetch_reports(specs)
+    assert sorted(client.batch_calls) == [2, MAX_BATCH_SIZE]
+    assert [frame.columns[-1] for frame in frames] == [f'metric{i}' for i in range(7)] + ['metric0']
+    assert frames[0]['metric0'].tolist() == [0, 1, 2]
+
+    # Lần gọi thứ hai lấy hoàn toàn từ cache và trả về bản sao
+    frames[0].loc[0, 'metric0'] = 99
+    again = connector.fetch_reports(specs)
+    assert len(client.batch_calls) == 2
+    assert again[0]['metric0'].tolist() == [0, 1, 2]
+
+
+def test_long_reports_are_paged():
+    client = FakeClient(rows=10)
+    connector = GoogleAnalyticsConnector(property_id='1', client=client, page_size=4)
+    (frame,) = connector.fetch_reports([spec('eventCount')])
+    assert frame['eventCount'].tolist() == list(range(10))
+    assert sorted(client.page_calls) == [4, 8]
+
+    pages = list(connector.iter_report_pages(['pagePath'], ['eventCount'], '2025-04-01', '2025-04-07', page_size=4))
+    assert [len(page) for page in pages] == [4, 4, 2]
+
+
+def test_recent_reports_expire_and_settled_reports_do_not():
+    client = FakeClient()
+    clock = FakeClock()
+    connector = GoogleAnalyticsConnector(
+        property_id='1', client=client, cache=ReportCache(max_entries=8, ttl=60, clock=clock)
+    )
+    recent, settled = spec('eventCount', '7daysAgo', 'today'), spec('eventCount')
+    connector.fetch_reports([recent, settled])
+    clock.now = 61
+    connector.fetch_reports([recent, settled])
+    # Chỉ report còn có thể thay đổi được lấy lại
+    assert client.batch_calls == [2, 1]
+
+
+def test_report_cache_evicts_least_recently_used():
+    clock = FakeClock()
+    cache = ReportCache(max_entries=2, ttl=60, clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    clock.now = 60
+    assert cache.get('a') is None
+    assert cache.stats() == {'entries': 1, 'hits': 3, 'misses': 2}
@@ -0,0 +1,90 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import api
+from analyzer_cache import registry
+from ga_store import GASnapshotStore
+
+TODAY = date(2025, 4, 10)
+
+
+class StubConnector:
+    """fetch_reports stand-in: one row per day, activeUsers = day of month"""
+
+    def __init__(self):
+        self.specs = []
+
+    def fetch_reports(self, specs):
+        self.specs.extend(specs)
+        frames = []
+        for _, metrics, start, end in specs:
+            days = pd.date_range(start, end)
+            frame = pd.DataFrame({'date': days})
+            for metric in metrics:
+                frame[metric] = days.day
+            frames.append(frame)
+        return frames
+
+
+@pytest.fixture
+def store(tmp_path):
+    return GASnapshotStore(str(tmp_path / 'ga'), StubConnector())
+
+
+def test_sync_fetches_only_missing_settled_days(store):
+    assert store.sync('2025-04-01', '2025-04-03', today=TODAY) == 3
+    assert store.missing_ranges('2025-03-30', '2025-04-10', today=TODAY) == [
+        (date(2025, 3, 30), date(2025, 3, 31)), (date(2025, 4, 4), date(2025, 4, 7)),
+    ]
+    totals = store.daily_totals('2025-04-02', '2025-04-05', today=TODAY)
+    assert totals.index.tolist() == ['2025-04-02', '2025-04-03', '2025-04-04', '2025-04-05']
+    assert totals['activeUsers'].tolist() == [2, 3, 4, 5]
+    # Ngày chưa chốt số liệu không được lưu
+    assert store.missing_ranges('2025-04-08', '2025-04-10', today=TODAY) == []
+    assert [spec[2:] for spec in store.connector.specs] == [
+        ('2025-04-01', '2025-04-03'), ('2025-04-04', '2025-04-05'),
+    ]
+
+
+def test_version_changes_with_parts_and_settled_day(store):
+    before = store.version(TODAY)
+    store.sync('2025-04-01', '2025-04-01', today=TODAY)
+    after = store.version(TODAY)
+    assert after != before
+    assert store.version(date(2025, 4, 11)) != after
+
+
+@pytest.fixture
+def ga_api(store, monkeypatch):
+    monkeypatch.setattr(api, 'ga_store', store)
+    options = registry._options
+    registry.configure(**{**options, 'ga_store': store})
+    loads = []
+    daily_totals = store.daily_totals
+    monkeypatch.setattr(store, 'daily_totals', lambda *a, **kw: loads.append(a) or daily_totals(*a, **kw))
+    yield store, loads
+    registry.configure(**options)
+
+
+def test_ga_view_short_circuits_before_sync(ga_api):
+    store, loads = ga_api
+    client = api.app.test_client()
+    url = '/api/ga-daily?start=2025-03-01&end=2025-03-03'
+    first = client.get(url)
+    assert first.status_code == 200
+    assert [row['activeUsers'] for row in first.get_json()] == [1, 2, 3]
+    assert len(loads) == 1
+
+    # Lần sync đầu đã thêm part nên manifest (và ETag) đổi một lần
+    second = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    third = client.get(url, headers={'If-None-Match': second.headers['ETag']})
+    assert third.status_code == 304
+    assert len(loads) == 2
+    assert len(store.connector.specs) == 1
+
+
+def test_ga_view_rejects_bad_dates(ga_api):
+    assert api.app.test_client().get('/api/ga-daily?start=garbage').status_code == 400
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import incremental
+from aggregates import aggregate_file
+from incremental import IncrementalAggregator
+
+HEADER = "user_id,session_id,page_url,timestamp,event_type,event_duration\n"
+
+
+def _row(i, page='/home'):
+    return f"{i},s{i % 3},{page},2025-04-01 10:{i % 60:02d}:00,view,{i}"
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental, 'STATE_DIR', str(tmp_path / 'state'))
+    # Coi file là ổn định ngay, không cần chờ
+    monkeypatch.setattr(incremental, 'STABLE_SECONDS', 0)
+
+
+def _assert_matches_full_read(partials, path):
+    full = aggregate_file(path, chunksize=1000)
+    pd.testing.assert_series_equal(partials.daily_visits(), full.daily_visits())
+    pd.testing.assert_series_equal(partials.top_pages(), full.top_pages())
+    pd.testing.assert_series_equal(partials.avg_session_duration(), full.avg_session_duration())
+    assert partials.rows == full.rows
+
+
+def test_last_line_without_newline_is_consumed(tmp_path):
+    path = tmp_path / 'events.csv'
+    path.write_text(HEADER + "\n".join(_row(i) for i in range(5)))
+    partials = IncrementalAggregator(str(path)).refresh()
+    _assert_matches_full_read(partials, str(path))
+
+    # Writer thêm '\n' rồi các dòng mới
+    with open(path, 'a') as f:
+        f.write("\n" + _row(5, '/cart') + "\n")
+    _assert_matches_full_read(IncrementalAggregator(str(path)).refresh(), str(path))
+
+
+def test_unterminated_line_extended_later_is_reread(tmp_path):
+    path = tmp_path / 'events.csv'
+    # Dòng cuối đang được ghi dở: duration mới có "1" trong "15"
+    path.write_text(HEADER + _row(0) + "\n" + _row(1))
+    IncrementalAggregator(str(path)).refresh()
+    with open(path, 'a') as f:
+        f.write("5\n" + _row(2) + "\n")
+    _assert_matches_full_read(IncrementalAggregator(str(path)).refresh(), str(path))
+
+
+def test_rewritten_head_rebuilds_state(tmp_path):
+    path = tmp_path / 'events.csv'
+    rows = [_row(i) for i in range(2000)]
+    path.write_text(HEADER + "\n".join(rows) + "\n")
+    IncrementalAggregator(str(path)).refresh()
+    rows[0] = _row(0, '/checkout')
+    path.write_text(HEADER + "\n".join(rows) + "\n" + _row(2000) + "\n")
+    _assert_matches_full_read(IncrementalAggregator(str(path)).refresh(), str(path))
+
+
+def test_state_is_pickle_free_and_outside_data_dir(tmp_path):
+    path = tmp_path / 'data' / 'events.csv'
+    path.parent.mkdir()
+    path.write_text(HEADER + "\n".join(_row(i) for i in range(10)) + "\n")
+    aggregator = IncrementalAggregator(str(path))
+    aggregator.refresh()
+    assert os.listdir(path.parent) == ['events.csv']
+    with np.load(aggregator.state_path, allow_pickle=False) as arrays:
+        assert 'meta' in arrays
+    # Lần refresh sau đọc lại từ state
+    _assert_matches_full_read(aggregator.refresh(), str(path))
@@ -0,0 +1,104 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+import api
+import instrumentation
+from instrumentation import MetricsRegistry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _sample(text, line_prefix):
+    """Value of the Prometheus sample starting with `line_prefix`, 0 when absent"""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_request_is_exported_in_prometheus_format():
+    client = api.app.test_client()
+    count = 'http_request_duration_seconds_count{route="/api/health"}'
+    total = 'http_requests_total{method="GET",route="/api/health",status="200"}'
+    before = client.get('/api/metrics').get_data(as_text=True)
+
+    assert client.get('/api/health').status_code == 200
+    response = client.get('/api/metrics')
+
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE http_requests_total counter' in text
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert _sample(text, total) == _sample(before, total) + 1
+    assert _sample(text, count) == _sample(before, count) + 1
+    assert _sample(text, 'http_request_duration_seconds_bucket{route="/api/health",le="+Inf"}') \
+        == _sample(text, count)
+
+
+def test_render_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    registry.describe('stage_duration_seconds', 'Wall time')
+    for seconds in (0.0005, 0.02, 0.02, 100):
+        registry.observe('stage_duration_seconds', (('stage', 'parse'),), seconds)
+    registry.inc('stage_rows_total', (('stage', 'parse'),), 42)
+
+    text = registry.render()
+    labels = '{stage="parse",le="%s"}'
+    assert '# HELP stage_duration_seconds Wall time' in text
+    assert _sample(text, 'stage_duration_seconds_bucket' + labels % '0.001') == 1
+    assert _sample(text, 'stage_duration_seconds_bucket' + labels % '0.05') == 3
+    assert _sample(text, 'stage_duration_seconds_bucket' + labels % '60.0') == 3
+    assert _sample(text, 'stage_duration_seconds_bucket' + labels % '+Inf') == 4
+    assert _sample(text, 'stage_duration_seconds_count{stage="parse"}') == 4
+    assert _sample(text, 'stage_rows_total{stage="parse"}') == 42
+
+
+def test_disabled_stages_are_no_ops(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'ENABLED', False)
+    registry = MetricsRegistry()
+    monkeypatch.setattr(instrumentation, 'metrics', registry)
+
+    def parse():
+        return [1, 2, 3]
+
+    assert instrumentation.instrumented('parse')(parse) is parse
+    with instrumentation.stage('parse') as s:
+        s.rows(10)
+        s.bytes(100)
+    assert s is instrumentation._NULL_STAGE
+    assert not re.search(r'^stage_', registry.render(), re.MULTILINE)
+
+
+def test_disabled_instrumentation_registers_nothing_and_never_profiles(tmp_path):
+    # ENABLED được đọc lúc import nên chạy api trong một process riêng
+    profile_dir = tmp_path / 'profiles'
+    script = (
+        "import json, api\n"
+        "client = api.app.test_client()\n"
+        "client.get('/api/top-pages')\n"
+        "client.get('/api/health')\n"
+        "print(json.dumps(client.get('/api/metrics').get_data(as_text=True)))\n"
+    )
+    env = dict(os.environ, INSTRUMENTATION='0', PROFILE_SLOW_REQUESTS_MS='0',
+               PROFILE_DIR=str(profile_dir), LIVE_LOG_PATH='', CHART_WORKERS='0',
+               PYTHONPATH=os.path.join(ROOT, 'src'))
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+
+    text = json.loads(result.stdout.strip().splitlines()[-1])
+    for prefix in ('http_', 'stage_', 'slow_request_profiles_total'):
+        assert not re.search(rf'^(# TYPE )?{prefix}', text, re.MULTILINE), prefix
+    assert not profile_dir.exists()
+
+
+@pytest.mark.parametrize('value, expected', [('a"b', 'a\\"b'), ('a\\b', 'a\\\\b'), ('a\nb', 'a\\nb')])
+def test_label_values_are_escaped(value, expected):
+    registry = MetricsRegistry()
+    registry.inc('http_requests_total', (('route', value),))
+    assert f'http_requests_total{{route="{expected}"}} 1' in registry.render()
@@ -0,0 +1,98 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import live
+from live import LiveAggregator, parse_events
+
+# 2025-04-01 03:00:00 UTC
+NOW = 1_743_476_400.0
+
+
+@pytest.fixture(params=['Asia/Ho_Chi_Minh', 'America/New_York', 'UTC'])
+def server_tz(request, monkeypatch):
+    """Run the test with the server's local timezone pinned"""
+    monkeypatch.setenv('TZ', request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _events(timestamps, page='/home', session='s1', duration=10):
+    return [
+        {'user_id': 1, 'session_id': session, 'page_url': page,
+         'timestamp': timestamp, 'event_type': 'view', 'event_duration': duration}
+        for timestamp in timestamps
+    ]
+
+
+def _local(offset_minutes=0):
+    """Naive server-local time, as written by the event log"""
+    return (datetime.fromtimestamp(NOW) + timedelta(minutes=offset_minutes)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def test_local_events_land_in_current_window(server_tz):
+    aggregator = LiveAggregator(clock=lambda: NOW)
+    events, errors = parse_events(_events([_local(0), _local(-3), _local(-30)]))
+    assert errors == []
+    assert aggregator.ingest(events) == 3
+    assert aggregator.summary('5m')['events'] == 2
+    assert aggregator.summary('1h')['events'] == 3
+
+
+def test_aware_timestamps_are_converted_to_server_time(server_tz):
+    aggregator = LiveAggregator(clock=lambda: NOW)
+    events, _ = parse_events(_events(['2025-04-01T03:00:00Z', '2025-04-01T09:58:00+07:00', _local(-1)]))
+    assert events['timestamp'].tolist() == [
+        datetime.fromtimestamp(NOW), datetime.fromtimestamp(NOW - 120), datetime.fromtimestamp(NOW - 60)
+    ]
+    assert aggregator.ingest(events) == 3
+    assert aggregator.summary('5m')['events'] == 3
+
+
+def test_future_events_beyond_skew_are_rejected():
+    aggregator = LiveAggregator(clock=lambda: NOW)
+    events, _ = parse_events(_events([_local(live.MAX_FUTURE_SKEW_MINUTES), _local(60 * 7)]))
+    assert aggregator.ingest(events) == 1
+    assert aggregator.stats()['total_events'] == 1
+    assert aggregator.summary('24h')['events'] == 1
+
+
+def test_window_reset_keeps_buckets_ahead_of_the_clock():
+    clock = [NOW]
+    aggregator = LiveAggregator(clock=lambda: clock[0])
+    aggregator.ingest(parse_events(_events([_local(0), _local(3)]))[0])
+    # Nhảy quá độ dài cửa sổ 5m: bucket +3 phút vẫn nằm trong cửa sổ mới
+    clock[0] = NOW + 6 * 60
+    assert aggregator.summary('5m')['events'] == 1
+    assert aggregator.summary('1h')['events'] == 2
+
+
+def test_backfill_batch_spanning_many_minutes():
+    aggregator = LiveAggregator(clock=lambda: NOW)
+    timestamps = [_local(-minute) for minute in range(120) for _ in range(3)]
+    pages = ['/a', '/b', '/c'] * 120
+    records = [dict(event, page_url=page) for event, page in zip(_events(timestamps), pages)]
+    assert aggregator.ingest(parse_events(records[::-1])[0]) == 360
+    summary = aggregator.summary('1h')
+    assert summary['events'] == 180
+    assert summary['top_pages'] == {'/a': 60, '/b': 60, '/c': 60}
+    assert aggregator.summary('24h')['events'] == 360
+
+
+def test_buffer_and_log_thread_are_created_on_first_ingest(tmp_path):
+    log_path = tmp_path / 'live.csv'
+    aggregator = LiveAggregator(capacity=10, log_path=str(log_path), clock=lambda: NOW)
+    assert aggregator.recent().empty
+    assert aggregator.stats()['buffered'] == 0
+    assert not any(thread.name == 'event-log' for thread in threading.enumerate())
+    assert not log_path.exists()
+
+    aggregator.ingest(parse_events(_events([_local(0)] * 15))[0])
+    assert aggregator.stats()['buffered'] == 10
+    assert aggregator.flush() == 15
+    assert log_path.read_text().count('\n') == 16
+    aggregator._log.close()
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import path_analysis
+
+
+def _events(pages):
+    return pd.DataFrame({
+        'user_id': 1,
+        'session_id': 's1',
+        'page_url': pages,
+        'timestamp': pd.date_range('2025-04-01 10:00', periods=len(pages), freq='min'),
+    })
+
+
+def test_missing_pages_are_not_mapped_to_another_page():
+    df = _events(['/home', np.nan, '/cart'])
+    transitions = path_analysis.transitions(df)
+    assert transitions[['from_page', 'to_page', 'count']].values.tolist() == [['/home', '/cart', 1]]
+    entries = path_analysis.entry_exit_pages(df)
+    assert entries.loc['/home', 'entries'] == 1 and entries.loc['/cart', 'exits'] == 1
+    assert path_analysis.next_page_probabilities(df, '/cart').empty
+
+
+def test_transitions_rejects_non_positive_k():
+    with pytest.raises(ValueError):
+        path_analysis.transitions(_events(['/home', '/cart']), k=0)
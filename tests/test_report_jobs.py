@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from report_jobs import ReportJobManager, ReportTimeout
+
+
+class BlockingRegistry:
+    """snapshot() waits until released, so a build stays in progress"""
+
+    def __init__(self):
+        self.released = threading.Event()
+
+    def version(self, path):
+        return (1, 100)
+
+    def snapshot(self, path):
+        self.released.wait(5)
+        raise RuntimeError("no data")
+
+
+def test_build_times_out_instead_of_returning_nothing():
+    registry = BlockingRegistry()
+    manager = ReportJobManager(registry)
+    try:
+        with pytest.raises(ReportTimeout) as e:
+            manager.build('events.csv', timeout=0.05)
+        assert manager.get(e.value.job.id) is e.value.job
+    finally:
+        registry.released.set()
+    e.value.job.done.wait(5)
+
+
+def test_cached_report_skips_the_pool():
+    registry = BlockingRegistry()
+    manager = ReportJobManager(registry)
+    manager._reports[manager._cache_key('events.csv', registry.version('events.csv'))] = b'%PDF'
+    # Worker đang bận: bản cache vẫn được trả ngay
+    manager.submit('other.csv')
+    try:
+        assert manager.build('events.csv', timeout=0.05) == b'%PDF'
+    finally:
+        registry.released.set()
+    # build không tạo job mới
+    assert len(manager._jobs) == 1
@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+
+from rollups import RollupCube
+
+EVENTS = pd.DataFrame({
+    'timestamp': pd.to_datetime(['2025-04-01 10:05', '2025-04-01 10:45', '2025-04-01 11:10']),
+    'page_url': ['/home', '/home', '/cart'],
+    'event_type': ['view', 'view', 'click'],
+    'event_duration': [10, 20, 30],
+})
+
+
+def test_hour_aligned_range():
+    cube = RollupCube.from_frame(EVENTS)
+    result = cube.query('2025-04-01 11:00', '2025-04-01 12:00', granularity='hour')
+    assert result['events'].tolist() == [1]
+    assert cube.query('2025-04-01', '2025-04-02')['events'].tolist() == [3]
+
+
+@pytest.mark.parametrize('bounds', [('2025-04-01 10:30', None), (None, '2025-04-01 10:30')])
+def test_bounds_inside_an_hour_are_rejected(bounds):
+    with pytest.raises(ValueError, match='on the hour'):
+        RollupCube.from_frame(EVENTS).query(*bounds)
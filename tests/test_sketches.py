@@ -0,0 +1,91 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sketches import HeavyHitters, HyperLogLog, QuantileSketch
+
+rng = np.random.default_rng(12)
+
+
+def halves(values):
+    middle = len(values) // 2
+    return values[:middle], values[middle:]
+
+
+@pytest.mark.parametrize('n', [100, 5_000, 200_000])
+def test_hll_estimate_within_error_bound(n):
+    values = rng.permutation(n * 3)[:n]
+    hll = HyperLogLog().add(np.concatenate([values, values[: n // 2]]))
+    # 3 độ lệch chuẩn
+    assert abs(hll.estimate() - n) <= 3 * hll.relative_error * n + 1
+
+
+def test_hll_merge_and_pickle():
+    values = np.array([f"s{i}" for i in range(20_000)], dtype=object)
+    left, right = halves(values)
+    merged = HyperLogLog().add(left).merge(HyperLogLog().add(right))
+    whole = HyperLogLog().add(values)
+    np.testing.assert_array_equal(merged.registers, whole.registers)
+    restored = pickle.loads(pickle.dumps(whole))
+    np.testing.assert_array_equal(restored.registers, whole.registers)
+    assert restored.estimate() == whole.estimate()
+
+
+def test_quantiles_within_relative_accuracy():
+    values = np.concatenate([rng.lognormal(4, 1.5, 50_000), np.zeros(500)])
+    sketch = QuantileSketch(relative_accuracy=0.01).add(values)
+    ordered = np.sort(values)
+    for q in (0.0, 0.01, 0.25, 0.5, 0.9, 0.99, 1.0):
+        # Sketch trả về phần tử có hạng q * (n - 1) (làm tròn xuống)
+        true = ordered[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(true, rel=0.01, abs=1e-3)
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_quantile_merge_and_pickle():
+    values = rng.exponential(300, 10_000)
+    left, right = halves(values)
+    merged = QuantileSketch().add(left).merge(QuantileSketch().add(right))
+    whole = QuantileSketch().add(values)
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    assert merged.zero_count == whole.zero_count
+    restored = pickle.loads(pickle.dumps(whole))
+    assert [restored.quantile(q) for q in (0.5, 0.99)] == [whole.quantile(q) for q in (0.5, 0.99)]
+
+
+def _pages(n):
+    # Phân bố Zipf trên 200 trang
+    ranks = np.minimum(rng.zipf(1.3, n), 200)
+    return pd.Series([f"/page-{rank}" for rank in ranks])
+
+
+def _check_heavy_hitters(sketch, pages):
+    true = pages.value_counts()
+    assert sketch.max_error <= len(pages) / (sketch.capacity + 1)
+    for page, count in sketch.counters.items():
+        assert count <= true[page] <= count + sketch.max_error
+    # Trang có số lần xuất hiện vượt max_error luôn được giữ lại
+    assert set(true[true > sketch.max_error].index) <= set(sketch.counters.index)
+
+
+def test_heavy_hitters_error_bound_and_merge():
+    pages = _pages(20_000)
+    _check_heavy_hitters(HeavyHitters(capacity=16).add(pages), pages)
+    left, right = halves(pages)
+    merged = HeavyHitters(capacity=16).add(left).merge(HeavyHitters(capacity=16).add(right))
+    _check_heavy_hitters(merged, pages)
+    assert merged.total == len(pages)
+
+
+def test_heavy_hitters_exact_below_capacity_and_pickle():
+    pages = _pages(5_000)
+    left, right = halves(pages)
+    merged = HeavyHitters(capacity=500).add(left).merge(HeavyHitters(capacity=500).add(right))
+    whole = HeavyHitters(capacity=500).add(pages)
+    assert merged.max_error == whole.max_error == 0
+    pd.testing.assert_series_equal(merged.top(10), whole.top(10), check_names=False)
+    pd.testing.assert_series_equal(whole.top(10), pages.value_counts().head(10), check_names=False)
+    restored = pickle.loads(pickle.dumps(whole))
+    pd.testing.assert_series_equal(restored.top(10), whole.top(10))
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_analysis import DataAnalyzer
+from storage import compact_frame, iter_events, read_events, resolve_paths, storage_format, write_events
+from utils.generate_mock_data import generate_mock_data, save_mock_data
+
+COLUMNAR = ['events.parquet', 'events.feather']
+
+
+@pytest.fixture(scope='module')
+def events():
+    df = generate_mock_data(num_users=30, num_records=2000, seed=11, end_time='2025-04-01')
+    # Giống dữ liệu đọc từ CSV: session_id là chuỗi thường
+    df['session_id'] = df['session_id'].astype(str)
+    return df
+
+
+def test_globs_and_directories_skip_non_event_files(tmp_path):
+    for name in ('a.csv', 'b.parquet', 'c.feather', 'a.csv.aggstate.npz', 'b.parquet.tmp1234', 'notes.txt'):
+        (tmp_path / name).write_text('')
+    expected = [str(tmp_path / name) for name in ('a.csv', 'b.parquet', 'c.feather')]
+    assert resolve_paths(str(tmp_path / '*')) == expected
+    assert resolve_paths(str(tmp_path)) == expected
+    with pytest.raises(FileNotFoundError):
+        resolve_paths(str(tmp_path / '*.txt'))
+
+
+def test_unknown_formats_are_rejected():
+    assert storage_format('events.CSV') == 'csv'
+    assert storage_format('events.pq') == 'parquet'
+    with pytest.raises(ValueError, match='Unsupported'):
+        storage_format('events.json')
+
+
+def test_compact_frame_schema_and_session_lookup(events):
+    df, session_lookup = compact_frame(events)
+
+    assert df['session_id'].dtype == 'int32'
+    for column in ('page_url', 'event_type'):
+        assert isinstance(df[column].dtype, pd.CategoricalDtype)
+    for column in ('user_id', 'event_duration'):
+        assert df[column].dtype.kind == 'i' and df[column].dtype.itemsize < 8
+    assert list(session_lookup[df['session_id'].to_numpy()]) == list(events['session_id'])
+    # Mã theo thứ tự sắp xếp của session_id gốc
+    assert session_lookup.is_monotonic_increasing and session_lookup.is_unique
+    assert session_lookup.name == 'session_id'
+    assert (df['event_duration'].to_numpy() == events['event_duration'].to_numpy()).all()
+
+
+def test_compact_frame_without_sessions(events):
+    df, session_lookup = compact_frame(events.drop(columns=['session_id']))
+    assert session_lookup is None
+    assert 'session_id' not in df.columns
+
+
+@pytest.mark.parametrize('name', COLUMNAR)
+def test_columnar_round_trip_with_column_subset(events, tmp_path, name):
+    path = write_events(events, str(tmp_path / name))
+
+    subset = read_events(path, columns=['session_id', 'page_url', 'event_duration'])
+    assert list(subset.columns) == ['session_id', 'page_url', 'event_duration']
+    assert isinstance(subset['session_id'].dtype, pd.CategoricalDtype)
+    assert isinstance(subset['page_url'].dtype, pd.CategoricalDtype)
+    assert subset['event_duration'].dtype.itemsize < 8
+    for column in subset.columns:
+        assert list(subset[column].astype(str)) == list(events[column].astype(str))
+
+    full = read_events(path)
+    assert list(full.columns) == list(events.columns)
+    assert (full['timestamp'].to_numpy() == events['timestamp'].to_numpy()).all()
+
+    chunks = list(iter_events(path, columns=['page_url', 'user_id'], chunksize=300))
+    assert len(chunks) == -(-len(events) // 300)
+    streamed = pd.concat(chunks, ignore_index=True)
+    assert set(streamed.columns) == {'page_url', 'user_id'}
+    assert list(streamed['page_url'].astype(str)) == list(events['page_url'].astype(str))
+    assert (streamed['user_id'].to_numpy() == events['user_id'].to_numpy()).all()
+
+
+@pytest.mark.parametrize('name', COLUMNAR)
+def test_columnar_analyzer_maps_session_codes_back(events, tmp_path, name):
+    expected = DataAnalyzer(save_mock_data(events, str(tmp_path / 'events.csv')), compact=False)
+    analyzer = DataAnalyzer(write_events(events, str(tmp_path / name)))
+
+    # Chỉ các cột cần thiết được đọc từ file cột
+    analyzer.get_top_pages()
+    assert set(analyzer._columns_cache) == {'page_url'}
+
+    durations = analyzer.get_avg_session_duration()
+    assert set(analyzer._columns_cache) == {'page_url', 'session_id', 'event_duration'}
+    assert analyzer._columns_cache['session_id'].dtype == 'int32'
+    assert list(durations.index) == sorted(events['session_id'].unique())
+    pd.testing.assert_series_equal(
+        expected.get_avg_session_duration(), durations, check_dtype=False, check_index_type=False
+    )
+
+    usage = analyzer.memory_usage()
+    assert set(usage) == {'page_url', 'session_id', 'event_duration', 'session_lookup', 'total'}
+    assert usage['total'] == sum(size for column, size in usage.items() if column != 'total')
+    assert usage['session_id'] == 4 * len(events)
+
+
+def test_compact_layout_uses_less_memory(events, tmp_path):
+    path = save_mock_data(events, str(tmp_path / 'events.csv'))
+    compact = DataAnalyzer(path)
+    plain = DataAnalyzer(path, compact=False)
+
+    assert plain.session_lookup is None and 'session_lookup' not in plain.memory_usage()
+    assert compact.memory_usage()['total'] < plain.memory_usage()['total']
+    assert np.array_equal(compact.session_lookup[compact.df['session_id'].to_numpy()],
+                          plain.df['session_id'].astype(str).to_numpy())